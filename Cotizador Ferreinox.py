@@ -2,6 +2,7 @@
 # Cotizador_Ferreinox.py (Script Principal MODIFICADO)
 import streamlit as st
 from utils import LOGO_FILE_PATH
+from recursos_imagen import imagen_escalada
 from pathlib import Path
 
 # --- CONFIGURACIÓN GLOBAL DE LA APLICACIÓN ---
@@ -17,11 +18,16 @@ TEKBOND2_PATH = Path("tekbond2.jpeg")
 TEKBOND3_PATH = Path("tekbond3.jpeg")
 TEKBOND4_PATH = Path("tekbond4.jpeg")
 
+# Ancho (px) al que se sirven las imágenes: el doble del que ocupan en pantalla, para
+# pantallas de alta densidad. Se escalan y comprimen una vez por proceso.
+ANCHO_LOGO_SIDEBAR_PX = 600
+ANCHO_PROMOCION_PX = 720
+
 
 # --- SIDEBAR GLOBAL ---
 with st.sidebar:
     if LOGO_FILE_PATH.exists():
-        st.image(str(LOGO_FILE_PATH), use_container_width=True)
+        st.image(imagen_escalada(LOGO_FILE_PATH, ANCHO_LOGO_SIDEBAR_PX), use_container_width=True)
     st.title("Navegación")
 
 
@@ -40,7 +46,7 @@ col1, col2 = st.columns(2)
 with col1:
     with st.container(border=True):
         if TEKBOND1_PATH.exists():
-            st.image(str(TEKBOND1_PATH), use_container_width=True)
+            st.image(imagen_escalada(TEKBOND1_PATH, ANCHO_PROMOCION_PX), use_container_width=True)
         else:
             st.warning(f"⚠️ No se encontró la imagen '{TEKBOND1_PATH.name}'.")
         
@@ -53,7 +59,7 @@ with col1:
 with col2:
     with st.container(border=True):
         if TEKBOND2_PATH.exists():
-            st.image(str(TEKBOND2_PATH), use_container_width=True)
+            st.image(imagen_escalada(TEKBOND2_PATH, ANCHO_PROMOCION_PX), use_container_width=True)
         else:
             st.warning(f"⚠️ No se encontró la imagen '{TEKBOND2_PATH.name}'.")
         
@@ -69,7 +75,7 @@ col3, col4 = st.columns(2)
 with col3:
     with st.container(border=True):
         if TEKBOND3_PATH.exists():
-            st.image(str(TEKBOND3_PATH), use_container_width=True)
+            st.image(imagen_escalada(TEKBOND3_PATH, ANCHO_PROMOCION_PX), use_container_width=True)
         else:
             st.warning(f"⚠️ No se encontró la imagen '{TEKBOND3_PATH.name}'.")
 
@@ -82,7 +88,7 @@ with col3:
 with col4:
     with st.container(border=True):
         if TEKBOND4_PATH.exists():
-            st.image(str(TEKBOND4_PATH), use_container_width=True)
+            st.image(imagen_escalada(TEKBOND4_PATH, ANCHO_PROMOCION_PX), use_container_width=True)
         else:
             st.warning(f"⚠️ No se encontró la imagen '{TEKBOND4_PATH.name}'.")
         
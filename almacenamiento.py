@@ -0,0 +1,630 @@
+# almacenamiento.py
+import numbers
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import gspread
+import numpy as np
+import pandas as pd
+from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+from gspread.utils import numericise_all, rowcol_to_a1
+
+from indice_propuestas import IndiceFilasPropuestas, SecuenciaPropuestas, consecutivo_de, filas_de_rango
+
+# --- Nombres de las hojas (y tablas) ---
+PROPUESTAS_SHEET_NAME = "Cotizaciones"
+DETALLE_PROPUESTAS_SHEET_NAME = "Cotizaciones_Items"
+PRODUCTOS_SHEET_NAME = "Productos"
+CLIENTES_SHEET_NAME = "Clientes"
+
+# Orden de las columnas de las filas que arman `_fila_propuesta` y `_filas_detalle` en utils.
+COLUMNAS_PROPUESTAS = [
+    "numero_propuesta", "fecha_creacion", "vendedor", "cliente_nombre", "cliente_nif",
+    "status", "subtotal", "descuento", "total_final", "costo_total", "margen_absoluto",
+    "margen_porcentual", "Observaciones", "tienda_despacho"
+]
+COLUMNAS_DETALLE = [
+    "numero_propuesta", "Referencia", "Producto", "Cantidad", "Precio_Unitario",
+    "Costo_Unitario", "Descuento_Porc", "Total_Item", "Stock", "Descuento_Valor"
+]
+COLUMNAS_CLIENTES = ["Nombre", "NIF", "E-Mail", "Teléfono", "Dirección"]
+COLUMNAS_PRODUCTOS = ["Referencia", "Descripción", "Categoria"]
+RUTA_SQLITE = Path(".cache") / "cotizador.sqlite"
+ALCANCES_GOOGLE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+# Rangos por llamada en la escritura diferencial de productos (la API acepta muchos más,
+# pero así cada petición se mantiene pequeña).
+RANGOS_POR_LLAMADA = 500
+# Valores por consulta `IN (...)` en SQLite (el límite de parámetros por defecto es 999).
+PARAMETROS_POR_CONSULTA = 900
+
+
+def celdas_modificadas(df_anterior, df_nuevo, columnas):
+    """
+    Compara dos versiones de la tabla de productos fila a fila y devuelve
+    {columna: [(posicion, valor_nuevo), ...]} con las celdas de `columnas` que cambiaron.
+    Un texto y un número con el mismo valor ('1250' y 1250) no cuentan como cambio.
+
+    Devuelve None si las filas no se corresponden (otra cantidad, otro orden de
+    referencias) o si alguna columna no existe en `df_anterior`: hay que reescribir todo.
+    """
+    if len(df_anterior) != len(df_nuevo) or any(c not in df_anterior.columns for c in columnas):
+        return None
+    if 'Referencia' in df_anterior.columns and 'Referencia' in df_nuevo.columns:
+        referencias_anteriores = df_anterior['Referencia'].astype(str).str.strip().to_numpy()
+        if not (referencias_anteriores == df_nuevo['Referencia'].astype(str).str.strip().to_numpy()).all():
+            return None
+    cambios = {}
+    for columna in columnas:
+        anterior = df_anterior[columna].reset_index(drop=True)
+        nuevo = df_nuevo[columna].reset_index(drop=True)
+        iguales = (pd.to_numeric(anterior, errors='coerce') == pd.to_numeric(nuevo, errors='coerce')) | (anterior.astype(str) == nuevo.astype(str))
+        posiciones = np.flatnonzero(~iguales.to_numpy())
+        if len(posiciones):
+            cambios[columna] = list(zip(posiciones.tolist(), nuevo.iloc[posiciones].tolist()))
+    return cambios
+
+
+def _corridas(celdas):
+    """Agrupa [(posicion, valor), ...] ordenadas en corridas de posiciones consecutivas."""
+    corridas = []
+    for posicion, valor in celdas:
+        if corridas and posicion == corridas[-1][-1][0] + 1:
+            corridas[-1].append((posicion, valor))
+        else:
+            corridas.append([(posicion, valor)])
+    return corridas
+
+
+def filas_modificadas(filas_anteriores, filas_nuevas):
+    """
+    Compara los items de una propuesta posición por posición y devuelve {posicion: fila}
+    con las filas de `filas_nuevas` que cambiaron o que no existían. Las posiciones desde
+    `len(filas_nuevas)` en adelante sobran.
+    """
+    return {
+        posicion: fila for posicion, fila in enumerate(filas_nuevas)
+        if posicion >= len(filas_anteriores) or list(filas_anteriores[posicion]) != list(fila)
+    }
+
+
+class Repositorio(ABC):
+    """
+    Interfaz de acceso a datos de la app. Las funciones de `utils` y `QuoteState` sólo
+    hablan con esta interfaz; el motor concreto (Google Sheets o SQLite) se elige por
+    configuración en `utils.conectar_almacenamiento`.
+
+    Las filas de propuesta y de detalle son listas en el orden de `COLUMNAS_PROPUESTAS`
+    y `COLUMNAS_DETALLE`.
+    """
+    @abstractmethod
+    def marca_cambios(self):
+        """Señal barata que cambia cuando cambian los datos (para `MonitorCambios`)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def leer_maestros(self):
+        """Devuelve (df_productos, df_clientes)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def leer_productos_texto(self):
+        """Productos con todos los valores como texto, para la sincronización de stock."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def escribir_productos(self, df_productos, df_anterior=None, columnas=()):
+        """
+        Guarda la tabla de productos. Con `df_anterior` (lo leído antes de calcular
+        `df_productos`) sólo se escriben las celdas de `columnas` que cambiaron; si las
+        tablas no son comparables se reescribe todo. Devuelve cuántas celdas se escribieron.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def listar_propuestas(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def listar_detalle(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def obtener_propuesta(self, numero):
+        """Devuelve (dict de la propuesta o None, DataFrame de sus items)."""
+        raise NotImplementedError
+
+    def obtener_propuestas(self, numeros):
+        """
+        Carga varias propuestas de una vez (p. ej. para exportarlas en lote). Devuelve
+        (DataFrame de propuestas, DataFrame de items) con sólo las de `numeros`. Por
+        omisión lee las dos hojas completas: para muchas propuestas es más barato que
+        ubicarlas una por una.
+        """
+        numeros = set(numeros)
+        propuestas, detalle = self.listar_propuestas(), self.listar_detalle()
+        if propuestas.empty:
+            return propuestas, detalle
+        propuestas = propuestas[propuestas['numero_propuesta'].isin(numeros)].reset_index(drop=True)
+        if not detalle.empty:
+            detalle = detalle[detalle['numero_propuesta'].isin(numeros)].reset_index(drop=True)
+        return propuestas, detalle
+
+    @abstractmethod
+    def propuestas_de_cliente(self, nombre_cliente):
+        raise NotImplementedError
+
+    @abstractmethod
+    def items_con_referencia(self, referencia):
+        raise NotImplementedError
+
+    @abstractmethod
+    def siguiente_consecutivo(self):
+        """Reserva atómicamente el siguiente consecutivo de propuesta."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def guardar_nueva_propuesta(self, fila_propuesta, filas_detalle):
+        raise NotImplementedError
+
+    @abstractmethod
+    def actualizar_propuesta(self, numero, fila_propuesta, filas_detalle=None, detalle_anterior=None):
+        """
+        Reemplaza la propuesta y sus items; con `filas_detalle=None` sólo la fila de la
+        propuesta (los items no cambiaron). Con `detalle_anterior` (los items tal como se
+        guardaron la última vez) sólo se escriben las filas que cambiaron, se añaden las
+        nuevas y se borran las que sobran; si lo guardado no tiene esa cantidad de filas se
+        reemplazan todas. Devuelve False si no existe.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def crear_cliente(self, cliente_dict):
+        raise NotImplementedError
+
+
+# --- IMPLEMENTACIÓN GOOGLE SHEETS ---
+def _valor_celda(valor):
+    """
+    Convierte un valor de Python o de NumPy al `CellData` que espera la API de Sheets.
+    None y NaN dejan la celda vacía.
+    """
+    if valor is None or (pd.api.types.is_scalar(valor) and pd.isna(valor)):
+        return {}
+    if isinstance(valor, (bool, np.bool_)):
+        return {'userEnteredValue': {'boolValue': bool(valor)}}
+    if isinstance(valor, numbers.Integral):
+        return {'userEnteredValue': {'numberValue': int(valor)}}
+    if isinstance(valor, numbers.Real):
+        return {'userEnteredValue': {'numberValue': float(valor)}}
+    return {'userEnteredValue': {'stringValue': str(valor)}}
+
+
+def _rangos_contiguos(filas):
+    """Agrupa números de fila en rangos contiguos (inicio, fin), ambos inclusivos."""
+    rangos = []
+    for fila in sorted(filas):
+        if rangos and fila == rangos[-1][1] + 1:
+            rangos[-1][1] = fila
+        else:
+            rangos.append([fila, fila])
+    return [tuple(rango) for rango in rangos]
+
+
+def _solicitudes_actualizacion_filas(sheet_id, filas, modificadas):
+    """Peticiones de `batch_update` que sobrescriben en su lugar las filas `modificadas` ({posicion: fila}) de `filas`."""
+    return [
+        {'updateCells': {
+            'start': {'sheetId': sheet_id, 'rowIndex': filas[posicion] - 1, 'columnIndex': 0},
+            'rows': [{'values': [_valor_celda(valor) for valor in fila]}],
+            'fields': 'userEnteredValue'
+        }}
+        for posicion, fila in sorted(modificadas.items()) if posicion < len(filas)
+    ]
+
+
+def _solicitudes_reemplazo_filas(sheet_id, filas_a_borrar, filas_nuevas):
+    """
+    Peticiones de `batch_update` que borran `filas_a_borrar` (agrupadas en rangos, de
+    abajo hacia arriba para que los índices no se desplacen) y añaden `filas_nuevas` al
+    final de la hoja.
+    """
+    solicitudes = [
+        {'deleteDimension': {'range': {
+            'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': inicio - 1, 'endIndex': fin
+        }}}
+        for inicio, fin in reversed(_rangos_contiguos(filas_a_borrar))
+    ]
+    if filas_nuevas:
+        solicitudes.append({'appendCells': {
+            'sheetId': sheet_id,
+            'rows': [{'values': [_valor_celda(valor) for valor in fila]} for fila in filas_nuevas],
+            'fields': 'userEnteredValue'
+        }})
+    return solicitudes
+
+
+def _registros(encabezado, filas):
+    """
+    Filas de una lectura por rango como dicts, con los valores como los deja
+    `get_all_records()`: texto formateado y convertido a número donde se pueda. La API
+    omite las celdas vacías al final.
+    """
+    return [
+        dict(zip(encabezado, numericise_all(list(fila) + [''] * (len(encabezado) - len(fila)))))
+        for fila in filas
+    ]
+
+
+class RepositorioGSheets(Repositorio):
+    """Repositorio sobre el libro de Google Sheets (gspread) y Drive."""
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.creds = getattr(workbook, 'creds', None)
+        self.indice = IndiceFilasPropuestas()
+        self.secuencia = SecuenciaPropuestas()
+        self._drive = None
+
+    def _hojas_propuestas(self):
+        return (self.workbook.worksheet(PROPUESTAS_SHEET_NAME),
+                self.workbook.worksheet(DETALLE_PROPUESTAS_SHEET_NAME))
+
+    def marca_cambios(self):
+        if self._drive is None:
+            self._drive = build('drive', 'v3', credentials=self.creds)
+        archivo = self._drive.files().get(
+            fileId=self.workbook.id, fields='modifiedTime', supportsAllDrives=True
+        ).execute()
+        return archivo['modifiedTime']
+
+    def leer_maestros(self):
+        df_productos = pd.DataFrame(self.workbook.worksheet(PRODUCTOS_SHEET_NAME).get_all_records())
+        df_clientes = pd.DataFrame(self.workbook.worksheet(CLIENTES_SHEET_NAME).get_all_records())
+        return df_productos, df_clientes
+
+    def leer_productos_texto(self):
+        productos_sheet = self.workbook.worksheet(PRODUCTOS_SHEET_NAME)
+        return pd.DataFrame(productos_sheet.get_all_records(numericise_ignore=['all']))
+
+    def escribir_productos(self, df_productos, df_anterior=None, columnas=()):
+        """
+        Escribe sólo las celdas que cambiaron, agrupadas en rangos de filas consecutivas de
+        cada columna y enviadas en pocas llamadas `batch_update`. La hoja nunca queda vacía
+        para los lectores, a diferencia de `clear()` + `set_with_dataframe`.
+        """
+        productos_sheet = self.workbook.worksheet(PRODUCTOS_SHEET_NAME)
+        cambios = None if df_anterior is None else celdas_modificadas(df_anterior, df_productos, columnas)
+        encabezado = productos_sheet.row_values(1) if cambios else []
+        if cambios and not self._referencias_coinciden(productos_sheet, encabezado, df_productos):
+            cambios = None
+        if cambios is None or any(columna not in encabezado for columna in cambios):
+            from gspread_dataframe import set_with_dataframe
+            productos_sheet.clear()
+            set_with_dataframe(productos_sheet, df_productos, include_index=False, resize=True, allow_formulas=False)
+            return df_productos.size
+
+        rangos = []
+        for columna, celdas in cambios.items():
+            numero_columna = encabezado.index(columna) + 1
+            for corrida in _corridas(celdas):
+                # La fila 1 es el encabezado: la posición 0 está en la fila 2.
+                inicio = rowcol_to_a1(corrida[0][0] + 2, numero_columna)
+                fin = rowcol_to_a1(corrida[-1][0] + 2, numero_columna)
+                rangos.append({'range': f'{inicio}:{fin}', 'values': [[valor] for _, valor in corrida]})
+        for i in range(0, len(rangos), RANGOS_POR_LLAMADA):
+            productos_sheet.batch_update(rangos[i:i + RANGOS_POR_LLAMADA], value_input_option='RAW')
+        return sum(len(celdas) for celdas in cambios.values())
+
+    @staticmethod
+    def _referencias_coinciden(productos_sheet, encabezado, df_productos):
+        """
+        Relee la columna Referencia justo antes de escribir: las posiciones de los cambios
+        vienen de la lectura anterior y, si entretanto se insertaron o borraron filas, las
+        celdas caerían en otros productos. Si no coinciden se reescribe la hoja completa.
+        """
+        if 'Referencia' not in encabezado or 'Referencia' not in df_productos.columns:
+            return False
+        en_hoja = productos_sheet.col_values(encabezado.index('Referencia') + 1)[1:]
+        return [str(referencia).strip() for referencia in en_hoja] == df_productos['Referencia'].astype(str).str.strip().tolist()
+
+    def listar_propuestas(self):
+        return pd.DataFrame(self.workbook.worksheet(PROPUESTAS_SHEET_NAME).get_all_records())
+
+    def listar_detalle(self):
+        return pd.DataFrame(self.workbook.worksheet(DETALLE_PROPUESTAS_SHEET_NAME).get_all_records())
+
+    def obtener_propuesta(self, numero):
+        """
+        Lee sólo la fila de la propuesta y el rango de sus items, ubicados con el índice de
+        filas, en lugar de descargar las dos hojas completas.
+        """
+        propuestas_sheet, detalle_sheet = self._hojas_propuestas()
+        with self.indice.bloqueo():
+            fila, filas_detalle = self.indice.ubicar(numero, propuestas_sheet, detalle_sheet)
+            if not fila:
+                return None, pd.DataFrame()
+            encabezado, valores = propuestas_sheet.batch_get(['1:1', f'{fila}:{fila}'], value_render_option='FORMATTED_VALUE')
+            propuesta = _registros(encabezado[0], valores)[0]
+            if not filas_detalle:
+                return propuesta, pd.DataFrame(columns=COLUMNAS_DETALLE)
+            encabezado, valores = detalle_sheet.batch_get(
+                ['1:1', f'{filas_detalle[0]}:{filas_detalle[-1]}'], value_render_option='FORMATTED_VALUE'
+            )
+        items = pd.DataFrame(_registros(encabezado[0], valores))
+        return propuesta, items[items['numero_propuesta'] == numero].reset_index(drop=True)
+
+    def propuestas_de_cliente(self, nombre_cliente):
+        propuestas = self.listar_propuestas()
+        return propuestas[propuestas['cliente_nombre'] == nombre_cliente]
+
+    def items_con_referencia(self, referencia):
+        detalle = self.listar_detalle()
+        return detalle[detalle['Referencia'].astype(str) == str(referencia)]
+
+    def siguiente_consecutivo(self):
+        propuestas_sheet, detalle_sheet = self._hojas_propuestas()
+        self.indice.asegurar(propuestas_sheet, detalle_sheet)
+        # Asignación atómica: guardados simultáneos nunca comparten número.
+        return self.secuencia.siguiente(minimo=self.indice.mayor_consecutivo)
+
+    def guardar_nueva_propuesta(self, fila_propuesta, filas_detalle):
+        propuestas_sheet, detalle_sheet = self._hojas_propuestas()
+        respuesta = propuestas_sheet.append_row(fila_propuesta, value_input_option='USER_ENTERED')
+        filas_nuevas = []
+        if filas_detalle:
+            respuesta_detalle = detalle_sheet.append_rows(filas_detalle, value_input_option='USER_ENTERED')
+            filas_nuevas = filas_de_rango(respuesta_detalle['updates']['updatedRange'])
+        self.indice.registrar_nueva(fila_propuesta[0], filas_de_rango(respuesta['updates']['updatedRange'])[0], filas_nuevas)
+
+    def actualizar_propuesta(self, numero, fila_propuesta, filas_detalle=None, detalle_anterior=None):
+        """
+        Actualiza la fila de la propuesta y sus items con un número constante de llamadas a
+        la API, sin importar cuántas líneas tenga ni cuántas propuestas existan: las filas
+        salen del índice de propuestas (validado con lecturas puntuales) y la escritura de
+        las filas que cambiaron, el borrado de las que sobran y el alta de las nuevas viajan
+        en un único `batch_update`.
+        """
+        propuestas_sheet, detalle_sheet = self._hojas_propuestas()
+        with self.indice.bloqueo():
+            fila, filas_actuales = self.indice.ubicar(numero, propuestas_sheet, detalle_sheet)
+            if not fila:
+                return False
+            propuestas_sheet.update(f'A{fila}:{chr(65 + len(fila_propuesta) - 1)}{fila}', [fila_propuesta], value_input_option='USER_ENTERED')
+            if filas_detalle is None:
+                return True
+            if detalle_anterior is not None and len(detalle_anterior) == len(filas_actuales):
+                modificadas = filas_modificadas(detalle_anterior, filas_detalle)
+                conservadas, filas_a_borrar = filas_actuales[:len(filas_detalle)], filas_actuales[len(filas_detalle):]
+                nuevas = [fila for posicion, fila in sorted(modificadas.items()) if posicion >= len(conservadas)]
+                solicitudes = _solicitudes_actualizacion_filas(detalle_sheet.id, conservadas, modificadas)
+            else:
+                conservadas, filas_a_borrar, nuevas, solicitudes = [], filas_actuales, filas_detalle, []
+            solicitudes += _solicitudes_reemplazo_filas(detalle_sheet.id, filas_a_borrar, nuevas)
+            if solicitudes:
+                self.workbook.batch_update({'requests': solicitudes})
+            self.indice.registrar_reemplazo(numero, filas_a_borrar, len(nuevas), conservadas)
+        return True
+
+    def crear_cliente(self, cliente_dict):
+        clientes_sheet = self.workbook.worksheet(CLIENTES_SHEET_NAME)
+        # Obtiene las cabeceras de la hoja para asegurar el orden correcto al insertar.
+        headers = clientes_sheet.row_values(1)
+        # Crea la lista de valores en el orden correcto. Si una columna no existe, la omite.
+        nueva_fila_cliente = [cliente_dict.get(h, "") for h in headers]
+        clientes_sheet.append_row(nueva_fila_cliente, value_input_option='USER_ENTERED')
+
+
+# --- CONEXIÓN SEGÚN CONFIGURACIÓN ---
+def conectar_workbook(cuenta_servicio, spreadsheet_key):
+    """Abre el libro de Google Sheets con una cuenta de servicio; guarda las credenciales en `workbook.creds`."""
+    creds = Credentials.from_service_account_info(cuenta_servicio, scopes=ALCANCES_GOOGLE)
+    workbook = gspread.authorize(creds).open_by_key(spreadsheet_key)
+    workbook.creds = creds
+    return workbook
+
+
+def crear_repositorio(secretos):
+    """
+    Crea el repositorio a partir de un dict con la forma de `secrets.toml` (secciones
+    `almacenamiento`, `gcp_service_account` y `gsheets`). No usa `st`.
+    """
+    configuracion = secretos.get("almacenamiento", {})
+    if configuracion.get("motor", "gsheets") == "sqlite":
+        return RepositorioSQLite(configuracion.get("ruta", RUTA_SQLITE))
+    return RepositorioGSheets(conectar_workbook(secretos["gcp_service_account"], secretos["gsheets"]["spreadsheet_key"]))
+
+
+# --- IMPLEMENTACIÓN SQLITE ---
+def _identificador(nombre):
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+class RepositorioSQLite(Repositorio):
+    """
+    Repositorio local en un archivo SQLite, para trabajar sin red o con volúmenes que
+    superan lo que aguanta Google Sheets. Las columnas se crean sin tipo (SQLite guarda
+    el tipo de cada valor, igual que una hoja) y hay índices por número de propuesta,
+    cliente y referencia, así que esas consultas toman milisegundos.
+    """
+    def __init__(self, ruta=RUTA_SQLITE):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._crear_esquema()
+
+    def _conexion(self):
+        # sqlite3 no comparte conexiones entre hilos; cada hilo (sesión) usa la suya.
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            self._local.conexion = conexion
+        return conexion
+
+    def _crear_tabla(self, conexion, tabla, columnas):
+        definicion = ", ".join(_identificador(c) for c in columnas)
+        conexion.execute(f"CREATE TABLE IF NOT EXISTS {tabla} ({definicion})")
+
+    def _crear_esquema(self):
+        conexion = self._conexion()
+        with conexion:
+            self._crear_tabla(conexion, "cotizaciones", COLUMNAS_PROPUESTAS)
+            self._crear_tabla(conexion, "cotizaciones_items", COLUMNAS_DETALLE)
+            self._crear_tabla(conexion, "productos", COLUMNAS_PRODUCTOS)
+            self._crear_tabla(conexion, "clientes", COLUMNAS_CLIENTES)
+            conexion.execute("CREATE TABLE IF NOT EXISTS secuencias (nombre TEXT PRIMARY KEY, valor INTEGER)")
+            self._crear_indices(conexion)
+
+    def _crear_indices(self, conexion):
+        conexion.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cotizaciones_numero ON cotizaciones (numero_propuesta)")
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_cotizaciones_cliente ON cotizaciones (cliente_nombre)")
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_items_numero ON cotizaciones_items (numero_propuesta)")
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_items_referencia ON cotizaciones_items (Referencia)")
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_productos_referencia ON productos (Referencia)")
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes (Nombre)")
+
+    def _consultar(self, sql, parametros=()):
+        return pd.read_sql_query(sql, self._conexion(), params=parametros)
+
+    def _reemplazar_tabla(self, conexion, tabla, df):
+        conexion.execute(f"DROP TABLE IF EXISTS {tabla}")
+        self._crear_tabla(conexion, tabla, df.columns)
+        marcadores = ", ".join("?" for _ in df.columns)
+        conexion.executemany(f"INSERT INTO {tabla} VALUES ({marcadores})", df.itertuples(index=False, name=None))
+
+    def importar(self, df_productos=None, df_clientes=None, df_propuestas=None, df_detalle=None):
+        """Reemplaza las tablas dadas con DataFrames (p. ej. exportados de Google Sheets)."""
+        conexion = self._conexion()
+        with conexion:
+            for tabla, df in (("productos", df_productos), ("clientes", df_clientes),
+                              ("cotizaciones", df_propuestas), ("cotizaciones_items", df_detalle)):
+                if df is not None:
+                    self._reemplazar_tabla(conexion, tabla, df)
+            self._crear_indices(conexion)
+
+    def marca_cambios(self):
+        return str(os.stat(self.ruta).st_mtime_ns)
+
+    def leer_maestros(self):
+        return self._consultar("SELECT * FROM productos"), self._consultar("SELECT * FROM clientes")
+
+    def leer_productos_texto(self):
+        return self._consultar("SELECT * FROM productos ORDER BY rowid").astype(str)
+
+    def escribir_productos(self, df_productos, df_anterior=None, columnas=()):
+        conexion = self._conexion()
+        cambios = None if df_anterior is None else celdas_modificadas(df_anterior, df_productos, columnas)
+        if cambios == {}:
+            return 0
+        rowids = [rowid for (rowid,) in conexion.execute("SELECT rowid FROM productos ORDER BY rowid")] if cambios else []
+        if cambios is None or len(rowids) != len(df_productos):
+            with conexion:
+                self._reemplazar_tabla(conexion, "productos", df_productos)
+                conexion.execute("CREATE INDEX IF NOT EXISTS idx_productos_referencia ON productos (Referencia)")
+            return df_productos.size
+        with conexion:
+            for columna, celdas in cambios.items():
+                conexion.executemany(
+                    f"UPDATE productos SET {_identificador(columna)} = ? WHERE rowid = ?",
+                    [(valor, rowids[posicion]) for posicion, valor in celdas]
+                )
+        return sum(len(celdas) for celdas in cambios.values())
+
+    def listar_propuestas(self):
+        return self._consultar("SELECT * FROM cotizaciones ORDER BY rowid")
+
+    def listar_detalle(self):
+        return self._consultar("SELECT * FROM cotizaciones_items ORDER BY rowid")
+
+    def obtener_propuesta(self, numero):
+        propuesta = self._consultar("SELECT * FROM cotizaciones WHERE numero_propuesta = ?", (numero,))
+        if propuesta.empty:
+            return None, pd.DataFrame()
+        items = self._consultar("SELECT * FROM cotizaciones_items WHERE numero_propuesta = ? ORDER BY rowid", (numero,))
+        return propuesta.iloc[0].to_dict(), items
+
+    def obtener_propuestas(self, numeros):
+        numeros = list(dict.fromkeys(numeros))
+        propuestas, detalle = [], []
+        # SQLite limita la cantidad de parámetros por consulta.
+        for inicio in range(0, len(numeros), PARAMETROS_POR_CONSULTA):
+            lote = numeros[inicio:inicio + PARAMETROS_POR_CONSULTA]
+            marcadores = ", ".join("?" for _ in lote)
+            propuestas.append(self._consultar(f"SELECT * FROM cotizaciones WHERE numero_propuesta IN ({marcadores}) ORDER BY rowid", lote))
+            detalle.append(self._consultar(f"SELECT * FROM cotizaciones_items WHERE numero_propuesta IN ({marcadores}) ORDER BY rowid", lote))
+        if not propuestas:
+            return pd.DataFrame(columns=COLUMNAS_PROPUESTAS), pd.DataFrame(columns=COLUMNAS_DETALLE)
+        return pd.concat(propuestas, ignore_index=True), pd.concat(detalle, ignore_index=True)
+
+    def propuestas_de_cliente(self, nombre_cliente):
+        return self._consultar("SELECT * FROM cotizaciones WHERE cliente_nombre = ? ORDER BY rowid", (nombre_cliente,))
+
+    def items_con_referencia(self, referencia):
+        return self._consultar("SELECT * FROM cotizaciones_items WHERE Referencia = ? ORDER BY rowid", (referencia,))
+
+    def siguiente_consecutivo(self):
+        conexion = self._conexion()
+        # BEGIN IMMEDIATE toma el bloqueo de escritura: la lectura y el incremento son atómicos
+        # también entre procesos.
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conexion.execute("SELECT valor FROM secuencias WHERE nombre = 'propuestas'").fetchone()
+            if fila:
+                actual = fila[0]
+            else:
+                numeros = conexion.execute("SELECT numero_propuesta FROM cotizaciones").fetchall()
+                actual = max((consecutivo_de(numero) for (numero,) in numeros), default=0)
+            conexion.execute("INSERT OR REPLACE INTO secuencias VALUES ('propuestas', ?)", (actual + 1,))
+            conexion.commit()
+            return actual + 1
+        except Exception:
+            conexion.rollback()
+            raise
+
+    def guardar_nueva_propuesta(self, fila_propuesta, filas_detalle):
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute(f"INSERT INTO cotizaciones VALUES ({', '.join('?' for _ in fila_propuesta)})", fila_propuesta)
+            if filas_detalle:
+                conexion.executemany(f"INSERT INTO cotizaciones_items VALUES ({', '.join('?' for _ in filas_detalle[0])})", filas_detalle)
+
+    def actualizar_propuesta(self, numero, fila_propuesta, filas_detalle=None, detalle_anterior=None):
+        conexion = self._conexion()
+        with conexion:
+            columnas = ", ".join(f"{_identificador(c)} = ?" for c in COLUMNAS_PROPUESTAS[:len(fila_propuesta)])
+            cursor = conexion.execute(f"UPDATE cotizaciones SET {columnas} WHERE numero_propuesta = ?", [*fila_propuesta, numero])
+            if cursor.rowcount == 0:
+                return False
+            if filas_detalle is None:
+                return True
+            rowids = [rowid for (rowid,) in conexion.execute(
+                "SELECT rowid FROM cotizaciones_items WHERE numero_propuesta = ? ORDER BY rowid", (numero,)
+            )] if detalle_anterior is not None else []
+            if detalle_anterior is not None and len(detalle_anterior) == len(rowids):
+                modificadas = filas_modificadas(detalle_anterior, filas_detalle)
+                cambiadas = [(fila, rowids[posicion]) for posicion, fila in sorted(modificadas.items()) if posicion < len(rowids)]
+                if cambiadas:
+                    columnas = ", ".join(f"{_identificador(c)} = ?" for c in COLUMNAS_DETALLE[:len(cambiadas[0][0])])
+                    conexion.executemany(f"UPDATE cotizaciones_items SET {columnas} WHERE rowid = ?", [[*fila, rowid] for fila, rowid in cambiadas])
+                conexion.executemany("DELETE FROM cotizaciones_items WHERE rowid = ?", [(rowid,) for rowid in rowids[len(filas_detalle):]])
+                nuevas = [fila for posicion, fila in sorted(modificadas.items()) if posicion >= len(rowids)]
+            else:
+                conexion.execute("DELETE FROM cotizaciones_items WHERE numero_propuesta = ?", (numero,))
+                nuevas = filas_detalle
+            if nuevas:
+                conexion.executemany(f"INSERT INTO cotizaciones_items VALUES ({', '.join('?' for _ in nuevas[0])})", nuevas)
+        return True
+
+    def crear_cliente(self, cliente_dict):
+        conexion = self._conexion()
+        columnas = [fila[1] for fila in conexion.execute("PRAGMA table_info(clientes)")]
+        with conexion:
+            conexion.execute(
+                f"INSERT INTO clientes VALUES ({', '.join('?' for _ in columnas)})",
+                [cliente_dict.get(c, "") for c in columnas]
+            )
@@ -0,0 +1,81 @@
+# autoguardado.py
+import atexit
+import threading
+import time
+
+# Tiempo mínimo entre dos escrituras del almacén (segundos): las ediciones que llegan
+# mientras tanto se juntan en una sola.
+INTERVALO_AUTOGUARDADO = 5.0
+
+
+class AutoguardadoBorradores:
+    """
+    Guarda en segundo plano los borradores de las cotizaciones en un `AlmacenSesiones`.
+
+    `marcar(id_sesion, state)` sólo anota que la sesión cambió (no serializa ni escribe),
+    así que puede llamarse tras cada edición o en cada ejecución de la página. Un hilo
+    escribe como máximo una vez cada `intervalo` segundos lo último marcado de cada
+    sesión, y no escribe si los bytes son iguales a los ya guardados: una ráfaga de
+    ediciones termina en una sola escritura. `vaciar()` escribe lo pendiente en el acto
+    (antes de guardar en la nube y al cerrar el proceso).
+
+    La serialización ocurre en el hilo de fondo mientras la sesión puede seguir editando;
+    si lee una edición a medias, la misma edición vuelve a marcar la sesión al terminar y
+    la escritura siguiente la corrige.
+    """
+    def __init__(self, almacen, intervalo=INTERVALO_AUTOGUARDADO):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pendientes = {}
+        self._guardados = {}
+        self._despertar = threading.Event()
+        self._hilo = None
+        self.marcas = 0
+        self.escrituras = 0
+        atexit.register(self.vaciar)
+
+    def marcar(self, id_sesion, state):
+        with self._lock:
+            self._pendientes[id_sesion] = state
+            self.marcas += 1
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name="autoguardado-borradores", daemon=True)
+                self._hilo.start()
+        self._despertar.set()
+
+    def pendiente(self, id_sesion):
+        with self._lock:
+            return id_sesion in self._pendientes
+
+    def _ciclo(self):
+        while True:
+            self._despertar.wait()
+            time.sleep(self.intervalo)
+            self._despertar.clear()
+            self.vaciar()
+
+    def vaciar(self, id_sesion=None):
+        """Escribe ya lo pendiente de `id_sesion` (o de todas las sesiones). Devuelve cuántas escribió."""
+        with self._lock:
+            if id_sesion is None:
+                pendientes, self._pendientes = self._pendientes, {}
+            else:
+                pendientes = {id_sesion: self._pendientes.pop(id_sesion)} if id_sesion in self._pendientes else {}
+        escritas = 0
+        for id_pendiente, state in pendientes.items():
+            try:
+                datos = state.serializar()
+                if self._guardados.get(id_pendiente) == datos:
+                    continue
+                self.almacen.guardar(id_pendiente, datos)
+            except Exception:
+                # Se reintenta en la próxima pasada, salvo que entretanto se haya marcado algo más nuevo.
+                with self._lock:
+                    self._pendientes.setdefault(id_pendiente, state)
+                continue
+            with self._lock:
+                self._guardados[id_pendiente] = datos
+                self.escrituras += 1
+            escritas += 1
+        return escritas
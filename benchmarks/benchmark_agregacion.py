@@ -0,0 +1,105 @@
+# benchmarks/benchmark_agregacion.py
+"""
+Micro-benchmark de la etapa de agregación y combinación con el maestro, sobre un export
+ya parseado en memoria (sin E/S): la versión original (`groupby` de costo, `map` +
+`dropna` + `pivot_table` de stock por tienda y dos `merge`) contra la agregación fusionada
+de `AgregadoInventario` (un `bincount` por bloque) y un único join indexado.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.benchmark_agregacion
+    python -m benchmarks.benchmark_agregacion --lineas 1000000 10000000 --referencias 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from inventario import ALMACEN_NOMBRE_MAPPING, TAMANO_BLOQUE, AgregadoInventario, combinar_con_maestro
+
+ALMACENES = list(ALMACEN_NOMBRE_MAPPING) + ['900', '901']
+
+
+def export_parseado(lineas, referencias, semilla=7):
+    rng = np.random.default_rng(semilla)
+    nombres = np.array([f"REF{i}" for i in range(1, referencias + 1)], dtype=object)
+    return pd.DataFrame({
+        'REFERENCIA': nombres[rng.integers(0, referencias, lineas)],
+        'STOCK': rng.integers(-2, 300, lineas),
+        'COSTO_PROMEDIO_UND': rng.uniform(100, 90000, lineas).round(2),
+        'CODALMACEN': pd.Categorical(np.array(ALMACENES, dtype=object)[rng.integers(0, len(ALMACENES), lineas)]),
+    })
+
+
+def maestro(referencias):
+    return pd.DataFrame({
+        'Referencia': [f"REF{i}" for i in range(1, referencias + 1)],
+        'Descripción': "PRODUCTO",
+        'Costo': "0",
+        **{columna: "0" for columna in ALMACEN_NOMBRE_MAPPING.values()},
+    })
+
+
+def agregacion_original(df_crudo, df_productos_maestro):
+    """Pasos originales de `run_stock_and_price_update`, desde el CSV ya leído."""
+    df_crudo = df_crudo.copy()
+    df_crudo['VALOR_TOTAL_SKU'] = df_crudo['STOCK'] * df_crudo['COSTO_PROMEDIO_UND']
+    df_costo_agregado = df_crudo.groupby('REFERENCIA').agg(
+        Stock_Total=('STOCK', 'sum'),
+        Valor_Total_Inventario=('VALOR_TOTAL_SKU', 'sum')
+    ).reset_index()
+    df_costo_agregado['Costo'] = df_costo_agregado['Valor_Total_Inventario'] / df_costo_agregado['Stock_Total']
+    df_costo_agregado['Costo'] = df_costo_agregado['Costo'].replace([np.inf, -np.inf], np.nan).fillna(0).astype(int)
+    df_costo_agregado = df_costo_agregado.rename(columns={'REFERENCIA': 'Referencia'})
+
+    df_crudo['NOMBRE_TIENDA'] = df_crudo['CODALMACEN'].astype(str).map(ALMACEN_NOMBRE_MAPPING)
+    df_crudo_mapeado = df_crudo.dropna(subset=['NOMBRE_TIENDA'])
+    df_stock_por_tienda = df_crudo_mapeado.pivot_table(
+        index='REFERENCIA', columns='NOMBRE_TIENDA', values='STOCK', aggfunc='sum', fill_value=0
+    ).reset_index().rename(columns={'REFERENCIA': 'Referencia'})
+
+    columnas_stock = list(ALMACEN_NOMBRE_MAPPING.values())
+    df_maestro_base = df_productos_maestro.drop(columns=['Costo'] + columnas_stock, errors='ignore')
+    df_actualizado = pd.merge(df_maestro_base, df_costo_agregado[['Referencia', 'Costo']], on='Referencia', how='left')
+    df_actualizado = pd.merge(df_actualizado, df_stock_por_tienda, on='Referencia', how='left')
+    existentes = [col for col in columnas_stock if col in df_actualizado.columns]
+    df_actualizado[existentes] = df_actualizado[existentes].fillna(0).astype(int)
+    df_actualizado['Costo'] = df_actualizado['Costo'].fillna(0).astype(int)
+    return df_actualizado
+
+
+def agregacion_fusionada(df_crudo, df_productos_maestro):
+    agregado = AgregadoInventario()
+    for inicio in range(0, len(df_crudo), TAMANO_BLOQUE):
+        agregado.agregar(df_crudo.iloc[inicio:inicio + TAMANO_BLOQUE])
+    return combinar_con_maestro(df_productos_maestro, agregado)
+
+
+def medir(funcion, *argumentos, repeticiones=3):
+    mejor, resultado = float('inf'), None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*argumentos)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineas", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--referencias", type=int, default=50_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    df_maestro = maestro(args.referencias)
+    print(f"{'líneas':>10} {'original (s)':>13} {'fusionada (s)':>14} {'aceleración':>12}")
+    for lineas in args.lineas:
+        df_crudo = export_parseado(lineas, args.referencias)
+        t_original, r_original = medir(agregacion_original, df_crudo, df_maestro, repeticiones=args.repeticiones)
+        t_fusionada, r_fusionada = medir(agregacion_fusionada, df_crudo, df_maestro, repeticiones=args.repeticiones)
+        assert (r_original['Costo'].to_numpy() == r_fusionada['Costo'].to_numpy()).all()
+        print(f"{lineas:>10} {t_original:>13.3f} {t_fusionada:>14.3f} {t_original / t_fusionada:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/benchmark_almacenamiento.py
+"""
+Mide las consultas del repositorio SQLite (sin red) sobre propuestas sintéticas:
+búsqueda por número de propuesta, por cliente y por referencia, y guardado.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.benchmark_almacenamiento
+    python -m benchmarks.benchmark_almacenamiento --propuestas 1000 100000
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from almacenamiento import COLUMNAS_DETALLE, COLUMNAS_PROPUESTAS, RepositorioSQLite
+
+CLIENTES = [f"CLIENTE {i}" for i in range(500)]
+
+
+def propuestas_sinteticas(cantidad, items_por_propuesta=8, semilla=7):
+    rng = random.Random(semilla)
+    propuestas, detalle = [], []
+    for i in range(1, cantidad + 1):
+        numero = f"PROP-2025-{i:04d}"
+        propuestas.append([numero, "2025-01-01 00:00:00", "Vendedor", rng.choice(CLIENTES), "900",
+                           "Borrador", 100.0, 0.0, 119.0, 50.0, 50.0, 50.0, "", "CEDI"])
+        for _ in range(items_por_propuesta):
+            detalle.append([numero, f"REF{rng.randint(1, 5000)}", "Producto", 1, 10.0, 5.0, 0.0, 10.0, 3, 0.0])
+    return pd.DataFrame(propuestas, columns=COLUMNAS_PROPUESTAS), pd.DataFrame(detalle, columns=COLUMNAS_DETALLE)
+
+
+def medir(funcion, argumentos):
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        funcion(argumento)
+    return (time.perf_counter() - inicio) / len(argumentos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--propuestas", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    print(f"{'propuestas':>10} {'por número (ms)':>16} {'por cliente (ms)':>17} {'por referencia (ms)':>20} {'guardar (ms)':>13}")
+    for cantidad in args.propuestas:
+        with tempfile.TemporaryDirectory() as directorio:
+            repositorio = RepositorioSQLite(Path(directorio) / "cotizador.sqlite")
+            df_propuestas, df_detalle = propuestas_sinteticas(cantidad)
+            repositorio.importar(df_propuestas=df_propuestas, df_detalle=df_detalle)
+
+            numeros = [f"PROP-2025-{rng.randint(1, cantidad):04d}" for _ in range(args.consultas)]
+            t_numero = medir(repositorio.obtener_propuesta, numeros)
+            t_cliente = medir(repositorio.propuestas_de_cliente, [rng.choice(CLIENTES) for _ in range(args.consultas)])
+            t_referencia = medir(repositorio.items_con_referencia, [f"REF{rng.randint(1, 5000)}" for _ in range(args.consultas)])
+
+            fila, filas = df_propuestas.iloc[0].tolist(), df_detalle.iloc[:8].values.tolist()
+            t_guardar = medir(
+                lambda numero: repositorio.actualizar_propuesta(numero, [numero] + fila[1:], [[numero] + f[1:] for f in filas]),
+                numeros[:50]
+            )
+            print(f"{cantidad:>10} {t_numero:>16.2f} {t_cliente:>17.2f} {t_referencia:>20.2f} {t_guardar:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
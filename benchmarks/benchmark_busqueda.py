@@ -0,0 +1,89 @@
+# benchmarks/benchmark_busqueda.py
+"""
+Compara los motores de búsqueda de productos sobre catálogos sintéticos.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.benchmark_busqueda
+    python -m benchmarks.benchmark_busqueda --tamanos 10000 100000 --sin-apply
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from utils import (
+    NOMBRE_PRODUCTO_COL, VERSION_CATALOGO_ATTR, _buscar_productos_vectorizado,
+    buscar_productos_inteligentemente, construir_texto_busqueda, recursos_catalogo,
+)
+
+PALABRAS = [
+    "viniltex", "pintura", "blanco", "negro", "galon", "cuñete", "esmalte", "domestico",
+    "brocha", "rodillo", "tekbond", "silicona", "adhesivo", "anticorrosivo", "gris", "rojo",
+    "koraza", "aerosol", "lija", "thinner", "1/4", "mate", "brillante", "satinado",
+]
+CATEGORIAS = ["Pinturas", "Herramientas", "Adhesivos", "Accesorios", "Solventes"]
+CONSULTAS = [
+    ("viniltex blanco galon", "Todas"), ("esmalte negro", "Pinturas"),
+    ("tekbond", "Todas"), ("pintura vinilo blnco galon", "Todas"), ("lij", "Accesorios"), ("ref12", "Todas"),
+]
+
+
+def catalogo_sintetico(filas, semilla=7):
+    rng = random.Random(semilla)
+    df = pd.DataFrame({
+        NOMBRE_PRODUCTO_COL: [" ".join(rng.sample(PALABRAS, 4)).upper() for _ in range(filas)],
+        'Referencia': [f"REF{rng.randint(1, 10 * filas)}" for _ in range(filas)],
+        'Categoria': [rng.choice(CATEGORIAS) for _ in range(filas)],
+    })
+    df['search_index'] = construir_texto_busqueda(
+        df[NOMBRE_PRODUCTO_COL] + ' ' + df['Referencia'] + ' ' + df['Categoria']
+    )
+    return df
+
+
+def buscar_con_apply(query, df_productos, categoria="Todas"):
+    """Implementación original: copia completa y `apply(axis=1)` fila a fila."""
+    resultados = df_productos.copy()
+    if categoria != "Todas":
+        resultados = resultados[resultados['Categoria'] == categoria]
+    query_words = set(query.lower().split())
+
+    def calcular_score(row):
+        return sum(1 for word in query_words if word in row['search_index'])
+
+    resultados['score'] = resultados.apply(calcular_score, axis=1)
+    return resultados[resultados['score'] > 0].sort_values(by='score', ascending=False)
+
+
+def medir(funcion, df, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for query, categoria in CONSULTAS:
+            funcion(query, df, categoria)
+    return (time.perf_counter() - inicio) / (repeticiones * len(CONSULTAS)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--sin-apply", action="store_true", help="Omite la implementación original (lenta en 1M filas).")
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'apply (ms)':>12} {'vectorizado (ms)':>17} {'índice (ms)':>12} {'construcción (s)':>17}")
+    for filas in args.tamanos:
+        df = catalogo_sintetico(filas)
+        inicio = time.perf_counter()
+        df.attrs[VERSION_CATALOGO_ATTR] = filas
+        recursos_catalogo(df)
+        construccion = time.perf_counter() - inicio
+
+        t_apply = float('nan') if args.sin_apply else medir(buscar_con_apply, df, 1)
+        t_vectorizado = medir(_buscar_productos_vectorizado, df, args.repeticiones)
+        t_indice = medir(buscar_productos_inteligentemente, df, args.repeticiones)
+        print(f"{filas:>10} {t_apply:>12.1f} {t_vectorizado:>17.1f} {t_indice:>12.1f} {construccion:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
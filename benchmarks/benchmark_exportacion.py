@@ -0,0 +1,43 @@
+# benchmarks/benchmark_exportacion.py
+"""
+Mide el rendimiento (documentos por segundo) de la exportación masiva de PDF a ZIP con
+distinta cantidad de procesos, sobre cotizaciones sintéticas.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.benchmark_exportacion
+    python -m benchmarks.benchmark_exportacion --documentos 500 --items 30 --procesos 1 4 8
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.benchmark_pdf import cotizacion_sintetica
+from exportacion_pdf import exportar_pdfs_zip
+
+
+def cotizaciones(cantidad, items):
+    for i in range(1, cantidad + 1):
+        state = cotizacion_sintetica(items)
+        state.set_numero_propuesta(f"PROP-2025-{i:04d}")
+        state.status = "Aceptada"
+        yield state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documentos", type=int, default=200)
+    parser.add_argument("--items", type=int, default=15)
+    parser.add_argument("--procesos", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    print(f"{'procesos':>8} {'documentos':>10} {'segundos':>9} {'docs/s':>8} {'ZIP (KB)':>9}")
+    for procesos in args.procesos:
+        with tempfile.TemporaryFile() as destino:
+            resumen = exportar_pdfs_zip(cotizaciones(args.documentos, args.items), destino, procesos=procesos)
+            tamano = destino.tell()
+        print(f"{procesos:>8} {resumen['documentos']:>10} {resumen['segundos']:>9.2f} "
+              f"{resumen['documentos_por_segundo']:>8.1f} {tamano / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/benchmark_inventario.py
+"""
+Compara la ingesta del export del ERP: la versión original (todo el archivo a un string,
+`StringIO` y un único `read_csv`) contra la lectura por bloques con agregación
+incremental. Cada método corre en un proceso aparte para medir su pico de memoria (RSS).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.benchmark_inventario
+    python -m benchmarks.benchmark_inventario --lineas 500000 5000000 --referencias 50000
+"""
+import argparse
+import io
+import multiprocessing
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from inventario import ALMACEN_NOMBRE_MAPPING, NOMBRES_COLUMNAS_CSV, agregar_export
+
+ALMACENES = list(ALMACEN_NOMBRE_MAPPING) + ['900', '901']
+
+
+def escribir_export_sintetico(ruta, lineas, referencias, semilla=7):
+    rng = random.Random(semilla)
+    with open(ruta, 'w', encoding='latin1') as archivo:
+        for inicio in range(0, lineas, 100_000):
+            bloque = []
+            for _ in range(min(100_000, lineas - inicio)):
+                bloque.append(
+                    f"PINTURAS|REF{rng.randint(1, referencias)}|PRODUCTO AÑIL {rng.randint(1, 99)}|MARCA|1.5|"
+                    f"{rng.randint(0, 50)}|{rng.randint(-2, 300)}|{rng.uniform(100, 90000):.2f}| {rng.choice(ALMACENES)} |"
+                    f"7|{'0;' * 12}\n"
+                )
+            archivo.writelines(bloque)
+
+
+def ingesta_original(ruta):
+    """Flujo anterior de `run_stock_and_price_update`."""
+    content = Path(ruta).read_bytes().decode('latin1')
+    df_crudo = pd.read_csv(
+        io.StringIO(content), encoding='latin1', delimiter='|', header=None, names=NOMBRES_COLUMNAS_CSV,
+        dtype={'REFERENCIA': str, 'CODALMACEN': str, 'STOCK': str, 'COSTO_PROMEDIO_UND': str}
+    )
+    df_crudo['CODALMACEN'] = df_crudo['CODALMACEN'].str.strip()
+    df_crudo['STOCK'] = pd.to_numeric(df_crudo['STOCK'], errors='coerce').fillna(0).astype(int)
+    df_crudo['COSTO_PROMEDIO_UND'] = pd.to_numeric(df_crudo['COSTO_PROMEDIO_UND'], errors='coerce').fillna(0)
+    df_crudo['VALOR_TOTAL_SKU'] = df_crudo['STOCK'] * df_crudo['COSTO_PROMEDIO_UND']
+    df_costo = df_crudo.groupby('REFERENCIA').agg(
+        Stock_Total=('STOCK', 'sum'), Valor_Total_Inventario=('VALOR_TOTAL_SKU', 'sum')
+    ).reset_index()
+    df_crudo['NOMBRE_TIENDA'] = df_crudo['CODALMACEN'].map(ALMACEN_NOMBRE_MAPPING)
+    df_stock = df_crudo.dropna(subset=['NOMBRE_TIENDA']).pivot_table(
+        index='REFERENCIA', columns='NOMBRE_TIENDA', values='STOCK', aggfunc='sum', fill_value=0
+    )
+    return len(df_costo), int(df_stock.to_numpy().sum())
+
+
+def ingesta_por_bloques(ruta):
+    with open(ruta, 'rb') as flujo:
+        tabla = agregar_export(flujo).tabla()
+    return len(tabla), int(tabla.drop(columns='Costo').to_numpy().sum())
+
+
+def _ejecutar(funcion, ruta, cola):
+    inicio = time.perf_counter()
+    resultado = funcion(ruta)
+    segundos = time.perf_counter() - inicio
+    pico_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    cola.put((segundos, pico_mb, resultado))
+
+
+def medir(funcion, ruta):
+    contexto = multiprocessing.get_context('spawn')
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=_ejecutar, args=(funcion, ruta, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineas", type=int, nargs="+", default=[1_000_000, 3_000_000])
+    parser.add_argument("--referencias", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'líneas':>10} {'MB archivo':>11} {'original (s)':>13} {'pico (MB)':>10} {'bloques (s)':>12} {'pico (MB)':>10}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for lineas in args.lineas:
+            ruta = Path(directorio) / f"export_{lineas}.csv"
+            escribir_export_sintetico(ruta, lineas, args.referencias)
+            t_original, mb_original, r_original = medir(ingesta_original, ruta)
+            t_bloques, mb_bloques, r_bloques = medir(ingesta_por_bloques, ruta)
+            assert r_original == r_bloques, (r_original, r_bloques)
+            tamano = ruta.stat().st_size / 1024 ** 2
+            print(f"{lineas:>10} {tamano:>11.0f} {t_original:>13.2f} {mb_original:>10.0f} {t_bloques:>12.2f} {mb_bloques:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/benchmark_pdf.py
+"""
+Mide el tiempo por PDF y el tamaño del archivo de `generar_pdf_profesional` para
+cotizaciones sintéticas de 1, 5 y 50 páginas, dibujando el pie y decodificando el logo
+y las fuentes en cada documento (sin plantilla) y reutilizándolos (con plantilla).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.benchmark_pdf
+    python -m benchmarks.benchmark_pdf --paginas 1 10 100 --repeticiones 5
+"""
+import argparse
+import re
+import time
+
+from state import QuoteState
+from utils import PDF, generar_pdf_profesional
+
+PAGINA_PDF = re.compile(rb"/Type /Page\b")
+
+
+def cotizacion_sintetica(cantidad_items):
+    state = QuoteState()
+    state.set_cliente({'Nombre': 'FERRETERÍA EL TORNILLO S.A.S.', 'NIF': '900123456', 'Dirección': 'CR 13 19-26', 'Teléfono': '3108305302'})
+    state.set_vendedor("Asesor Comercial")
+    state.cotizacion_items = [
+        {'Referencia': f"REF{i:05d}", 'Producto': f"VINILTEX BLANCO GALÓN {i}", 'Cantidad': 2, 'Precio Unitario': 85_000.0,
+         'Descuento (%)': 5.0, 'Total': 161_500.0, 'Stock': 1 if i % 9 == 0 else 10, 'Costo': 60_000.0}
+        for i in range(cantidad_items)
+    ]
+    state.recalcular_totales()
+    return state
+
+
+def paginas(pdf_bytes):
+    return len(PAGINA_PDF.findall(pdf_bytes))
+
+
+def items_para_paginas(objetivo):
+    """Menor cantidad de ítems con la que el PDF llega a `objetivo` páginas (búsqueda binaria)."""
+    llega = lambda cantidad: paginas(generar_pdf_profesional(cotizacion_sintetica(cantidad), None)) >= objetivo
+    alto = 1
+    while not llega(alto):
+        alto *= 2
+    bajo = alto // 2
+    while bajo + 1 < alto:
+        medio = (bajo + alto) // 2
+        if llega(medio):
+            alto = medio
+        else:
+            bajo = medio
+    return alto
+
+
+def medir(state, repeticiones):
+    generar_pdf_profesional(state, None)  # calienta las cachés de la plantilla
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        pdf_bytes = generar_pdf_profesional(state, None)
+    return (time.perf_counter() - inicio) / repeticiones * 1000, len(pdf_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paginas", type=int, nargs="+", default=[1, 5, 50])
+    parser.add_argument("--repeticiones", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'páginas':>7} {'ítems':>6} {'sin plantilla (ms)':>19} {'con plantilla (ms)':>19} {'tamaño sin (KB)':>16} {'tamaño con (KB)':>16}")
+    for objetivo in args.paginas:
+        state = cotizacion_sintetica(items_para_paginas(objetivo))
+        PDF.reutilizar_plantilla = False
+        t_sin, tamano_sin = medir(state, args.repeticiones)
+        PDF.reutilizar_plantilla = True
+        t_con, tamano_con = medir(state, args.repeticiones)
+        print(f"{paginas(generar_pdf_profesional(state, None)):>7} {len(state.cotizacion_items):>6} {t_sin:>19.1f} {t_con:>19.1f} "
+              f"{tamano_sin / 1024:>16.1f} {tamano_con / 1024:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
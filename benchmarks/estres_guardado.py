@@ -0,0 +1,196 @@
+# benchmarks/estres_guardado.py
+"""
+Prueba de estrés de la numeración de propuestas: lanza guardados simultáneos con
+`handle_save` contra un mismo repositorio, desde varios hilos y varios procesos, y
+comprueba que cada propuesta recibió un número distinto, que los números siguen sin
+huecos a los que ya existían y que no se perdió ninguna fila de la propuesta ni de sus
+items. Termina con error si algo no cuadra.
+
+Motores:
+- `sqlite`: un archivo `RepositorioSQLite` compartido por todos los procesos.
+- `gsheets`: `RepositorioGSheets` sobre un libro falso en memoria (los dobles de
+  `benchmarks.llamadas_actualizacion`) que vive en un proceso gestor, así todos los
+  procesos ven las mismas hojas; cada llamada se aplica entera, como en la API. El libro
+  arranca con propuestas previas, de modo que también se ejercita la alineación de
+  `SecuenciaPropuestas` con el mayor consecutivo de la hoja y el `IndiceFilasPropuestas`.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.estres_guardado
+    python -m benchmarks.estres_guardado --motor gsheets --procesos 8 --hilos 16 --guardados 10
+"""
+import argparse
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+
+from almacenamiento import RepositorioGSheets, RepositorioSQLite
+from benchmarks.llamadas_actualizacion import libro_sintetico
+from indice_propuestas import SecuenciaPropuestas, consecutivo_de
+from state import QuoteState
+from utils import CLIENTE_NOMBRE_COL, handle_save
+
+# Propuestas que ya tiene el libro falso antes de la prueba.
+PROPUESTAS_PREVIAS = 40
+
+
+class _LibroServidor:
+    """Libro falso del lado del gestor: cada llamada se aplica completa bajo un candado."""
+    def __init__(self, propuestas_previas):
+        self._libro = libro_sintetico(propuestas_previas, [2] * propuestas_previas)
+        self._lock = threading.Lock()
+
+    def id_hoja(self, titulo):
+        return self._libro.worksheet(titulo).id
+
+    def llamar_hoja(self, titulo, metodo, args, kwargs):
+        with self._lock:
+            return getattr(self._libro.worksheet(titulo), metodo)(*args, **kwargs)
+
+    def batch_update(self, cuerpo):
+        with self._lock:
+            return self._libro.batch_update(cuerpo)
+
+
+class _GestorLibro(BaseManager):
+    pass
+
+
+_GestorLibro.register('LibroServidor', _LibroServidor)
+
+
+class _HojaRemota:
+    """Hoja del libro compartido con la interfaz de gspread que usa el repositorio."""
+    def __init__(self, servidor, titulo):
+        self._servidor = servidor
+        self.title = titulo
+        self.id = servidor.id_hoja(titulo)
+
+    def __getattr__(self, metodo):
+        return lambda *args, **kwargs: self._servidor.llamar_hoja(self.title, metodo, args, kwargs)
+
+
+class _LibroRemoto:
+    def __init__(self, servidor):
+        self._servidor = servidor
+
+    def worksheet(self, titulo):
+        return _HojaRemota(self._servidor, titulo)
+
+    def batch_update(self, cuerpo):
+        return self._servidor.batch_update(cuerpo)
+
+
+def crear_repositorio(motor, recurso):
+    """Repositorio de un proceso: `recurso` es la ruta SQLite o (libro compartido, ruta de la secuencia)."""
+    if motor == "sqlite":
+        return RepositorioSQLite(recurso)
+    servidor, ruta_secuencia = recurso
+    repositorio = RepositorioGSheets(_LibroRemoto(servidor))
+    # Todos los procesos comparten el archivo de secuencia, como los workers de un mismo servidor.
+    repositorio.secuencia = SecuenciaPropuestas(ruta_secuencia)
+    # El libro falso no tiene Drive: la marca de cambios es fija.
+    repositorio.marca_cambios = lambda: "libro-falso"
+    return repositorio
+
+
+def cotizacion(proceso, hilo, guardado, items):
+    """Cotización lista para guardar; el cliente identifica quién la guardó."""
+    state = QuoteState()
+    state.cliente_actual = {CLIENTE_NOMBRE_COL: f"CLIENTE {proceso}-{hilo}-{guardado}", "NIF": "900"}
+    state.vendedor = "Vendedor"
+    state.tienda_despacho = "CEDI"
+    state.cotizacion_items = [
+        {'Referencia': f"REF{i}", 'Producto': f"Producto {i}", 'Cantidad': i + 1,
+         'Precio Unitario': 1000.0, 'Descuento (%)': 0.0, 'Stock': 10, 'Costo': 500.0}
+        for i in range(items)
+    ]
+    return state
+
+
+def guardar_en_hilos(motor, recurso, proceso, hilos, guardados, items):
+    """Guardados de un proceso: `hilos` hilos con `guardados` propuestas nuevas cada uno."""
+    # Fuera de `streamlit run` cada llamada a `st` desde un hilo avisa que no hay sesión.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    repositorio = crear_repositorio(motor, recurso)
+
+    def guardar(hilo):
+        numeros = {}
+        for guardado in range(guardados):
+            state = cotizacion(proceso, hilo, guardado, items)
+            handle_save(repositorio, state)
+            numeros[state.cliente_actual[CLIENTE_NOMBRE_COL]] = state.numero_propuesta
+        return numeros
+
+    with ThreadPoolExecutor(hilos) as ejecutor:
+        resultados = list(ejecutor.map(guardar, range(hilos)))
+    return {cliente: numero for numeros in resultados for cliente, numero in numeros.items()}
+
+
+def ejecutar(motor, recurso, args):
+    """Lanza los guardados y devuelve ({cliente: número}, propuestas, items, segundos)."""
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(args.procesos) as ejecutor:
+        tareas = [
+            ejecutor.submit(guardar_en_hilos, motor, recurso, proceso, args.hilos, args.guardados, args.items)
+            for proceso in range(args.procesos)
+        ]
+        numeros = {}
+        for tarea in tareas:
+            numeros.update(tarea.result())
+    duracion = time.perf_counter() - inicio
+    repositorio = crear_repositorio(motor, recurso)
+    return numeros, repositorio.listar_propuestas(), repositorio.listar_detalle(), duracion
+
+
+def comprobar(motor, args):
+    esperadas = args.procesos * args.hilos * args.guardados
+    with tempfile.TemporaryDirectory() as directorio:
+        if motor == "sqlite":
+            previas = 0
+            ruta = Path(directorio) / "cotizador.sqlite"
+            RepositorioSQLite(ruta)
+            numeros, propuestas, detalle, duracion = ejecutar(motor, ruta, args)
+        else:
+            previas = PROPUESTAS_PREVIAS
+            with _GestorLibro() as gestor:
+                recurso = (gestor.LibroServidor(previas), Path(directorio) / "secuencia_propuestas")
+                numeros, propuestas, detalle, duracion = ejecutar(motor, recurso, args)
+
+    print(f"[{motor}] {esperadas} guardados ({args.procesos} procesos x {args.hilos} hilos) en {duracion:.2f} s")
+    temporales = [numero for numero in numeros.values() if numero.startswith("TEMP")]
+    assert not temporales, f"{len(temporales)} guardados fallaron y conservaron su número temporal"
+    assert len(numeros) == esperadas, f"Se esperaban {esperadas} propuestas, se guardaron {len(numeros)}"
+    assert len(set(numeros.values())) == esperadas, "Hay números de propuesta repetidos"
+    assert sorted(consecutivo_de(numero) for numero in numeros.values()) == list(range(previas + 1, previas + esperadas + 1)), \
+        f"Los consecutivos no siguen sin huecos a los {previas} existentes"
+
+    nuevas = propuestas[propuestas['numero_propuesta'].isin(set(numeros.values()))]
+    assert len(propuestas) == esperadas + previas, f"La tabla de propuestas tiene {len(propuestas)} filas de {esperadas + previas}"
+    assert propuestas['numero_propuesta'].is_unique, "Hay filas de propuesta repetidas"
+    assert dict(zip(nuevas['cliente_nombre'], nuevas['numero_propuesta'])) == numeros, \
+        "Alguna propuesta quedó guardada con el número de otra"
+    detalle = detalle[detalle['numero_propuesta'].isin(set(numeros.values()))]
+    items_por_propuesta = detalle.groupby('numero_propuesta').size()
+    assert len(detalle) == esperadas * args.items and (items_por_propuesta == args.items).all(), \
+        f"La tabla de items tiene {len(detalle)} filas de {esperadas * args.items}"
+    print(f"[{motor}] OK: {esperadas} números distintos y consecutivos, {len(detalle)} items, sin filas perdidas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--motor", choices=["sqlite", "gsheets", "ambos"], default="ambos")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--guardados", type=int, default=5, help="Propuestas que guarda cada hilo.")
+    parser.add_argument("--items", type=int, default=6, help="Items de cada propuesta.")
+    args = parser.parse_args()
+    for motor in (["sqlite", "gsheets"] if args.motor == "ambos" else [args.motor]):
+        comprobar(motor, args)
+
+
+if __name__ == "__main__":
+    main()
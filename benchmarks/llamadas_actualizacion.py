@@ -0,0 +1,229 @@
+# benchmarks/llamadas_actualizacion.py
+"""
+Cuenta las llamadas a la API de Google Sheets que hace `actualizar_propuesta_en_sheets`
+al editar propuestas de distinto tamaño, sobre un libro falso en memoria que registra
+cada llamada. Comprueba que no se descarga ninguna hoja completa (`get_all_records`),
+que no hay borrados fila por fila (`delete_rows`), que los items viajan en un único
+`batch_update`, que el total de llamadas no depende de la cantidad de líneas y que al
+volver a guardar sólo viajan las líneas que cambiaron. Termina con error si algo no cuadra.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.llamadas_actualizacion
+    python -m benchmarks.llamadas_actualizacion --lineas 1 60 500 --propuestas 2000
+"""
+import argparse
+import re
+from collections import Counter
+
+from almacenamiento import (
+    COLUMNAS_DETALLE, COLUMNAS_PROPUESTAS, DETALLE_PROPUESTAS_SHEET_NAME, PROPUESTAS_SHEET_NAME,
+    RepositorioGSheets,
+)
+from state import QuoteState
+from utils import CLIENTE_NOMBRE_COL, actualizar_propuesta_en_sheets
+
+
+class _Celda:
+    def __init__(self, valor):
+        self.value = valor
+
+
+class HojaFalsa:
+    """Hoja en memoria con la parte de la API de gspread que usa el repositorio; cuenta cada llamada."""
+    def __init__(self, libro, titulo, id_hoja, filas):
+        self.libro = libro
+        self.title = titulo
+        self.id = id_hoja
+        self.filas = [list(fila) for fila in filas]
+
+    def _contar(self, metodo):
+        self.libro.llamadas[metodo] += 1
+
+    def get_all_records(self, **_):
+        self._contar('get_all_records')
+        encabezado = self.filas[0]
+        return [dict(zip(encabezado, fila)) for fila in self.filas[1:]]
+
+    def delete_rows(self, inicio, fin=None):
+        self._contar('delete_rows')
+        del self.filas[inicio - 1:(fin or inicio)]
+
+    def col_values(self, columna):
+        self._contar('col_values')
+        return [fila[columna - 1] if len(fila) >= columna else '' for fila in self.filas]
+
+    def row_values(self, fila):
+        self._contar('row_values')
+        return list(self.filas[fila - 1])
+
+    def acell(self, a1):
+        self._contar('acell')
+        fila = int(a1[1:])
+        return _Celda(self.filas[fila - 1][0] if fila <= len(self.filas) else None)
+
+    def get(self, rango):
+        self._contar('get')
+        inicio, fin = (int(celda[1:]) for celda in rango.split(':'))
+        return [[fila[0]] if fila and fila[0] != '' else [] for fila in self.filas[inicio - 1:fin]]
+
+    def batch_get(self, rangos, **_):
+        self._contar('batch_get')
+        resultado = []
+        for rango in rangos:
+            inicio, fin = (int(parte) for parte in rango.split(':'))
+            resultado.append(self.filas[inicio - 1:fin])
+        return resultado
+
+    def update(self, rango, valores, **_):
+        self._contar('update')
+        fila = int(re.match(r'[A-Z]+(\d+)', rango).group(1))
+        self.filas[fila - 1] = list(valores[0])
+
+    def append_row(self, fila, **_):
+        self._contar('append_row')
+        self.filas.append(list(fila))
+        return {'updates': {'updatedRange': f"{self.title}!A{len(self.filas)}"}}
+
+    def append_rows(self, filas, **_):
+        self._contar('append_rows')
+        inicio = len(self.filas) + 1
+        self.filas.extend(list(fila) for fila in filas)
+        return {'updates': {'updatedRange': f"{self.title}!A{inicio}:A{len(self.filas)}"}}
+
+
+def _valores(fila):
+    return [next(iter(celda.get('userEnteredValue', {}).values()), '') for celda in fila['values']]
+
+
+class LibroFalso:
+    """
+    Libro en memoria; `batch_update` aplica `updateCells`, `deleteDimension` y `appendCells`
+    como la API y cuenta en `solicitudes` las de cada tipo.
+    """
+    def __init__(self, hojas):
+        self.llamadas = Counter()
+        self.solicitudes = Counter()
+        self.hojas = {titulo: HojaFalsa(self, titulo, i, filas) for i, (titulo, filas) in enumerate(hojas.items())}
+
+    def worksheet(self, titulo):
+        return self.hojas[titulo]
+
+    def batch_update(self, cuerpo):
+        self.llamadas['batch_update'] += 1
+        por_id = {hoja.id: hoja for hoja in self.hojas.values()}
+        for solicitud in cuerpo['requests']:
+            (tipo, datos), = solicitud.items()
+            self.solicitudes[tipo] += 1
+            if tipo == 'updateCells':
+                inicio = datos['start']
+                filas = por_id[inicio['sheetId']].filas
+                for i, fila in enumerate(datos['rows']):
+                    filas[inicio['rowIndex'] + i] = _valores(fila)
+            elif tipo == 'deleteDimension':
+                rango = datos['range']
+                del por_id[rango['sheetId']].filas[rango['startIndex']:rango['endIndex']]
+            elif tipo == 'appendCells':
+                por_id[datos['sheetId']].filas.extend(_valores(fila) for fila in datos['rows'])
+        return {}
+
+
+def libro_sintetico(propuestas, lineas_por_propuesta):
+    encabezados, detalle = [COLUMNAS_PROPUESTAS], [COLUMNAS_DETALLE]
+    for i, lineas in zip(range(1, propuestas + 1), lineas_por_propuesta):
+        numero = f"PROP-2025-{i:04d}"
+        encabezados.append([numero, "2025-01-01 00:00:00", "Vendedor", f"CLIENTE {i}", "900",
+                            "Borrador", 0, 0, 0, 0, 0, 0, "", "CEDI"])
+        detalle.extend([numero, f"REF{j}", "Producto", 1, 10.0, 5.0, 0.0, 10.0, 3, 0.0] for j in range(lineas))
+    return LibroFalso({PROPUESTAS_SHEET_NAME: encabezados, DETALLE_PROPUESTAS_SHEET_NAME: detalle})
+
+
+def cotizacion(numero, lineas):
+    state = QuoteState()
+    state.numero_propuesta = numero
+    state.cliente_actual = {CLIENTE_NOMBRE_COL: "CLIENTE EDITADO", "NIF": "900"}
+    state.vendedor = "Vendedor"
+    state.tienda_despacho = "CEDI"
+    state.cotizacion_items = [
+        {'Referencia': f"NUEVA{j}", 'Producto': "Producto editado", 'Cantidad': 2,
+         'Precio Unitario': 100.0, 'Descuento (%)': 0.0, 'Stock': 5, 'Costo': 50.0}
+        for j in range(lineas)
+    ]
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineas", type=int, nargs="+", default=[1, 10, 60, 200])
+    parser.add_argument("--propuestas", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'líneas':>7} {'llamadas (1.ª edición)':>23} {'llamadas (siguientes)':>22}  detalle")
+    totales = set()
+    for lineas in args.lineas:
+        libro = libro_sintetico(args.propuestas, [(i % 7) + 1 for i in range(args.propuestas)])
+        repositorio = RepositorioGSheets(libro)
+        por_edicion = []
+        for edicion, numero in enumerate(["PROP-2025-0007", "PROP-2025-0123", "PROP-2025-0007"]):
+            antes = {numero_otro: filas for numero_otro, filas in _items_por_propuesta(libro).items() if numero_otro != numero}
+            libro.llamadas.clear()
+            state = cotizacion(numero, lineas + edicion)
+            exito, mensaje = actualizar_propuesta_en_sheets(repositorio, state)
+            assert exito, mensaje
+            por_edicion.append(Counter(libro.llamadas))
+
+            despues = _items_por_propuesta(libro)
+            assert [fila[1] for fila in despues[numero]] == [f"NUEVA{j}" for j in range(lineas + edicion)], \
+                f"Los items de {numero} no quedaron como en la cotización"
+            assert {otro: filas for otro, filas in despues.items() if otro != numero} == antes, \
+                "La edición tocó items de otras propuestas"
+            fila = libro.hojas[PROPUESTAS_SHEET_NAME].filas[int(numero[-4:])]
+            assert fila[0] == numero and fila[3] == "CLIENTE EDITADO", f"No se actualizó el encabezado de {numero}"
+
+        for llamadas in por_edicion:
+            assert llamadas['get_all_records'] == 0, "Se descargó una hoja completa con get_all_records"
+            assert llamadas['delete_rows'] == 0, "Se borraron filas una por una con delete_rows"
+            assert llamadas['batch_update'] == 1, f"Se esperaba un solo batch_update, hubo {llamadas['batch_update']}"
+        _comprobar_delta(libro, repositorio, state)
+        siguientes = {sum(llamadas.values()) for llamadas in por_edicion[1:]}
+        assert len(siguientes) == 1, f"Las ediciones con el índice ya construido no cuestan lo mismo: {siguientes}"
+        totales.add((sum(por_edicion[0].values()), *siguientes))
+        detalle = ", ".join(f"{metodo}={cantidad}" for metodo, cantidad in sorted(por_edicion[-1].items()))
+        print(f"{lineas:>7} {sum(por_edicion[0].values()):>23} {siguientes.pop():>22}  {detalle}")
+
+    assert len(totales) == 1, f"La cantidad de llamadas depende del tamaño de la cotización: {sorted(totales)}"
+    print("OK: cantidad de llamadas constante, un solo batch_update por edición y sin get_all_records")
+    print("OK: al volver a guardar sólo viajan las líneas cambiadas o borradas")
+
+
+def _comprobar_delta(libro, repositorio, state):
+    """Vuelve a guardar `state` ya subido: con una línea cambiada, una borrada y ninguna."""
+    numero = state.numero_propuesta
+    pasos = [
+        ({'edited_rows': {0: {'Cantidad': 7}}}, Counter(updateCells=1)),
+        ({'deleted_rows': [len(state.cotizacion_items) - 1]}, Counter(deleteDimension=1)),
+        ({}, Counter()),
+    ]
+    for cambios, esperadas in pasos:
+        state.aplicar_cambios_editor(cambios)
+        antes = {otro: filas for otro, filas in _items_por_propuesta(libro).items() if otro != numero}
+        libro.solicitudes.clear()
+        exito, mensaje = actualizar_propuesta_en_sheets(repositorio, state)
+        assert exito, mensaje
+        assert libro.solicitudes == esperadas, f"Con {cambios} se enviaron {dict(libro.solicitudes)}, se esperaba {dict(esperadas)}"
+        despues = _items_por_propuesta(libro)
+        assert [[fila[1], fila[3]] for fila in despues.get(numero, [])] == \
+            [[item['Referencia'], item['Cantidad']] for item in state.cotizacion_items], \
+            f"Los items de {numero} no quedaron como en la cotización tras {cambios}"
+        assert {otro: filas for otro, filas in despues.items() if otro != numero} == antes, \
+            "La edición tocó items de otras propuestas"
+
+
+def _items_por_propuesta(libro):
+    items = {}
+    for fila in libro.hojas[DETALLE_PROPUESTAS_SHEET_NAME].filas[1:]:
+        items.setdefault(fila[0], []).append(list(fila))
+    return items
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# cache_pdf.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# Tope de memoria de los PDF guardados (bytes) y de cantidad de documentos.
+TAMANO_MAXIMO_CACHE_PDF = 64 * 1024 * 1024
+ENTRADAS_MAXIMAS_CACHE_PDF = 256
+
+
+def huella_contenido(contenido):
+    """
+    SHA-256 de la representación JSON canónica de `contenido` (claves ordenadas). Los
+    valores que JSON no serializa (numpy, Timestamp, ...) se convierten a texto.
+    """
+    serializado = json.dumps(contenido, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+class CachePDF:
+    """
+    PDFs ya generados, indexados por la huella del contenido que imprimen. Dos
+    cotizaciones con el mismo contenido comparten el documento, y una edición que no
+    cambia nada impreso no lo regenera.
+
+    Se expulsa en orden LRU cuando el total de bytes supera `tamano_maximo` o la cantidad
+    de documentos supera `entradas_maximas`. Es compartida por todas las sesiones, así
+    que todo acceso pasa por un candado; la generación ocurre fuera de él.
+    """
+    def __init__(self, tamano_maximo=TAMANO_MAXIMO_CACHE_PDF, entradas_maximas=ENTRADAS_MAXIMAS_CACHE_PDF):
+        self.tamano_maximo = tamano_maximo
+        self.entradas_maximas = entradas_maximas
+        self._lock = threading.Lock()
+        self._documentos = OrderedDict()
+        # Huellas cuya generación falló (acotadas como los documentos).
+        self._fallidos = OrderedDict()
+        self.tamano = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documentos)
+
+    def __contains__(self, huella):
+        with self._lock:
+            return huella in self._documentos
+
+    def obtener(self, huella):
+        with self._lock:
+            documento = self._documentos.get(huella)
+            if documento is None:
+                self.fallos += 1
+                return None
+            self._documentos.move_to_end(huella)
+            self.aciertos += 1
+            return documento
+
+    def guardar(self, huella, documento):
+        # Un documento más grande que el tope completo no se guarda: vaciaría la caché.
+        if len(documento) > self.tamano_maximo:
+            return
+        with self._lock:
+            anterior = self._documentos.pop(huella, None)
+            if anterior is not None:
+                self.tamano -= len(anterior)
+            self._documentos[huella] = documento
+            self.tamano += len(documento)
+            while self.tamano > self.tamano_maximo or len(self._documentos) > self.entradas_maximas:
+                _, expulsado = self._documentos.popitem(last=False)
+                self.tamano -= len(expulsado)
+
+    def obtener_o_generar(self, huella, generar):
+        """
+        Devuelve el PDF de `huella`, generándolo con `generar()` si no está. None si falla;
+        el fallo queda registrado (ver `generacion_fallida`).
+        """
+        documento = self.obtener(huella)
+        if documento is None:
+            try:
+                documento = generar()
+            finally:
+                if documento is None:
+                    self._registrar_fallo(huella)
+            if documento is not None:
+                self.guardar(huella, documento)
+        return documento
+
+    def _registrar_fallo(self, huella):
+        with self._lock:
+            self._fallidos[huella] = True
+            self._fallidos.move_to_end(huella)
+            while len(self._fallidos) > self.entradas_maximas:
+                self._fallidos.popitem(last=False)
+
+    def generacion_fallida(self, huella):
+        """True si ya se intentó generar el PDF de `huella` y falló."""
+        with self._lock:
+            return huella in self._fallidos
@@ -0,0 +1,74 @@
+# cambios.py
+import threading
+import time
+
+INTERVALO_SONDEO_CAMBIOS = 15
+VIDA_MAXIMA_CACHE = 3600
+
+
+class MonitorCambios:
+    """
+    Decide cuándo un dataset (una hoja del libro) debe volver a descargarse.
+
+    La señal de cambio es barata: una sola llamada que devuelve una marca del libro
+    (el `modifiedTime` de Drive), hecha como máximo una vez cada `intervalo` segundos.
+    Cada dataset recuerda la marca con la que se validó y una generación; la generación
+    sólo aumenta cuando la marca cambia, y es la que se usa como clave de caché.
+
+    Como la marca es del libro completo, una escritura propia en una hoja cambiaría la
+    marca de todas. `registrar_escritura` lo evita: invalida sólo el dataset escrito y
+    traslada la marca nueva a los demás, que siguen vigentes.
+    """
+    def __init__(self, sondear, intervalo=INTERVALO_SONDEO_CAMBIOS, vida_maxima=VIDA_MAXIMA_CACHE):
+        self._sondear = sondear
+        self.intervalo = intervalo
+        self.vida_maxima = vida_maxima
+        self._lock = threading.Lock()
+        self._marca = None
+        self._sondeado_en = 0.0
+        self._vigente = {}
+        self._generacion = {}
+
+    def _actualizar_marca(self, forzar=False):
+        ahora = time.time()
+        if forzar or ahora - self._sondeado_en >= self.intervalo:
+            try:
+                self._marca = self._sondear()
+            except Exception:
+                # Sin señal disponible se degrada a una expiración por tiempo.
+                self._marca = f"sin-senal-{int(ahora // self.vida_maxima)}"
+            self._sondeado_en = ahora
+        return self._marca
+
+    def marca_actual(self):
+        with self._lock:
+            return self._actualizar_marca()
+
+    def clave(self, dataset):
+        """Generación vigente del dataset; cambia sólo si sus datos pudieron cambiar."""
+        with self._lock:
+            marca = self._actualizar_marca()
+            vigente = self._vigente.get(dataset)
+            if vigente is None or vigente[0] != marca or time.time() - vigente[1] > self.vida_maxima:
+                self._vigente[dataset] = (marca, time.time())
+                self._generacion[dataset] = self._generacion.get(dataset, 0) + 1
+            return self._generacion[dataset]
+
+    def sembrar(self, dataset, marca):
+        """Registra un dataset ya descargado con `marca` (p. ej. un snapshot en disco)."""
+        with self._lock:
+            if dataset not in self._vigente:
+                self._vigente[dataset] = (marca, time.time())
+                self._generacion[dataset] = self._generacion.get(dataset, 0) + 1
+            return self._generacion[dataset]
+
+    def registrar_escritura(self, *datasets):
+        """Tras escribir en `datasets`: los invalida y mantiene vigentes los demás."""
+        with self._lock:
+            anterior = self._marca
+            nueva = self._actualizar_marca(forzar=True)
+            for dataset, (marca, validado_en) in list(self._vigente.items()):
+                if dataset in datasets:
+                    del self._vigente[dataset]
+                elif marca == anterior:
+                    self._vigente[dataset] = (nueva, validado_en)
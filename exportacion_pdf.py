@@ -0,0 +1,91 @@
+# exportacion_pdf.py
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from utils import generar_pdf_profesional, nombre_archivo_pdf
+
+# Documentos en vuelo por proceso: mantiene a todos ocupados sin acumular PDFs en memoria.
+PENDIENTES_POR_PROCESO = 2
+
+
+def _generar(state):
+    """Trabajo de cada proceso: devuelve (número, nombre de archivo, bytes del PDF o None)."""
+    return state.numero_propuesta, nombre_archivo_pdf(state), generar_pdf_profesional(state, None)
+
+
+def _fallido(state):
+    """Resultado de una cotización cuyo PDF no se pudo generar: se informa y el lote sigue."""
+    return state.numero_propuesta, nombre_archivo_pdf(state), None
+
+
+def _documentos(states, procesos):
+    """
+    Genera los PDF de `states` (un iterable que puede ser perezoso) y los entrega a medida
+    que terminan. Con varios procesos sólo hay `procesos * PENDIENTES_POR_PROCESO` cotizaciones
+    en vuelo a la vez; con uno solo se generan en el proceso actual.
+    """
+    if procesos <= 1:
+        for state in states:
+            try:
+                documento = _generar(state)
+            except Exception:
+                documento = _fallido(state)
+            yield documento
+        return
+    # `spawn` y no `fork`: el servidor de Streamlit tiene hilos y un fork podría heredar candados tomados.
+    contexto = multiprocessing.get_context("spawn")
+    states = iter(states)
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        pendientes = {}
+
+        def completar_pendientes():
+            while len(pendientes) < procesos * PENDIENTES_POR_PROCESO:
+                state = next(states, None)
+                if state is None:
+                    return
+                pendientes[pool.submit(_generar, state)] = state
+
+        completar_pendientes()
+        while pendientes:
+            listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                state = pendientes.pop(futuro)
+                try:
+                    yield futuro.result()
+                except Exception:
+                    yield _fallido(state)
+            completar_pendientes()
+
+
+def exportar_pdfs_zip(states, destino, procesos=None, al_avanzar=None):
+    """
+    Genera el PDF de cada cotización de `states` repartiendo el trabajo en `procesos`
+    procesos (por omisión, uno por CPU) y los escribe en un ZIP en `destino` (ruta o
+    archivo binario) a medida que van saliendo: en memoria sólo están los documentos en
+    vuelo, no el lote completo. `al_avanzar(terminados)` se llama tras cada documento.
+
+    Devuelve un resumen con los documentos generados, los números que fallaron, los
+    segundos totales y el rendimiento en documentos por segundo.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    inicio = time.perf_counter()
+    generados, fallidos = 0, []
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        for numero, nombre_archivo, pdf_bytes in _documentos(states, procesos):
+            if pdf_bytes is None:
+                fallidos.append(numero)
+            else:
+                archivo_zip.writestr(nombre_archivo, pdf_bytes)
+                generados += 1
+            if al_avanzar:
+                al_avanzar(generados + len(fallidos))
+    segundos = time.perf_counter() - inicio
+    return {
+        'documentos': generados,
+        'fallidos': fallidos,
+        'segundos': segundos,
+        'documentos_por_segundo': generados / segundos if segundos else 0.0,
+    }
@@ -0,0 +1,169 @@
+# indice_propuestas.py
+import os
+import re
+import threading
+from bisect import bisect_left
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo se serializa dentro del proceso.
+    fcntl = None
+
+RUTA_SECUENCIA = Path(".cache") / "secuencia_propuestas"
+_PATRON_CONSECUTIVO = re.compile(r'^PROP-\d{4}-(\d+)$')
+
+
+def consecutivo_de(numero):
+    """Parte numérica de 'PROP-2025-0042' (42), o 0 si el número no sigue el formato."""
+    coincidencia = _PATRON_CONSECUTIVO.match(str(numero))
+    return int(coincidencia.group(1)) if coincidencia else 0
+
+
+def filas_de_rango(rango_a1):
+    """Números de fila de un rango A1 devuelto por la API: 'Hoja!A5:J9' -> [5, ..., 9]."""
+    celdas = re.findall(r'[A-Z]+(\d+)', rango_a1.split('!')[-1])
+    if not celdas:
+        return []
+    inicio, fin = int(celdas[0]), int(celdas[-1])
+    return list(range(inicio, fin + 1))
+
+
+class IndiceFilasPropuestas:
+    """
+    Ubicación de cada propuesta en las hojas: fila de su encabezado en Cotizaciones y
+    filas de sus items en Cotizaciones_Items, más el mayor consecutivo ya usado.
+
+    Se construye una vez leyendo sólo la columna A de cada hoja y después se mantiene con
+    las escrituras de la propia app. Antes de usar una ubicación se comprueba con una
+    lectura puntual (la celda del encabezado y el rango de items); si otro proceso movió
+    las filas, el índice se reconstruye y se vuelve a ubicar.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._construido = False
+        self._fila_propuesta = {}
+        self._filas_detalle = {}
+        self._ultima_fila_detalle = 1
+        self.mayor_consecutivo = 0
+
+    def bloqueo(self):
+        """Mantiene el índice fijo mientras se ubica y se escribe una propuesta."""
+        return self._lock
+
+    def invalidar(self):
+        with self._lock:
+            self._construido = False
+
+    def construir(self, propuestas_sheet, detalle_sheet):
+        with self._lock:
+            numeros = propuestas_sheet.col_values(1)[1:]
+            self._fila_propuesta = {numero: i + 2 for i, numero in enumerate(numeros) if numero}
+            self.mayor_consecutivo = max((consecutivo_de(numero) for numero in numeros), default=0)
+            numeros_detalle = detalle_sheet.col_values(1)
+            self._filas_detalle = {}
+            for i, numero in enumerate(numeros_detalle[1:]):
+                if numero:
+                    self._filas_detalle.setdefault(numero, []).append(i + 2)
+            self._ultima_fila_detalle = max(len(numeros_detalle), 1)
+            self._construido = True
+
+    def asegurar(self, propuestas_sheet, detalle_sheet):
+        with self._lock:
+            if not self._construido:
+                self.construir(propuestas_sheet, detalle_sheet)
+
+    def _ubicacion_valida(self, numero, propuestas_sheet, detalle_sheet):
+        fila = self._fila_propuesta.get(numero)
+        if fila is None or propuestas_sheet.acell(f'A{fila}').value != numero:
+            return False
+        filas = self._filas_detalle.get(numero, [])
+        if filas:
+            inicio, fin = filas[0], filas[-1]
+            valores = detalle_sheet.get(f'A{inicio}:A{fin}')
+            encontradas = [inicio + i for i, celdas in enumerate(valores) if celdas and celdas[0] == numero]
+            if encontradas != filas:
+                return False
+        return True
+
+    def ubicar(self, numero, propuestas_sheet, detalle_sheet):
+        """
+        Devuelve (fila_encabezado, filas_detalle) de la propuesta, o (None, []) si no
+        existe. Cuesta una o dos lecturas puntuales mientras el índice esté al día.
+        """
+        with self._lock:
+            self.asegurar(propuestas_sheet, detalle_sheet)
+            if not self._ubicacion_valida(numero, propuestas_sheet, detalle_sheet):
+                self.construir(propuestas_sheet, detalle_sheet)
+            return self._fila_propuesta.get(numero), list(self._filas_detalle.get(numero, []))
+
+    def registrar_nueva(self, numero, fila_propuesta, filas_detalle):
+        with self._lock:
+            if not self._construido:
+                return
+            self._fila_propuesta[numero] = fila_propuesta
+            self.mayor_consecutivo = max(self.mayor_consecutivo, consecutivo_de(numero))
+            if filas_detalle:
+                self._filas_detalle[numero] = list(filas_detalle)
+                self._ultima_fila_detalle = max(self._ultima_fila_detalle, filas_detalle[-1])
+
+    def registrar_reemplazo(self, numero, filas_borradas, cantidad_nuevas, filas_conservadas=()):
+        """
+        Refleja el borrado de `filas_borradas` y el alta de `cantidad_nuevas` filas al final;
+        `filas_conservadas` (escritas en su lugar) siguen siendo de `numero`.
+        """
+        with self._lock:
+            if not self._construido:
+                return
+            borradas = sorted(filas_borradas)
+            if borradas:
+                for otro, filas in self._filas_detalle.items():
+                    if otro != numero and filas[-1] > borradas[0]:
+                        self._filas_detalle[otro] = [fila - bisect_left(borradas, fila) for fila in filas]
+                self._ultima_fila_detalle -= len(borradas)
+            self._filas_detalle.pop(numero, None)
+            filas = [fila - bisect_left(borradas, fila) for fila in filas_conservadas]
+            if cantidad_nuevas:
+                inicio = self._ultima_fila_detalle + 1
+                filas.extend(range(inicio, inicio + cantidad_nuevas))
+                self._ultima_fila_detalle += cantidad_nuevas
+            if filas:
+                self._filas_detalle[numero] = filas
+
+
+
+class SecuenciaPropuestas:
+    """
+    Asigna consecutivos de propuesta sin colisiones.
+
+    El último consecutivo entregado vive en un archivo local; leerlo, incrementarlo y
+    escribirlo ocurre bajo un bloqueo exclusivo del archivo (`fcntl.flock`) y un candado
+    de hilo, así que dos guardados simultáneos, en el mismo proceso o en otro worker del
+    mismo servidor, nunca reciben el mismo número ni necesitan reintentar. `minimo`
+    permite alinear la secuencia con lo que ya existe en la hoja.
+
+    La garantía vale sólo en un servidor: el archivo es local y no distingue libros. Dos
+    despliegues sobre el mismo libro pueden entregar el mismo número, y dos libros
+    servidos desde la misma máquina comparten la secuencia y se dejan huecos entre sí
+    (salvo que cada uno use su propia `ruta`).
+    """
+    def __init__(self, ruta=RUTA_SECUENCIA):
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+
+    def siguiente(self, minimo=0):
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            descriptor = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(descriptor, fcntl.LOCK_EX)
+                contenido = os.read(descriptor, 64).decode().strip()
+                nuevo = max(int(contenido or 0), minimo) + 1
+                os.lseek(descriptor, 0, os.SEEK_SET)
+                os.ftruncate(descriptor, 0)
+                os.write(descriptor, str(nuevo).encode())
+                os.fsync(descriptor)
+                return nuevo
+            finally:
+                os.close(descriptor)
@@ -0,0 +1,218 @@
+# inventario.py
+import io
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Mapeo completo de los códigos de almacén a los nombres de columna deseados.
+ALMACEN_NOMBRE_MAPPING = {
+    '155': 'Stock CEDI',
+    '156': 'Stock ARMENIA',
+    '157': 'Stock Manizales',
+    '158': 'Stock Opalo',
+    '189': 'Stock Olaya',
+    '238': 'Stock Laureles',
+    '439': 'Stock FerreBox',
+}
+
+# Columnas del export del ERP (archivo delimitado por '|', sin encabezado, en latin1).
+NOMBRES_COLUMNAS_CSV = [
+    'DEPARTAMENTO', 'REFERENCIA', 'DESCRIPCION', 'MARCA', 'PESO_ARTICULO',
+    'UNIDADES_VENDIDAS', 'STOCK', 'COSTO_PROMEDIO_UND', 'CODALMACEN',
+    'LEAD_TIME_PROVEEDOR', 'HISTORIAL_VENTAS'
+]
+# Sólo estas columnas se parsean; el resto del export se descarta al leer.
+COLUMNAS_USADAS = ['REFERENCIA', 'STOCK', 'COSTO_PROMEDIO_UND', 'CODALMACEN']
+TAMANO_BLOQUE = 200_000
+# Cuántos agregados parciales se acumulan antes de reducirlos a uno solo.
+BLOQUES_POR_REDUCCION = 8
+
+
+class FlujoMedido(io.RawIOBase):
+    """
+    Envuelve un flujo binario y cuenta los bytes leídos y el tiempo gastado esperándolos,
+    para reportar el avance de una descarga que se consume en streaming.
+    """
+    def __init__(self, crudo, total=None):
+        self._crudo = crudo
+        self.total = total
+        self.leidos = 0
+        self.segundos_lectura = 0.0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        inicio = time.perf_counter()
+        datos = self._crudo.read(len(buffer))
+        self.segundos_lectura += time.perf_counter() - inicio
+        buffer[:len(datos)] = datos
+        self.leidos += len(datos)
+        return len(datos)
+
+    def fraccion(self):
+        return min(self.leidos / self.total, 1.0) if self.total else None
+
+
+@contextmanager
+def abrir_export_dropbox(app_key, app_secret, refresh_token, file_path):
+    """
+    Abre el export del ERP en Dropbox como un `FlujoMedido`, sin descargarlo completo a
+    memoria. El cuerpo de la respuesta se lee a medida que pandas lo consume.
+    """
+    import dropbox
+
+    with dropbox.Dropbox(app_key=app_key, app_secret=app_secret, oauth2_refresh_token=refresh_token) as dbx:
+        dbx.users_get_current_account()
+        metadatos, respuesta = dbx.files_download(path=file_path)
+        try:
+            respuesta.raw.decode_content = True
+            yield FlujoMedido(respuesta.raw, total=metadatos.size)
+        finally:
+            respuesta.close()
+
+
+@contextmanager
+def abrir_export_local(ruta):
+    """Abre un export del ERP guardado en disco como `FlujoMedido` (p. ej. para pruebas locales)."""
+    with open(ruta, 'rb') as archivo:
+        yield FlujoMedido(archivo, total=os.path.getsize(ruta))
+
+
+def leer_bloques(fuente, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Itera el export en bloques tipados: `REFERENCIA` texto, `CODALMACEN` categórica,
+    `STOCK` entero y `COSTO_PROMEDIO_UND` float. `fuente` es una ruta o un flujo binario;
+    la decodificación latin1 ocurre por bloques.
+    """
+    lector = pd.read_csv(
+        fuente,
+        encoding='latin1',
+        delimiter='|',
+        header=None,
+        names=NOMBRES_COLUMNAS_CSV,
+        usecols=COLUMNAS_USADAS,
+        dtype=str,
+        chunksize=tamano_bloque
+    )
+    for bloque in lector:
+        # Igual que antes: valores no numéricos cuentan como 0 y el stock se trunca a entero.
+        stock = pd.to_numeric(bloque['STOCK'], errors='coerce').fillna(0).astype(np.int64)
+        costo = pd.to_numeric(bloque['COSTO_PROMEDIO_UND'], errors='coerce').fillna(0).astype(np.float64)
+        yield pd.DataFrame({
+            'REFERENCIA': bloque['REFERENCIA'],
+            'STOCK': stock,
+            'COSTO_PROMEDIO_UND': costo,
+            'CODALMACEN': bloque['CODALMACEN'].str.strip().astype('category'),
+        })
+
+
+class AgregadoInventario:
+    """
+    Acumula, bloque a bloque, el stock y el valor de inventario por referencia y el stock
+    de cada tienda de `mapeo_almacenes`, en una sola pasada agrupada por bloque.
+
+    Cada referencia recibe un código entero y cada fila del acumulador tiene las columnas
+    [stock total, valor total, stock tienda 1, ..., stock tienda k]. Un bloque se suma
+    con un único `np.bincount` sobre los índices (referencia, columna) de sus tres
+    aportes: stock, valor y stock en su tienda (si el almacén está mapeado). La memoria
+    depende de la cantidad de referencias distintas, no del tamaño del export.
+    """
+    def __init__(self, mapeo_almacenes=ALMACEN_NOMBRE_MAPPING):
+        self.mapeo_almacenes = mapeo_almacenes
+        # Mismo orden de columnas que producía el `pivot_table` original.
+        self.tiendas = sorted(set(mapeo_almacenes.values()))
+        posicion_tienda = {tienda: i for i, tienda in enumerate(self.tiendas)}
+        self._columna_almacen = {codigo: 2 + posicion_tienda[tienda] for codigo, tienda in mapeo_almacenes.items()}
+        self._ancho = 2 + len(self.tiendas)
+        # Referencias vistas, en orden de código (pd.Index para traducir bloques completos).
+        self._referencias = None
+        self._acumulado = np.zeros(0)
+        self.registros = 0
+
+    def _codificar_referencias(self, referencias):
+        """Código global de cada fila (-1 si la referencia está vacía)."""
+        codigos_locales, unicas = pd.factorize(referencias)
+        unicas = pd.Index(unicas)
+        if self._referencias is None:
+            self._referencias = unicas
+            globales = np.arange(len(unicas))
+        else:
+            globales = self._referencias.get_indexer(unicas)
+            nuevas = globales < 0
+            if nuevas.any():
+                globales[nuevas] = np.arange(len(self._referencias), len(self._referencias) + nuevas.sum())
+                self._referencias = self._referencias.append(unicas[nuevas])
+        # El -1 de `factorize` (valores vacíos) toma el último elemento: se agrega un -1 al final.
+        return np.append(globales, -1)[codigos_locales]
+
+    def _columnas_almacen(self, almacenes):
+        """Columna del acumulador de cada fila según su almacén (-1 si no está mapeado)."""
+        almacenes = almacenes.astype('category')
+        por_categoria = np.array([self._columna_almacen.get(c, -1) for c in almacenes.cat.categories] + [-1], dtype=np.int64)
+        return por_categoria[almacenes.cat.codes.to_numpy()]
+
+    @property
+    def total_referencias(self):
+        return 0 if self._referencias is None else len(self._referencias)
+
+    def agregar(self, bloque):
+        self.registros += len(bloque)
+        referencias = self._codificar_referencias(bloque['REFERENCIA'])
+        columnas = self._columnas_almacen(bloque['CODALMACEN'])
+        stock = bloque['STOCK'].to_numpy(dtype=np.float64)
+        valor = stock * bloque['COSTO_PROMEDIO_UND'].to_numpy(dtype=np.float64)
+
+        validas = referencias >= 0
+        en_tienda = validas & (columnas >= 0)
+        base = referencias * self._ancho
+        indices = np.concatenate([base[validas], base[validas] + 1, base[en_tienda] + columnas[en_tienda]])
+        pesos = np.concatenate([stock[validas], valor[validas], stock[en_tienda]])
+
+        tamano = self.total_referencias * self._ancho
+        if tamano > len(self._acumulado):
+            # Crecimiento geométrico: pocas copias aunque aparezcan referencias nuevas en cada bloque.
+            nuevo = np.zeros(max(tamano, 2 * len(self._acumulado)))
+            nuevo[:len(self._acumulado)] = self._acumulado
+            self._acumulado = nuevo
+        self._acumulado[:tamano] += np.bincount(indices, weights=pesos, minlength=tamano)
+
+    def tabla(self):
+        """
+        DataFrame indexado por `Referencia` con `Costo` (promedio ponderado por stock,
+        entero) y una columna entera por tienda mapeada.
+        """
+        matriz = self._acumulado[:self.total_referencias * self._ancho].reshape(-1, self._ancho)
+        stock_total, valor_total = matriz[:, 0], matriz[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            costo = np.where(stock_total != 0, valor_total / stock_total, 0.0)
+        tabla = pd.DataFrame(
+            np.rint(matriz[:, 2:]).astype(np.int64), columns=self.tiendas,
+            index=(self._referencias if self._referencias is not None else pd.Index([], dtype=str)).rename('Referencia')
+        )
+        tabla.insert(0, 'Costo', costo.astype(np.int64))
+        return tabla
+
+
+def agregar_export(fuente, tamano_bloque=TAMANO_BLOQUE, mapeo_almacenes=ALMACEN_NOMBRE_MAPPING):
+    """Recorre el export completo en bloques y devuelve el `AgregadoInventario` resultante."""
+    agregado = AgregadoInventario(mapeo_almacenes)
+    for bloque in leer_bloques(fuente, tamano_bloque):
+        agregado.agregar(bloque)
+    return agregado
+
+
+def combinar_con_maestro(df_productos_maestro, agregado):
+    """
+    Reemplaza Costo y las columnas de stock por tienda del maestro con los agregados, con
+    un único join indexado por `Referencia`. Las referencias sin movimiento quedan en 0.
+    """
+    agregados = agregado.tabla()
+    df_maestro_base = df_productos_maestro.drop(columns=list(agregados.columns), errors='ignore')
+    claves = df_maestro_base['Referencia'].astype(str).str.strip()
+    df_actualizado = df_maestro_base.assign(Referencia=claves).join(agregados, on='Referencia')
+    df_actualizado[list(agregados.columns)] = df_actualizado[list(agregados.columns)].fillna(0).astype(int)
+    return df_actualizado
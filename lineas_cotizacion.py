@@ -0,0 +1,197 @@
+# lineas_cotizacion.py
+import numpy as np
+import pandas as pd
+
+COLUMNAS_LINEA = ['Referencia', 'Producto', 'Cantidad', 'Precio Unitario', 'Descuento (%)', 'Total', 'Stock', 'Costo']
+# Atributo de `LineasCotizacion` que guarda cada columna: arreglos para las numéricas,
+# que entran en los totales, y listas para el resto (se guardan tal cual llegan).
+_ARREGLOS = {'Cantidad': '_cantidad', 'Precio Unitario': '_precio', 'Descuento (%)': '_descuento', 'Costo': '_costo'}
+_LISTAS = {'Referencia': '_referencias', 'Producto': '_productos', 'Stock': '_stock'}
+CAPACIDAD_INICIAL = 16
+
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (ValueError, TypeError, OverflowError):
+        return 0
+
+
+def _decimal(valor):
+    try:
+        numero = float(valor or 0)
+    except (ValueError, TypeError):
+        return 0.0
+    return numero if numero == numero else 0.0  # NaN
+
+
+def _enteros(serie):
+    return pd.to_numeric(serie, errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+
+def _decimales(serie):
+    return pd.to_numeric(serie, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+class LineasCotizacion:
+    """
+    Líneas de una cotización guardadas por columnas: cantidad, precio, descuento y costo
+    en arreglos de NumPy; referencia, producto y stock en listas. Los acumulados
+    (`subtotal_bruto`, `descuento_total`, `costo_total`) se mantienen al agregar, editar
+    o eliminar una línea restando su aporte anterior y sumando el nuevo, sin recorrer
+    la cotización completa.
+
+    Un valor que no es numérico (o vacío) cuenta como 0. El total de cada línea no se
+    guarda: se calcula al leerla.
+    """
+    def __init__(self, items=()):
+        self._referencias = []
+        self._productos = []
+        self._stock = []
+        self._cantidad = np.zeros(CAPACIDAD_INICIAL, dtype=np.int64)
+        self._precio = np.zeros(CAPACIDAD_INICIAL, dtype=np.float64)
+        self._descuento = np.zeros(CAPACIDAD_INICIAL, dtype=np.float64)
+        self._costo = np.zeros(CAPACIDAD_INICIAL, dtype=np.float64)
+        self.subtotal_bruto = 0.0
+        self.descuento_total = 0.0
+        self.costo_total = 0.0
+        for item in items:
+            self.agregar(item)
+
+    # --- Lectura ---
+    def __len__(self):
+        return len(self._referencias)
+
+    def __iter__(self):
+        return iter(self.como_registros())
+
+    def __getitem__(self, indice):
+        return self._registro(range(len(self))[indice])
+
+    def referencias(self):
+        return list(self._referencias)
+
+    def _aporte(self, indice):
+        """(bruto, descuento, costo) con que la línea `indice` entra en los acumulados."""
+        cantidad = int(self._cantidad[indice])
+        bruto = cantidad * float(self._precio[indice])
+        return bruto, bruto * (float(self._descuento[indice]) / 100), cantidad * float(self._costo[indice])
+
+    def _registro(self, indice):
+        bruto, descuento, _ = self._aporte(indice)
+        return {
+            'Referencia': self._referencias[indice],
+            'Producto': self._productos[indice],
+            'Cantidad': int(self._cantidad[indice]),
+            'Precio Unitario': float(self._precio[indice]),
+            'Descuento (%)': float(self._descuento[indice]),
+            'Total': bruto - descuento,
+            'Stock': self._stock[indice],
+            'Costo': float(self._costo[indice]),
+        }
+
+    def _columnas(self):
+        n = len(self)
+        cantidad, precio = self._cantidad[:n], self._precio[:n]
+        bruto = cantidad * precio
+        return {
+            'Referencia': self._referencias,
+            'Producto': self._productos,
+            'Cantidad': cantidad,
+            'Precio Unitario': precio,
+            'Descuento (%)': self._descuento[:n],
+            'Total': bruto - bruto * (self._descuento[:n] / 100),
+            'Stock': self._stock,
+            'Costo': self._costo[:n],
+        }
+
+    def como_registros(self):
+        """Las líneas como lista de diccionarios (con tipos de Python), en orden."""
+        columnas = {nombre: list(valores) if isinstance(valores, list) else valores.tolist()
+                    for nombre, valores in self._columnas().items()}
+        return [dict(zip(COLUMNAS_LINEA, fila)) for fila in zip(*(columnas[c] for c in COLUMNAS_LINEA))]
+
+    def como_dataframe(self, columnas=COLUMNAS_LINEA):
+        """DataFrame armado directamente desde las columnas, sin pasar por diccionarios."""
+        datos = self._columnas()
+        return pd.DataFrame({nombre: datos[nombre] for nombre in columnas}, columns=list(columnas))
+
+    def a_columnas(self):
+        """Las columnas guardadas (sin 'Total', que se calcula) como listas, para serializar."""
+        return {columna: list(valores) if isinstance(valores, list) else valores.tolist()
+                for columna, valores in self._columnas().items() if columna != 'Total'}
+
+    @classmethod
+    def desde_columnas(cls, columnas):
+        """Inverso de `a_columnas`: arma las líneas de una vez y recalcula los acumulados."""
+        lineas = cls()
+        n = len(columnas.get('Referencia', []))
+        lineas._asegurar_capacidad(n)
+        for columna, atributo in _LISTAS.items():
+            setattr(lineas, atributo, list(columnas.get(columna, [None] * n)))
+        for columna, atributo in _ARREGLOS.items():
+            convertir = _enteros if columna == 'Cantidad' else _decimales
+            getattr(lineas, atributo)[:n] = convertir(pd.Series(columnas.get(columna, [0] * n), dtype=object))
+        lineas.resincronizar()
+        return lineas
+
+    # --- Escritura ---
+    def _sumar(self, indice, signo):
+        bruto, descuento, costo = self._aporte(indice)
+        self.subtotal_bruto += signo * bruto
+        self.descuento_total += signo * descuento
+        self.costo_total += signo * costo
+
+    def _asegurar_capacidad(self, cantidad):
+        if cantidad <= len(self._cantidad):
+            return
+        capacidad = max(cantidad, 2 * len(self._cantidad))
+        for nombre in _ARREGLOS.values():
+            actual = getattr(self, nombre)
+            nuevo = np.zeros(capacidad, dtype=actual.dtype)
+            nuevo[:len(self)] = actual[:len(self)]
+            setattr(self, nombre, nuevo)
+
+    def agregar(self, item):
+        """Agrega al final la línea `item` (diccionario con las columnas de `COLUMNAS_LINEA`)."""
+        indice = len(self)
+        self._asegurar_capacidad(indice + 1)
+        self._referencias.append(item.get('Referencia'))
+        self._productos.append(item.get('Producto'))
+        self._stock.append(item.get('Stock', 0))
+        self._cantidad[indice] = _entero(item.get('Cantidad', 0))
+        self._precio[indice] = _decimal(item.get('Precio Unitario', 0))
+        self._descuento[indice] = _decimal(item.get('Descuento (%)', 0))
+        self._costo[indice] = _decimal(item.get('Costo', 0))
+        self._sumar(indice, +1)
+
+    def actualizar(self, indice, cambios):
+        """Cambia las columnas de `cambios` en la línea `indice`; 'Total' se ignora (es calculado)."""
+        self._sumar(indice, -1)
+        for columna, valor in cambios.items():
+            if columna in _LISTAS:
+                getattr(self, _LISTAS[columna])[indice] = valor
+            elif columna in _ARREGLOS:
+                convertir = _entero if columna == 'Cantidad' else _decimal
+                getattr(self, _ARREGLOS[columna])[indice] = convertir(valor)
+        self._sumar(indice, +1)
+
+    def eliminar(self, indice):
+        n = len(self)
+        self._sumar(indice, -1)
+        for nombre in _LISTAS.values():
+            del getattr(self, nombre)[indice]
+        for arreglo in (getattr(self, nombre) for nombre in _ARREGLOS.values()):
+            arreglo[indice:n - 1] = arreglo[indice + 1:n]
+            arreglo[n - 1] = 0
+        if not self:
+            # Sin líneas no queda nada que sumar: se descarta el residuo de redondeo.
+            self.subtotal_bruto = self.descuento_total = self.costo_total = 0.0
+
+    def resincronizar(self):
+        """Recalcula los acumulados desde cero (vectorizado), p. ej. tras una carga masiva."""
+        n = len(self)
+        bruto = self._cantidad[:n] * self._precio[:n]
+        self.subtotal_bruto = float(bruto.sum())
+        self.descuento_total = float((bruto * (self._descuento[:n] / 100)).sum())
+        self.costo_total = float((self._cantidad[:n] * self._costo[:n]).sum())
@@ -1,16 +1,15 @@
 # pages/0_⚙️_Cotizador.py
 import streamlit as st
 import pandas as pd
-import gspread
-from gspread_dataframe import set_with_dataframe
-import dropbox
-import io
 import time
 import re
+from datetime import datetime
 
 # Importaciones de tus otros módulos (asegúrate de que existan)
-from state import QuoteState
+from state import estado_de_sesion, guardar_estado_sesion
 from utils import *
+from inventario import abrir_export_dropbox
+from sincronizacion import NOMBRES_ETAPAS
 
 # --- INICIO: CONFIGURACIÓN PARA LA ACTUALIZACIÓN DE DATOS ---
 
@@ -19,167 +18,59 @@ GOOGLE_SHEET_NAME = "Productos"
 # Nombre de la hoja específica a actualizar
 PRODUCTOS_SHEET_NAME = "Productos"
 
-# Mapeo completo de los códigos de almacén a los nombres de columna deseados.
-ALMACEN_NOMBRE_MAPPING = {
-    '155': 'Stock CEDI',
-    '156': 'Stock ARMENIA',
-    '157': 'Stock Manizales',
-    '158': 'Stock Opalo',
-    '189': 'Stock Olaya',
-    '238': 'Stock Laureles',
-    '439': 'Stock FerreBox',
-}
+# El mapeo de códigos de almacén a columnas de stock vive en `inventario.py`.
 
 # --- FIN: CONFIGURACIÓN PARA LA ACTUALIZACIÓN DE DATOS ---
 
 
 # --- INICIO: FUNCIONES PARA LA ACTUALIZACIÓN DE STOCK Y PRECIOS ---
 
-def download_csv_from_dropbox() -> io.StringIO | None:
+def abrir_export_configurado():
     """
-    Se conecta a Dropbox usando los secretos de Streamlit, descarga el archivo CSV
-    y lo devuelve como un objeto StringIO en memoria.
+    Devuelve la función que abre el export del ERP en Dropbox con los secretos de
+    Streamlit. Los secretos se leen aquí, en el hilo del script; la descarga ocurre
+    después, en el hilo de la sincronización.
     """
-    print("Intentando conectar y descargar desde Dropbox...")
-    try:
-        dbx_creds = st.secrets["dropbox"]
-        # Usa el refresh_token para obtener un token de acceso de corta duración
-        with dropbox.Dropbox(
-            app_key=dbx_creds["app_key"],
-            app_secret=dbx_creds["app_secret"],
-            oauth2_refresh_token=dbx_creds["refresh_token"]
-        ) as dbx:
-            # Comprobar la conexión
-            dbx.users_get_current_account()
-            print("Conexión a Dropbox exitosa.")
-
-            file_path = dbx_creds["file_path"]
-            print(f"Descargando archivo: {file_path}")
-            
-            _, res = dbx.files_download(path=file_path)
-            
-            # El contenido está en bytes, lo decodificamos a string con la codificación correcta
-            # y lo envolvemos en un StringIO para que pandas lo pueda leer como un archivo.
-            content = res.content.decode('latin1')
-            print(f"Archivo descargado exitosamente ({len(content)} bytes).")
-            return io.StringIO(content)
-
-    except dropbox.exceptions.AuthError as e:
-        st.error(f"Error de autenticación con Dropbox. Revisa tus tokens. Detalle: {e}")
-        print(f"Error de autenticación con Dropbox: {e}")
-        return None
-    except dropbox.exceptions.ApiError as e:
-        st.error(f"No se pudo encontrar o acceder al archivo en Dropbox. Revisa la ruta '{st.secrets['dropbox']['file_path']}'. Detalle: {e}")
-        print(f"Error de API de Dropbox: {e}")
-        return None
-    except Exception as e:
-        st.error(f"Ocurrió un error inesperado al conectar con Dropbox. Detalle: {e}")
-        print(f"Error inesperado en Dropbox: {e}")
-        return None
-
-
-def run_stock_and_price_update(workbook: gspread.Spreadsheet) -> tuple[bool, str]:
-    """
-    Orquesta todo el proceso de actualización:
-    1. Descarga el CSV de Dropbox.
-    2. Procesa los datos con Pandas.
-    3. Actualiza la hoja de Google Sheets.
-    Devuelve un tuple (éxito, mensaje).
-    """
-    st.toast("Iniciando descarga de datos desde Dropbox...", icon="📦")
-    csv_file_object = download_csv_from_dropbox()
-    if not csv_file_object:
-        return False, "Falló la descarga de datos desde Dropbox. No se pudo continuar."
-
-    # 2. Definir nombres de columna y leer el archivo CSV en memoria
-    nombres_columnas_csv = [
-        'DEPARTAMENTO', 'REFERENCIA', 'DESCRIPCION', 'MARCA', 'PESO_ARTICULO',
-        'UNIDADES_VENDIDAS', 'STOCK', 'COSTO_PROMEDIO_UND', 'CODALMACEN',
-        'LEAD_TIME_PROVEEDOR', 'HISTORIAL_VENTAS'
-    ]
-
-    try:
-        st.toast("Procesando archivo de datos...", icon="⚙️")
-        print("Leyendo el archivo CSV desde el objeto en memoria...")
-        df_crudo = pd.read_csv(
-            csv_file_object,
-            encoding='latin1',
-            delimiter='|',
-            header=None,
-            names=nombres_columnas_csv,
-            dtype={'REFERENCIA': str, 'CODALMACEN': str, 'STOCK': str, 'COSTO_PROMEDIO_UND': str}
-        )
-        df_crudo['CODALMACEN'] = df_crudo['CODALMACEN'].str.strip()
-        print(f"Se encontraron {len(df_crudo)} registros en el archivo de datos.")
-    except Exception as e:
-        return False, f"ERROR: No se pudo leer el archivo CSV. Causa: {e}"
-
-    # 3. Leer la hoja de Productos "maestra" actual de Google Sheets
-    try:
-        st.toast("Leyendo la hoja maestra de productos...", icon="📄")
-        print(f"Leyendo la hoja maestra '{PRODUCTOS_SHEET_NAME}' desde Google Sheets...")
-        productos_sheet = workbook.worksheet(PRODUCTOS_SHEET_NAME)
-        df_productos_maestro = pd.DataFrame(productos_sheet.get_all_records(numericise_ignore=['all']))
-        df_productos_maestro['Referencia'] = df_productos_maestro['Referencia'].astype(str).str.strip()
-        print(f"Se encontraron {len(df_productos_maestro)} productos en la hoja maestra.")
-    except gspread.exceptions.WorksheetNotFound:
-        return False, f"ERROR: No se encontró la hoja llamada '{PRODUCTOS_SHEET_NAME}'."
-    except Exception as e:
-        return False, f"ERROR: No se pudo leer la hoja de productos maestra. Causa: {e}"
-
-    # 4. Preparar y combinar la información
-    print("Iniciando transformación de datos...")
-    df_crudo['STOCK'] = pd.to_numeric(df_crudo['STOCK'], errors='coerce').fillna(0).astype(int)
-    df_crudo['COSTO_PROMEDIO_UND'] = pd.to_numeric(df_crudo['COSTO_PROMEDIO_UND'], errors='coerce').fillna(0)
-    df_crudo['VALOR_TOTAL_SKU'] = df_crudo['STOCK'] * df_crudo['COSTO_PROMEDIO_UND']
-
-    df_costo_agregado = df_crudo.groupby('REFERENCIA').agg(
-        Stock_Total=('STOCK', 'sum'),
-        Valor_Total_Inventario=('VALOR_TOTAL_SKU', 'sum')
-    ).reset_index()
-
-    df_costo_agregado['Costo'] = df_costo_agregado['Valor_Total_Inventario'] / df_costo_agregado['Stock_Total']
-    df_costo_agregado['Costo'].fillna(0, inplace=True)
-    df_costo_agregado['Costo'] = df_costo_agregado['Costo'].astype(int)
-    df_costo_agregado.rename(columns={'REFERENCIA': 'Referencia'}, inplace=True)
-
-    df_crudo['NOMBRE_TIENDA'] = df_crudo['CODALMACEN'].map(ALMACEN_NOMBRE_MAPPING)
-    df_crudo_mapeado = df_crudo.dropna(subset=['NOMBRE_TIENDA'])
-
-    if not df_crudo_mapeado.empty:
-        df_stock_por_tienda = df_crudo_mapeado.pivot_table(
-            index='REFERENCIA', columns='NOMBRE_TIENDA', values='STOCK',
-            aggfunc='sum', fill_value=0
-        ).reset_index()
-        df_stock_por_tienda.rename(columns={'REFERENCIA': 'Referencia'}, inplace=True)
-    else:
-        df_stock_por_tienda = pd.DataFrame(columns=['Referencia'])
-
-    columnas_a_eliminar = ['Costo'] + list(ALMACEN_NOMBRE_MAPPING.values())
-    df_maestro_base = df_productos_maestro.drop(columns=columnas_a_eliminar, errors='ignore')
+    dbx_creds = st.secrets["dropbox"]
+    credenciales = (dbx_creds["app_key"], dbx_creds["app_secret"], dbx_creds["refresh_token"], dbx_creds["file_path"])
+    return lambda: abrir_export_dropbox(*credenciales)
 
-    df_actualizado = pd.merge(df_maestro_base, df_costo_agregado[['Referencia', 'Costo']], on='Referencia', how='left')
-    df_actualizado = pd.merge(df_actualizado, df_stock_por_tienda, on='Referencia', how='left')
 
-    columnas_posibles_stock = list(ALMACEN_NOMBRE_MAPPING.values())
-    columnas_existentes_stock = [col for col in columnas_posibles_stock if col in df_actualizado.columns]
+@st.fragment(run_every=2)
+def avance_sincronizacion(trabajo):
+    """
+    Barra de avance de un trabajo en curso. Se vuelve a ejecutar cada 2 segundos por su
+    cuenta, sin recargar el resto de la página; cuando el trabajo termina recarga la
+    página, que ya no dibuja este fragmento y deja de consultar.
+    """
+    resumen = trabajo.resumen()
+    if resumen['estado'] != 'en_curso':
+        st.rerun(scope="app")
+    transcurrido = int(time.time() - resumen['iniciado'])
+    st.progress(
+        resumen['progreso'],
+        text=f"🔄 {NOMBRES_ETAPAS[resumen['etapa']]}... {resumen['registros']:,} registros · {transcurrido} s"
+    )
 
-    if columnas_existentes_stock:
-        df_actualizado[columnas_existentes_stock] = df_actualizado[columnas_existentes_stock].fillna(0).astype(int)
-    
-    df_actualizado['Costo'] = df_actualizado['Costo'].fillna(0).astype(int)
-    print("Datos combinados y listos para subir.")
 
-    # 5. Escribir el DataFrame final de vuelta a Google Sheets
-    try:
-        st.toast("Actualizando base de datos en la nube... ¡Casi listo!", icon="☁️")
-        print(f"Actualizando la hoja '{PRODUCTOS_SHEET_NAME}' en Google Sheets...")
-        productos_sheet.clear()
-        set_with_dataframe(productos_sheet, df_actualizado, include_index=False, resize=True, allow_formulas=False)
-        print("--- ✅ ¡Actualización completada exitosamente! ---")
-        return True, "¡Éxito! Los precios y stocks han sido actualizados."
-    except Exception as e:
-        return False, f"ERROR: No se pudo escribir en Google Sheets. Causa: {e}"
+def panel_sincronizacion(ejecutor):
+    """
+    Muestra el último trabajo de sincronización: su avance mientras corre (el único caso
+    en que la página consulta periódicamente) o el resultado cuando terminó.
+    """
+    trabajo = ejecutor.actual()
+    if trabajo is None:
+        return
+    resumen = trabajo.resumen()
+    if resumen['estado'] == 'en_curso':
+        avance_sincronizacion(trabajo)
+        return
+    if resumen['estado'] == 'completado':
+        st.success(resumen['mensaje'])
+    else:
+        st.error(resumen['mensaje'])
+    tiempos = " · ".join(f"{etapa} {segundos:.1f} s" for etapa, segundos in resumen['tiempos'].items())
+    st.caption(f"Última sincronización: {datetime.fromtimestamp(resumen['terminado']):%H:%M} · {tiempos}")
 
 
 # --- FIN: FUNCIONES PARA LA ACTUALIZACIÓN DE STOCK Y PRECIOS ---
@@ -250,16 +141,14 @@ st.markdown("""
 st.title("🔩 Cotizador Profesional Ferreinox")
 st.markdown("Herramienta de alta eficiencia para la creación y gestión de propuestas comerciales.")
 
-# Conexión principal a Google Sheets (usada por todo el cotizador)
-workbook = connect_to_gsheets()
-if not workbook:
+# Conexión principal al almacenamiento (usada por todo el cotizador)
+repositorio = conectar_almacenamiento()
+if not repositorio:
     st.error("La aplicación no puede continuar sin conexión a la base de datos.")
     st.stop()
 
-# Inicialización del estado de la cotización
-if 'state' not in st.session_state:
-    st.session_state.state = QuoteState()
-state = st.session_state.state
+# Inicialización del estado de la cotización (recuperado del almacén de sesiones si hay uno)
+state = estado_de_sesion(conectar_almacen_sesiones())
 
 # --- ESTADOS PARA LA BÚSQUEDA ---
 if 'search_query' not in st.session_state:
@@ -271,7 +160,7 @@ if 'selected_product_string' not in st.session_state:
 # --- Lógica para cargar cotizaciones ---
 if st.session_state.get('load_quote'):
     numero_a_cargar = st.session_state.pop('load_quote')
-    state.cargar_desde_gheets(numero_a_cargar, workbook)
+    state.cargar_desde_gheets(numero_a_cargar, repositorio)
     st.rerun()
 
 # --- BARRA LATERAL DE CONTROLES ---
@@ -293,21 +182,29 @@ with st.sidebar:
 
     # --- INICIO: SECCIÓN DE ADMINISTRACIÓN CON EL BOTÓN DE ACTUALIZACIÓN ---
     st.markdown("#### 🗂️ Administración")
-    if st.button("🔄 Actualizar Precios y Stocks", use_container_width=True, help="Sincroniza los datos de productos desde Dropbox a la base de datos en la nube."):
-        with st.spinner("Iniciando actualización completa... Este proceso puede tardar unos segundos. Por favor, espera."):
-            success, message = run_stock_and_price_update(workbook)
-        
-        if success:
-            st.success(message)
-            time.sleep(2)  # Pausa para que el usuario lea el mensaje
-            st.cache_data.clear()  # Limpia la caché para forzar la recarga de datos
-            st.rerun()
-        else:
-            st.error(message)
+    ejecutor = obtener_ejecutor_sincronizacion()
+    if st.button("🔄 Actualizar Precios y Stocks", use_container_width=True, help="Sincroniza los datos de productos desde Dropbox a la base de datos en la nube. Corre en segundo plano."):
+        try:
+            # Al terminar publica un snapshot con los precios nuevos.
+            _, iniciado = ejecutor.iniciar(repositorio, abrir_export_configurado(), refresco_maestros_diferido(repositorio))
+            if not iniciado:
+                st.info("Ya hay una actualización en curso; se muestra su avance.")
+        except KeyError:
+            st.error("Error de configuración: falta la sección [dropbox] (app_key, app_secret, refresh_token, file_path) en secrets.toml.")
+    panel_sincronizacion(ejecutor)
     # --- FIN: SECCIÓN DE ADMINISTRACIÓN ---
 
 # Carga de datos maestros (ahora se benefician de la limpieza de caché)
-df_productos, df_clientes = cargar_datos_maestros(workbook)
+df_productos, df_clientes = cargar_datos_maestros(repositorio)
+
+with st.sidebar:
+    snapshot = obtener_snapshot_maestros()
+    if snapshot.existe():
+        edad_min = int(snapshot.edad() // 60)
+        estado_snapshot = " · actualizando..." if snapshot.refrescando() else ""
+        st.caption(f"🗄️ Datos maestros v{snapshot.version} · hace {edad_min} min{estado_snapshot}")
+    if snapshot.ultimo_error:
+        st.caption(f"⚠️ Último refresco fallido: {snapshot.ultimo_error}")
 
 # --- PASO 1: CLIENTE ---
 st.markdown("<h2 class='section-header'>👤 1. Datos del Cliente</h2>", unsafe_allow_html=True)
@@ -345,7 +242,7 @@ with st.container(border=True):
                     # --- INICIO DE LA CORRECCIÓN ---
                     # Se ajusta la llamada para recibir los 3 valores que devuelve la función.
                     exito, mensaje, nuevo_cliente_info = crear_nuevo_cliente(
-                        workbook,
+                        repositorio,
                         nombre=nombre, nif=nif, email=email,
                         telefono=telefono, direccion=direccion
                     )
@@ -358,7 +255,6 @@ with st.container(border=True):
                     if nuevo_cliente_info:
                         state.set_cliente(nuevo_cliente_info)
                     
-                    st.cache_data.clear() # Se limpia la caché para recargar la lista de clientes.
                     time.sleep(2) # Pausa para que el usuario vea el mensaje de éxito.
                     st.rerun() # Se refresca la app para que el selectbox se actualice.
                     # --- FIN DE LA CORRECCIÓN ---
@@ -422,22 +318,17 @@ with st.container(border=True):
             st.session_state.search_query, df_productos, categoria_seleccionada
         )
 
+        # Precios, costo y stock por tienda precalculados al cargar el catálogo, indexados por referencia.
+        catalogo = catalogo_productos(df_productos)
         producto_seleccionado = None
         if not resultados.empty:
             options_dict = {"-- Elige un producto de los resultados --": None}
-            
-            # Se ajusta el nombre de la tienda para que coincida con el nombre de la columna en el DataFrame.
-            # Por ejemplo, si se selecciona "CEDI", se buscará la columna "Stock CEDI".
-            stock_col_name = state.tienda_despacho
-            if stock_col_name and not stock_col_name.startswith('Stock '):
-                stock_col_name = 'Stock ' + stock_col_name
-            
-            for _, row in resultados.head(50).iterrows():
-                # Se utiliza la variable corregida 'stock_col_name' para obtener el stock disponible.
-                # Si no hay tienda seleccionada, el stock será 0.
-                stock_disponible = row.get(stock_col_name, 0) if stock_col_name else 0
-                option_string = f"{row[NOMBRE_PRODUCTO_COL]} | Ref: {row['Referencia']} | Stock: {stock_disponible}"
-                options_dict[option_string] = row['Referencia']
+
+            # Stock de la tienda de despacho (0 si no hay tienda seleccionada) de los primeros 50 resultados.
+            primeros = resultados.head(50)
+            stocks = catalogo.stock_de_filas(primeros.index, state.tienda_despacho)
+            for nombre, referencia, stock_disponible in zip(primeros[NOMBRE_PRODUCTO_COL].tolist(), primeros['Referencia'].tolist(), stocks):
+                options_dict[f"{nombre} | Ref: {referencia} | Stock: {stock_disponible}"] = referencia
 
             selected_option = st.selectbox(
                 f"**Resultados de la búsqueda ({len(resultados)} encontrados):**",
@@ -446,9 +337,7 @@ with st.container(border=True):
             
             selected_ref = options_dict[selected_option]
             if selected_ref:
-                producto_seleccionado_df = resultados[resultados['Referencia'] == selected_ref]
-                if not producto_seleccionado_df.empty:
-                    producto_seleccionado = producto_seleccionado_df.iloc[0]
+                producto_seleccionado = catalogo.producto(selected_ref)
 
         elif st.session_state.search_query:
             st.warning("No se encontraron productos para tu búsqueda.")
@@ -460,17 +349,12 @@ with st.container(border=True):
         if producto_seleccionado is not None:
             st.markdown(f"#### Producto Seleccionado")
             
-            opciones_precio = {}
-            for col_name in PRECIOS_COLS:
-                raw_price = producto_seleccionado.get(col_name)
-                parsed_price = parse_price(raw_price)
-                if parsed_price > 0:
-                    opciones_precio[col_name] = parsed_price
+            opciones_precio = producto_seleccionado.opciones_precio()
 
             col_info, col_actions = st.columns([3, 2])
             with col_info:
-                st.markdown(f"**{producto_seleccionado[NOMBRE_PRODUCTO_COL]}**")
-                st.caption(f"Referencia: {producto_seleccionado['Referencia']}")
+                st.markdown(f"**{producto_seleccionado.descripcion}**")
+                st.caption(f"Referencia: {producto_seleccionado.referencia}")
             
             with col_actions:
                 if not opciones_precio:
@@ -479,15 +363,15 @@ with st.container(border=True):
                     precio_sel_str = st.radio(
                         "Lista de Precio:", options=opciones_precio.keys(),
                         format_func=lambda key: f"{key}: ${opciones_precio[key]:,.2f}",
-                        horizontal=True, key=f"price_{producto_seleccionado['Referencia']}"
+                        horizontal=True, key=f"price_{producto_seleccionado.referencia}"
                     )
                     cantidad = st.number_input(
                         "Cantidad:", min_value=1, value=1, step=1,
-                        key=f"qty_{producto_seleccionado['Referencia']}"
+                        key=f"qty_{producto_seleccionado.referencia}"
                     )
                     if st.button("➕ Agregar a la Cotización", type="primary", use_container_width=True, disabled=not state.tienda_despacho):
-                        state.agregar_item(producto_seleccionado.to_dict(), cantidad, opciones_precio[precio_sel_str])
-                        st.toast(f"✅ Añadido: {producto_seleccionado[NOMBRE_PRODUCTO_COL]}", icon="🎉")
+                        state.agregar_producto(producto_seleccionado, cantidad, opciones_precio[precio_sel_str])
+                        st.toast(f"✅ Añadido: {producto_seleccionado.descripcion}", icon="🎉")
                         time.sleep(1)
                         st.rerun()
 
@@ -496,15 +380,19 @@ with st.container(border=True):
 # ==============================================================================
 st.markdown("<h2 class='section-header'>📝 4. Resumen y Generación</h2>", unsafe_allow_html=True)
 with st.container(border=True):
-    if not state.cotizacion_items:
+    if not state.lineas:
         st.info("Cuando agregues productos, aparecerán aquí para que puedas editar las cantidades, precios y descuentos.")
     else:
         st.markdown("#### Items de la Cotización")
-        df_items = pd.DataFrame(state.cotizacion_items)
         columnas_visibles = ['Referencia', 'Producto', 'Cantidad', 'Precio Unitario', 'Descuento (%)', 'Total']
-        df_display = df_items[columnas_visibles]
+        df_display = state.lineas.como_dataframe(columnas_visibles)
+
+        # Los cambios se aplican en el callback con las diferencias que deja el editor en
+        # `st.session_state`; al cambiar los datos el editor se reinicia con las líneas nuevas.
+        def aplicar_edicion_items():
+            state.aplicar_cambios_editor(st.session_state.data_editor_items)
 
-        edited_df = st.data_editor(
+        st.data_editor(
             df_display,
             column_config={
                 "Referencia": st.column_config.TextColumn(disabled=True),
@@ -514,11 +402,8 @@ with st.container(border=True):
                 "Descuento (%)": st.column_config.NumberColumn(label="Desc. %", min_value=0, max_value=100, step=1, format="%.1f%%", required=True),
                 "Total": st.column_config.NumberColumn(label="Total", format="$%.2f", disabled=True),
             },
-            use_container_width=True, hide_index=True, num_rows="dynamic", key="data_editor_items")
-        
-        if edited_df.to_dict('records') != df_display.to_dict('records'):
-            state.actualizar_items_desde_vista(edited_df)
-            st.rerun()
+            use_container_width=True, hide_index=True, num_rows="dynamic", key="data_editor_items",
+            on_change=aplicar_edicion_items)
 
         st.divider()
         st.markdown("#### Resumen Financiero")
@@ -536,34 +421,42 @@ with st.container(border=True):
         with col_status:
             idx_status = ESTADOS_COTIZACION.index(state.status) if state.status in ESTADOS_COTIZACION else 0
             state.status = st.selectbox("Establecer Estado de la Propuesta:", options=ESTADOS_COTIZACION, index=idx_status, on_change=state.persist_to_session)
+        # Las observaciones y el estado se asignan sin pasar por un setter: se marca el
+        # borrador para el autoguardado (no escribe nada si no cambió).
+        guardar_estado_sesion(state)
 
         if state.cliente_actual:
             st.divider()
             st.subheader("Acciones Finales")
             col_accion1, col_accion2 = st.columns([2, 1])
-            col_accion2.button("💾 Guardar Cambios en la Nube", use_container_width=True, type="primary", on_click=handle_save, args=(workbook, state))
+            col_accion2.button("💾 Guardar Cambios en la Nube", use_container_width=True, type="primary", on_click=handle_save, args=(repositorio, state))
 
-            pdf_bytes = generar_pdf_profesional(state, workbook)
-            pdf_prefix = "Pedido" if state.status == "Aceptada" else "Propuesta"
-            nombre_archivo_pdf = f"{pdf_prefix}_{state.numero_propuesta.replace('TEMP-', 'BORRADOR-')}.pdf"
+            # El PDF se genera sólo cuando una acción lo necesita y se reutiliza mientras el contenido no cambie.
+            obtener_pdf = pdf_bajo_demanda(state, repositorio)
+            archivo_pdf = nombre_archivo_pdf(state)
 
             st.divider()
             st.subheader("Documento y Envío por Correo")
             col_pdf, col_email = st.columns(2)
 
+            error_pdf = pdf_fallido(state)
+            if error_pdf:
+                col_pdf.error("No se pudo generar el PDF de esta cotización. Revise los datos y vuelva a intentarlo.")
             col_pdf.download_button(
-                label="📄 Descargar PDF", data=pdf_bytes,
-                file_name=nombre_archivo_pdf, mime="application/pdf", use_container_width=True,
-                disabled=(pdf_bytes is None)
+                label="📄 Descargar PDF", data=datos_descarga_pdf(obtener_pdf),
+                file_name=archivo_pdf, mime="application/pdf", use_container_width=True,
+                on_click="ignore", disabled=error_pdf
             )
             with col_email:
                 email_cliente = st.text_input("Enviar a:", value=state.cliente_actual.get(CLIENTE_EMAIL_COL, ""))
-                if st.button("📧 Enviar por Email", use_container_width=True, disabled=(pdf_bytes is None)):
+                if st.button("📧 Enviar por Email", use_container_width=True):
                     if email_cliente:
                         with st.spinner("Enviando correo..."):
-                            exito, mensaje = enviar_email_seguro(email_cliente, state, pdf_bytes, nombre_archivo_pdf)
-                            if exito: st.success(mensaje)
-                            else: st.error(mensaje)
+                            pdf_bytes = obtener_pdf()
+                            if pdf_bytes is not None:
+                                exito, mensaje = enviar_email_seguro(email_cliente, state, pdf_bytes, archivo_pdf)
+                                if exito: st.success(mensaje)
+                                else: st.error(mensaje)
                     else:
                         st.warning("Por favor, ingrese un correo electrónico de destino.")
 
@@ -575,9 +468,13 @@ with st.container(border=True):
                 value=state.cliente_actual.get("Teléfono", "")
             )
             
-            if st.button("🚀 Preparar y Compartir por WhatsApp", use_container_width=True, type="primary", disabled=(not telefono_cliente or pdf_bytes is None)):
+            if st.button("🚀 Preparar y Compartir por WhatsApp", use_container_width=True, type="primary", disabled=(not telefono_cliente)):
                 with st.spinner("Subiendo PDF y preparando mensaje..."):
-                    exito_drive, resultado_drive = guardar_pdf_en_drive(workbook, pdf_bytes, nombre_archivo_pdf)
+                    pdf_bytes = obtener_pdf()
+                    if pdf_bytes is None:
+                        exito_drive, resultado_drive = False, "No se pudo generar el PDF para compartirlo."
+                    else:
+                        exito_drive, resultado_drive = guardar_pdf_en_drive(repositorio, pdf_bytes, archivo_pdf)
                     if exito_drive:
                         file_id = resultado_drive
                         link_pdf_publico = f"https://drive.google.com/file/d/{file_id}/view"
@@ -3,17 +3,19 @@ import streamlit as st
 import pandas as pd
 from state import QuoteState
 from utils import *
+from exportacion_pdf import exportar_pdfs_zip
 from datetime import datetime, date
+from io import BytesIO
 
 st.set_page_config(page_title="Consulta de Propuestas", page_icon="📄", layout="wide")
 st.title("📄 Consulta y Gestión de Propuestas")
 
-workbook = connect_to_gsheets()
-if not workbook:
+repositorio = conectar_almacenamiento()
+if not repositorio:
     st.error("No se puede conectar a la base de datos para consultar propuestas.")
     st.stop()
 
-df_propuestas = listar_propuestas_df(workbook)
+df_propuestas = listar_propuestas_df(repositorio)
 
 if df_propuestas.empty:
     st.warning("No se encontraron propuestas guardadas o no se pudieron cargar.")
@@ -67,7 +69,7 @@ else:
             st.success(f"Propuesta seleccionada: **{prop_seleccionada}**")
             
             temp_state = QuoteState()
-            cargado_ok = temp_state.cargar_desde_gheets(prop_seleccionada, workbook, silent=True)
+            cargado_ok = temp_state.cargar_desde_gheets(prop_seleccionada, repositorio, silent=True, persistir=False)
             
             if cargado_ok:
                 st.subheader("Acciones Principales")
@@ -77,25 +79,32 @@ else:
                     st.session_state['load_quote'] = prop_seleccionada
                     st.switch_page("pages/0_⚙️_Cotizador.py")
                 
-                pdf_bytes_consulta = generar_pdf_profesional(temp_state, workbook)
+                obtener_pdf_consulta = pdf_bajo_demanda(temp_state, repositorio)
                 nombre_archivo_pdf_consulta = f"Propuesta_{prop_seleccionada}.pdf"
                 
+                error_pdf_consulta = pdf_fallido(temp_state)
+                if error_pdf_consulta:
+                    col_pdf.error("No se pudo generar el PDF de esta cotización. Revise los datos y vuelva a intentarlo.")
                 col_pdf.download_button(
                     label="📄 Descargar PDF",
-                    data=pdf_bytes_consulta,
+                    data=datos_descarga_pdf(obtener_pdf_consulta),
                     file_name=nombre_archivo_pdf_consulta,
+                    mime="application/pdf",
                     use_container_width=True,
-                    disabled=(pdf_bytes_consulta is None)
+                    on_click="ignore",
+                    disabled=error_pdf_consulta
                 )
                 
                 with col_mail:
-                    if st.button("📧 Enviar Copia por Email", use_container_width=True, disabled=(pdf_bytes_consulta is None)):
+                    if st.button("📧 Enviar Copia por Email", use_container_width=True):
                         email_cliente = temp_state.cliente_actual.get(CLIENTE_EMAIL_COL, '')
                         if email_cliente:
                             with st.spinner("Enviando correo..."):
-                                exito, mensaje = enviar_email_seguro(email_cliente, temp_state, pdf_bytes_consulta, nombre_archivo_pdf_consulta, is_copy=True)
-                                if exito: st.success(mensaje)
-                                else: st.error(mensaje)
+                                pdf_bytes_consulta = obtener_pdf_consulta()
+                                if pdf_bytes_consulta is not None:
+                                    exito, mensaje = enviar_email_seguro(email_cliente, temp_state, pdf_bytes_consulta, nombre_archivo_pdf_consulta, is_copy=True)
+                                    if exito: st.success(mensaje)
+                                    else: st.error(mensaje)
                         else:
                             st.warning("Cliente sin email registrado para enviar copia.")
                 
@@ -112,9 +121,10 @@ else:
                 whatsapp_placeholder_consulta = st.empty()
 
                 if st.button("🚀 Preparar y Enviar por WhatsApp", use_container_width=True, type="primary", disabled=(not telefono_consulta), key="consulta_btn_ws"):
+                    pdf_bytes_consulta = obtener_pdf_consulta()
                     if pdf_bytes_consulta:
                         with st.spinner("Subiendo PDF y preparando mensaje..."):
-                            exito_drive, resultado_drive = guardar_pdf_en_drive(workbook, pdf_bytes_consulta, nombre_archivo_pdf_consulta)
+                            exito_drive, resultado_drive = guardar_pdf_en_drive(repositorio, pdf_bytes_consulta, nombre_archivo_pdf_consulta)
                             
                             if exito_drive:
                                 file_id = resultado_drive
@@ -133,3 +143,54 @@ else:
 
             else:
                 st.error(f"No se pudieron cargar los detalles completos para la propuesta {prop_seleccionada}.")
+
+    # --- EXPORTACIÓN MASIVA DE PDF ---
+    st.header("📦 Exportación Masiva de PDF")
+    if not df_filtrado.empty and 'numero_propuesta' in df_filtrado.columns:
+        with st.container(border=True):
+            estados_exportar = st.multiselect(
+                "Estados a exportar:", options=ESTADOS_COTIZACION, default=["Aceptada"], key="exportacion_estados"
+            )
+            df_exportar = df_filtrado[df_filtrado['status'].isin(estados_exportar)] if 'status' in df_filtrado.columns else df_filtrado.iloc[0:0]
+            numeros_exportar = df_exportar['numero_propuesta'].astype(str).tolist()
+            st.caption(f"{len(numeros_exportar)} propuesta(s) con los filtros de cliente y fecha de arriba.")
+
+            if st.button("🗜️ Generar ZIP con los PDF", use_container_width=True, disabled=not numeros_exportar, key="exportacion_btn"):
+                with st.spinner("Cargando propuestas..."):
+                    df_props_lote, df_items_lote = repositorio.obtener_propuestas(numeros_exportar)
+                    productos_df, clientes_df = cargar_datos_maestros(repositorio)
+                    items_por_numero = dict(tuple(df_items_lote.groupby('numero_propuesta', sort=False))) if not df_items_lote.empty else {}
+                # Las cotizaciones se arman a medida que el pool las pide, no todas de antemano.
+                states_lote = (
+                    QuoteState.desde_propuesta(fila, items_por_numero.get(fila['numero_propuesta'], pd.DataFrame()), productos_df, clientes_df)
+                    for fila in df_props_lote.to_dict('records')
+                )
+                barra = st.progress(0.0, text="Generando PDF...")
+                total = len(df_props_lote)
+                # En memoria: la descarga lee el ZIP completo igual, y así no quedan archivos
+                # temporales de sesiones abandonadas; el ZIP se libera con la sesión.
+                st.session_state.pop('exportacion_pdf', None)
+                destino = BytesIO()
+                resumen = exportar_pdfs_zip(
+                    states_lote, destino,
+                    al_avanzar=lambda terminados: barra.progress(terminados / total, text=f"Generando PDF... {terminados}/{total}")
+                )
+                barra.empty()
+                st.session_state['exportacion_pdf'] = {
+                    'datos': destino.getvalue(), 'nombre': f"Propuestas_{datetime.now().strftime('%Y%m%d_%H%M')}.zip", 'resumen': resumen
+                }
+
+            exportacion = st.session_state.get('exportacion_pdf')
+            if exportacion:
+                resumen = exportacion['resumen']
+                st.success(
+                    f"{resumen['documentos']} PDF generados en {resumen['segundos']:.1f} s "
+                    f"({resumen['documentos_por_segundo']:.1f} documentos/s)."
+                )
+                if resumen['fallidos']:
+                    st.warning(f"No se pudo generar el PDF de: {', '.join(resumen['fallidos'])}")
+                st.download_button(
+                    label="⬇️ Descargar ZIP", data=exportacion['datos'],
+                    file_name=exportacion['nombre'], mime="application/zip",
+                    use_container_width=True, on_click="ignore", key="exportacion_descarga"
+                )
@@ -2,7 +2,10 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils import connect_to_gsheets, listar_propuestas_df, listar_detalle_propuestas_df, parse_price
+from utils import (
+    conectar_almacenamiento, listar_propuestas_df, listar_detalle_propuestas_df, parse_price,
+    clave_datos, PROPUESTAS_SHEET_NAME, DETALLE_PROPUESTAS_SHEET_NAME
+)
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(page_title="Centro de Control Comercial", page_icon="🚀", layout="wide")
@@ -10,15 +13,16 @@ st.title("🚀 Centro de Control Comercial")
 st.markdown("Análisis de rendimiento de ventas, márgenes y oportunidades.")
 
 # --- CONEXIÓN Y CARGA DE DATOS ---
-workbook = connect_to_gsheets()
-if not workbook:
+repositorio = conectar_almacenamiento()
+if not repositorio:
     st.error("La aplicación no puede continuar sin conexión a la base de datos.")
     st.stop()
 
-@st.cache_data(ttl=300)
-def cargar_y_preparar_datos():
-    df_propuestas = listar_propuestas_df(workbook)
-    df_items = listar_detalle_propuestas_df(workbook)
+@st.cache_data(max_entries=2)
+def cargar_y_preparar_datos(claves):
+    # `claves` sólo cambia cuando alguna de las dos hojas cambió (ver `clave_datos`).
+    df_propuestas = listar_propuestas_df(repositorio)
+    df_items = listar_detalle_propuestas_df(repositorio)
     
     if df_propuestas.empty or df_items.empty:
         return pd.DataFrame(), pd.DataFrame()
@@ -48,7 +52,9 @@ def cargar_y_preparar_datos():
             
     return df_propuestas, df_items
 
-df_propuestas, df_items = cargar_y_preparar_datos()
+df_propuestas, df_items = cargar_y_preparar_datos((
+    clave_datos(repositorio, PROPUESTAS_SHEET_NAME), clave_datos(repositorio, DETALLE_PROPUESTAS_SHEET_NAME)
+))
 
 if df_propuestas.empty:
     st.warning("No hay datos de propuestas para analizar o ocurrió un error al cargar.")
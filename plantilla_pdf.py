@@ -0,0 +1,210 @@
+# plantilla_pdf.py
+"""
+Partes fijas de los PDF (pie de página, logo, fuentes) preparadas una vez y reutilizadas.
+
+Limitaciones:
+- Usa internos de fpdf2 que no son API pública: el flujo de contenido de cada página
+  (`pages[n].contents`), el catálogo de recursos (`_resource_catalog`) y atributos de
+  `TTFFont` (`_hbfont`, `subset`, `desc`, ...). Por eso requirements.txt fija
+  `fpdf2==2.8.9`; antes de subir la versión hay que volver a generar y revisar los PDF.
+- El pie grabado sólo se reutiliza entre documentos con fuentes estándar. La app usa
+  fuentes TrueType, que fpdf2 subconjunta por documento: ahí la grabación sirve para las
+  páginas del documento que la hizo, no para los siguientes. Entre documentos se
+  reutilizan la fuente ya analizada y reducida y la imagen del logo ya decodificada.
+"""
+import copy
+import io
+import re
+import threading
+from collections import defaultdict
+
+from fontTools import subset, ttLib
+from fpdf import FPDF
+from fpdf.enums import PDFResourceType, TextEmphasis
+from fpdf.fonts import CoreFont, SubsetMap, TTFFont
+from fpdf.image_datastructures import ImageCache
+from fpdf.image_parsing import preload_image
+
+from recursos_imagen import imagen_escalada
+
+_FUENTE_EN_FLUJO = re.compile(rb"/F(\d+)\s+[-+]?\d+(?:\.\d+)?\s+Tf")
+
+# Caracteres que se conservan de cada fuente TrueType: latín completo, griego, cirílico,
+# puntuación, monedas, símbolos de letras, flechas, operadores, figuras geométricas y
+# dingbats (✓, ✗). El resto (árabe, hebreo, braille, ...) sólo encarece el recorte que se hace al guardar.
+RANGOS_UNICODE_PDF = (
+    (0x0020, 0x052F), (0x1E00, 0x1EFF), (0x2000, 0x20CF), (0x2100, 0x218F),
+    (0x2190, 0x21FF), (0x2200, 0x22FF), (0x25A0, 0x25FF), (0x2700, 0x27BF),
+)
+# Tablas que el PDF no usa (fpdf2 no aplica ligaduras ni kerning) y el hinting.
+TABLAS_DESCARTADAS = ['GSUB', 'GPOS', 'GDEF', 'kern', 'hdmx', 'FFTM', 'MATH']
+
+# Recursos compartidos por todos los documentos del proceso.
+_lock = threading.Lock()
+_imagenes = {}
+_fuentes = {}
+_plantillas = {}
+
+
+def imagen_precargada(ruta, ancho_px=None):
+    """
+    Imagen escalada a `ancho_px`, decodificada y comprimida una sola vez por proceso,
+    lista para sembrarse en cualquier documento con `DocumentoConPlantilla.sembrar_imagen`.
+    Se vuelve a preparar cuando cambia el archivo de origen.
+    """
+    clave = (str(ruta), ancho_px)
+    datos = imagen_escalada(ruta, ancho_px)
+    with _lock:
+        guardada = _imagenes.get(clave)
+    # `imagen_escalada` devuelve el mismo objeto mientras el archivo no cambie.
+    if guardada is None or guardada[0] is not datos:
+        _, _, info = preload_image(ImageCache(), io.BytesIO(datos))
+        guardada = (datos, info)
+        with _lock:
+            _imagenes[clave] = guardada
+    return guardada[1]
+
+
+def _reducir_fuente(ruta):
+    """Bytes de la fuente con sólo `RANGOS_UNICODE_PDF`, sin hinting ni tablas de maquetación."""
+    fuente = ttLib.TTFont(str(ruta), recalcTimestamp=False)
+    opciones = subset.Options(
+        hinting=False, notdef_outline=True, recommended_glyphs=True, glyph_names=True,
+        name_IDs=['*'], name_languages=['*'], layout_features=[]
+    )
+    opciones.drop_tables += TABLAS_DESCARTADAS
+    recorte = subset.Subsetter(opciones)
+    recorte.populate(unicodes=[codigo for inicio, fin in RANGOS_UNICODE_PDF for codigo in range(inicio, fin + 1)])
+    recorte.subset(fuente)
+    salida = io.BytesIO()
+    fuente.save(salida)
+    return salida.getvalue()
+
+
+def fuente_precargada(ruta):
+    """
+    (fuente TrueType ya analizada, bytes de la fuente reducida), una sola vez por proceso:
+    la reducción, las métricas, el mapa de caracteres y los anchos no se recalculan en
+    cada documento.
+    """
+    clave = str(ruta)
+    with _lock:
+        precargada = _fuentes.get(clave)
+    if precargada is None:
+        datos = _reducir_fuente(ruta)
+        precargada = (TTFFont(FPDF(), io.BytesIO(datos), "precarga", ""), datos)
+        with _lock:
+            _fuentes[clave] = precargada
+    return precargada
+
+
+class DocumentoConPlantilla(FPDF):
+    """
+    FPDF con partes fijas reutilizables. `dibujar_fijo` graba una sola vez el flujo de
+    contenido que produce un bloque que no cambia entre páginas (p. ej. el pie con las
+    direcciones de las tiendas) y en las páginas siguientes sólo lo vuelve a insertar,
+    sin recalcular celdas ni cortes de línea. Las imágenes se siembran ya decodificadas.
+
+    El flujo grabado nombra las fuentes por su número en el documento (`/F2`), así que
+    las fuentes se registran en un orden fijo al crear el documento. Hasta dónde se
+    reutiliza la grabación y de qué versión de fpdf2 depende: ver el docstring del módulo.
+    """
+    # Permite desactivar la reutilización, p. ej. para comparar en los benchmarks.
+    reutilizar_plantilla = True
+
+    def __init__(self, fuentes=(), **kwargs):
+        """`fuentes`: lista de (familia, estilo, ruta del .ttf o None para una fuente estándar)."""
+        super().__init__(**kwargs)
+        self._plantillas_propias = {}
+        for familia, estilo, ruta in fuentes:
+            if ruta is None:
+                self.set_font(familia, estilo)
+            else:
+                self.registrar_fuente(familia, estilo, ruta)
+
+    def registrar_fuente(self, familia, estilo, ruta):
+        """
+        Equivale a `add_font(familia, estilo, ruta)` pero parte de la fuente precargada y
+        reducida: sólo se crea el estado propio del documento (número, subconjunto de glifos
+        usados y la tabla de fontTools que se recorta al guardar, abierta en modo perezoso).
+        """
+        prototipo, datos = fuente_precargada(ruta)
+        if not self.reutilizar_plantilla or prototipo.color_font is not None:
+            self.add_font(familia, estilo, str(ruta))
+            return
+        fuente = copy.copy(prototipo)
+        fuente.i = len(self.fonts) + 1
+        fuente.fontkey = familia.lower() + estilo
+        fuente.emphasis = TextEmphasis.coerce(estilo)
+        fuente.cw = defaultdict(prototipo.cw.default_factory, prototipo.cw)
+        # El descriptor se convierte en un objeto del PDF al guardar: uno por documento.
+        fuente.desc = copy.copy(prototipo.desc)
+        # `output()` recorta la tabla al subconjunto usado, así que cada documento abre la suya.
+        fuente.ttfont = ttLib.TTFont(
+            io.BytesIO(datos), recalcTimestamp=False, lazy=True, fontNumber=prototipo.collection_font_number
+        )
+        fuente._hbfont = None
+        fuente.missing_glyphs = []
+        fuente.biggest_size_pt = 0
+        fuente.subset = SubsetMap(fuente)
+        self.fonts[fuente.fontkey] = fuente
+
+    def sembrar_imagen(self, ruta, ancho_px=None):
+        """
+        Agrega al documento la imagen precargada de `ruta` (escalada a `ancho_px`), sin
+        volver a decodificarla. `self.image(str(ruta), ...)` usa después la sembrada.
+        """
+        if not self.reutilizar_plantilla or str(ruta) in self.image_cache.images:
+            return
+        precargada = imagen_precargada(ruta, ancho_px)
+        info = type(precargada)(precargada)
+        info["i"] = len(self.image_cache.images) + 1
+        info["usages"] = 0
+        self.image_cache.images[str(ruta)] = info
+
+    def _guardar_estado(self):
+        return {
+            atributo: getattr(self, atributo) for atributo in (
+                'font_family', 'font_style', 'font_size_pt', 'current_font', 'underline', 'strikethrough',
+                'fill_color', 'text_color', 'draw_color', 'line_width', 'x', 'y',
+            )
+        }
+
+    def _restaurar_estado(self, estado):
+        for atributo, valor in estado.items():
+            setattr(self, atributo, valor)
+        self.current_font_is_set_on_page = False
+
+    def dibujar_fijo(self, nombre, dibujar):
+        """
+        Dibuja el bloque fijo `nombre` llamando a `dibujar()` la primera vez y reinsertando
+        su flujo grabado después. El bloque queda entre `q`/`Q` y el estado de FPDF
+        (fuente, colores, posición) vuelve a ser el de antes, como si no se hubiera dibujado.
+        """
+        if not self.reutilizar_plantilla:
+            dibujar()
+            return
+        portatil = all(isinstance(fuente, CoreFont) for fuente in self.fonts.values())
+        registro = _plantillas if portatil else self._plantillas_propias
+        clave = (nombre, self.w, self.h, tuple(self.fonts))
+        plantilla = registro.get(clave)
+        estado = self._guardar_estado()
+        if plantilla is None:
+            # Se fuerza a emitir la fuente y el color de relleno aunque ya estén activos,
+            # para que el flujo grabado no dependa de lo que se dibujó antes.
+            self.font_family, self.fill_color = "", None
+            self.current_font_is_set_on_page = False
+            self._out("q")
+            contenido = self.pages[self.page].contents
+            inicio = len(contenido)
+            dibujar()
+            flujo = bytes(contenido[inicio:]).rstrip(b"\n")
+            fuentes = sorted({int(numero) for numero in _FUENTE_EN_FLUJO.findall(flujo)})
+            registro[clave] = (flujo, fuentes)
+            self._out("Q")
+        else:
+            flujo, fuentes = plantilla
+            self._out(b"q\n" + flujo + b"\nQ")
+            for fuente in fuentes:
+                self._resource_catalog.add(PDFResourceType.FONT, fuente, self.page)
+        self._restaurar_estado(estado)
@@ -0,0 +1,70 @@
+# recursos_imagen.py
+import io
+import os
+import threading
+
+from PIL import Image
+
+# Resolución a la que se rasterizan las imágenes del PDF: suficiente para impresión de oficina.
+PPP_PDF = 200
+# Calidad JPEG de las imágenes sin transparencia.
+CALIDAD_JPEG = 82
+# Colores de la paleta de las imágenes con transparencia (logos de pocos colores).
+COLORES_PNG = 256
+
+# Imágenes ya escaladas y comprimidas, compartidas por todas las sesiones del proceso:
+# (ruta, ancho, calidad) -> ((mtime, tamaño) del archivo de origen, bytes).
+_lock = threading.Lock()
+_escaladas = {}
+
+
+def ancho_px_para_mm(milimetros, ppp=PPP_PDF):
+    """Píxeles que necesita una imagen dibujada a `milimetros` de ancho para verse a `ppp`."""
+    return round(milimetros / 25.4 * ppp)
+
+
+def _firma(ruta):
+    estado = os.stat(ruta)
+    return estado.st_mtime_ns, estado.st_size
+
+
+def _tiene_transparencia(imagen):
+    return imagen.mode in ('RGBA', 'LA', 'PA') or 'transparency' in imagen.info
+
+
+def _escalar(ruta, ancho, calidad):
+    """
+    Bytes de la imagen de `ruta` reducida a `ancho` píxeles (sin ampliarla nunca). Las
+    imágenes con transparencia se guardan en PNG con paleta (el escalado suaviza bordes y
+    multiplica los colores, que en RGBA pesan más que el original); el resto en JPEG progresivo.
+    """
+    with Image.open(ruta) as imagen:
+        imagen.load()
+        if ancho and imagen.width > ancho:
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+            imagen = imagen.resize((ancho, alto), Image.LANCZOS)
+        salida = io.BytesIO()
+        if _tiene_transparencia(imagen):
+            paleta = imagen.convert('RGBA').quantize(COLORES_PNG, method=Image.Quantize.FASTOCTREE)
+            paleta.save(salida, format='PNG', optimize=True)
+        else:
+            imagen.convert('RGB').save(salida, format='JPEG', quality=calidad, optimize=True, progressive=True)
+    return salida.getvalue()
+
+
+def imagen_escalada(ruta, ancho=None, calidad=CALIDAD_JPEG):
+    """
+    Imagen de `ruta` escalada a `ancho` píxeles y comprimida, decodificada una sola vez
+    por proceso. Se vuelve a generar sólo si el archivo cambia (fecha de modificación o
+    tamaño); mientras no cambie se devuelve siempre el mismo objeto `bytes`.
+    """
+    clave = (str(ruta), ancho, calidad)
+    firma = _firma(ruta)
+    with _lock:
+        guardada = _escaladas.get(clave)
+    if guardada is not None and guardada[0] == firma:
+        return guardada[1]
+    datos = _escalar(ruta, ancho, calidad)
+    with _lock:
+        _escaladas[clave] = (firma, datos)
+    return datos
@@ -0,0 +1,147 @@
+# sesiones.py
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+RUTA_SESIONES_SQLITE = Path(".cache") / "sesiones.sqlite"
+DIRECTORIO_SESIONES = Path(".cache") / "sesiones"
+# Las sesiones que nadie toca en este tiempo se borran al abrir el almacén.
+DIAS_RETENCION_SESIONES = 30
+
+
+class AlmacenSesiones(ABC):
+    """
+    Guarda el estado serializado de cada sesión (`QuoteState.serializar()`) fuera del
+    proceso de Streamlit, indexado por un identificador que viaja en la URL. Así otro
+    proceso (detrás de un balanceador) o el mismo tras un reinicio puede recuperar el
+    borrador. El motor concreto se elige por configuración en `crear_almacen_sesiones`.
+    """
+    @abstractmethod
+    def guardar(self, id_sesion, datos):
+        raise NotImplementedError
+
+    @abstractmethod
+    def cargar(self, id_sesion):
+        """Bytes guardados para `id_sesion`, o None si no hay."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def eliminar(self, id_sesion):
+        raise NotImplementedError
+
+    @abstractmethod
+    def purgar(self, antiguedad_segundos):
+        """Borra las sesiones que no se guardan hace más de `antiguedad_segundos`."""
+        raise NotImplementedError
+
+
+class AlmacenSesionesSQLite(AlmacenSesiones):
+    """Una fila por sesión en un archivo SQLite en modo WAL, que admite varios procesos a la vez."""
+    def __init__(self, ruta=RUTA_SESIONES_SQLITE):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conexion = self._conexion()
+        conexion.execute("PRAGMA journal_mode=WAL")
+        with conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones (id TEXT PRIMARY KEY, datos BLOB NOT NULL, actualizado REAL NOT NULL)"
+            )
+
+    def _conexion(self):
+        # Igual que `RepositorioSQLite`: una conexión por hilo.
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            self._local.conexion = conexion
+        return conexion
+
+    def guardar(self, id_sesion, datos):
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO sesiones (id, datos, actualizado) VALUES (?, ?, ?)",
+                (id_sesion, sqlite3.Binary(datos), time.time())
+            )
+
+    def cargar(self, id_sesion):
+        fila = self._conexion().execute("SELECT datos FROM sesiones WHERE id = ?", (id_sesion,)).fetchone()
+        return bytes(fila[0]) if fila else None
+
+    def eliminar(self, id_sesion):
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute("DELETE FROM sesiones WHERE id = ?", (id_sesion,))
+
+    def purgar(self, antiguedad_segundos):
+        conexion = self._conexion()
+        with conexion:
+            conexion.execute("DELETE FROM sesiones WHERE actualizado < ?", (time.time() - antiguedad_segundos,))
+
+
+class AlmacenSesionesArchivos(AlmacenSesiones):
+    """
+    Un archivo por sesión en `directorio` (p. ej. un volumen compartido). Se escribe a un
+    temporal y se reemplaza de una vez, así un lector nunca ve un archivo a medias.
+    """
+    def __init__(self, directorio=DIRECTORIO_SESIONES):
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def _ruta(self, id_sesion):
+        # El identificador viene de la URL: sólo se aceptan caracteres seguros para un nombre de archivo.
+        if not id_sesion or not all(c.isalnum() or c in '-_' for c in id_sesion):
+            raise ValueError(f"Identificador de sesión inválido: {id_sesion!r}")
+        return self.directorio / f"{id_sesion}.sesion"
+
+    def guardar(self, id_sesion, datos):
+        destino = self._ruta(id_sesion)
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, 'wb') as archivo:
+                archivo.write(datos)
+            os.replace(temporal, destino)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+
+    def cargar(self, id_sesion):
+        try:
+            return self._ruta(id_sesion).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def eliminar(self, id_sesion):
+        self._ruta(id_sesion).unlink(missing_ok=True)
+
+    def purgar(self, antiguedad_segundos):
+        limite = time.time() - antiguedad_segundos
+        for ruta in self.directorio.glob("*.sesion"):
+            try:
+                if ruta.stat().st_mtime < limite:
+                    ruta.unlink()
+            except FileNotFoundError:
+                continue
+
+
+def crear_almacen_sesiones(configuracion):
+    """
+    Crea el almacén a partir de la sección `sesiones` de `secrets.toml` (por omisión,
+    SQLite local); None con `motor = "ninguno"` (el estado vive sólo en la memoria del
+    proceso). No usa `st`.
+    """
+    motor = configuracion.get("motor", "sqlite")
+    if motor == "ninguno":
+        return None
+    if motor == "sqlite":
+        almacen = AlmacenSesionesSQLite(configuracion.get("ruta", RUTA_SESIONES_SQLITE))
+    elif motor == "archivos":
+        almacen = AlmacenSesionesArchivos(configuracion.get("ruta", DIRECTORIO_SESIONES))
+    else:
+        raise ValueError(f"Motor de sesiones desconocido: {motor!r}")
+    almacen.purgar(configuracion.get("dias_retencion", DIAS_RETENCION_SESIONES) * 86400)
+    return almacen
@@ -0,0 +1,172 @@
+# sincronizacion.py
+import threading
+import time
+
+from inventario import (
+    ALMACEN_NOMBRE_MAPPING, TAMANO_BLOQUE, AgregadoInventario, combinar_con_maestro, leer_bloques
+)
+
+# Etapas de la sincronización, en orden. Descarga, parseo y agregación ocurren
+# intercaladas (bloque a bloque); el tiempo de cada una se acumula por separado.
+ETAPAS = ('descarga', 'parseo', 'agregacion', 'maestro', 'escritura')
+# Avance (0-1) al terminar de recorrer el export y al terminar de leer el maestro.
+AVANCE_EXPORT = 0.8
+AVANCE_MAESTRO = 0.85
+NOMBRES_ETAPAS = {
+    'descarga': "Descargando export",
+    'parseo': "Procesando export",
+    'agregacion': "Agregando inventario",
+    'maestro': "Leyendo productos",
+    'escritura': "Escribiendo cambios",
+}
+
+
+class TrabajoSincronizacion:
+    """
+    Estado de una ejecución de la sincronización de precios y stock: etapa actual,
+    avance, tiempo acumulado por etapa y resultado. Lo actualiza el hilo de fondo y lo
+    leen las sesiones, así que todo acceso pasa por un candado.
+    """
+    def __init__(self, id_trabajo, observador=None):
+        self.id = id_trabajo
+        # Función opcional llamada con (trabajo, campos) tras cada actualización.
+        self._observador = observador
+        self._lock = threading.Lock()
+        self.estado = 'en_curso'
+        self.etapa = 'descarga'
+        self.progreso = 0.0
+        self.tiempos = {etapa: 0.0 for etapa in ETAPAS}
+        self.registros = 0
+        self.celdas = None
+        self.mensaje = ""
+        self.iniciado = time.time()
+        self.terminado = None
+
+    @property
+    def activo(self):
+        with self._lock:
+            return self.estado == 'en_curso'
+
+    def actualizar(self, **campos):
+        with self._lock:
+            for campo, valor in campos.items():
+                setattr(self, campo, valor)
+        if self._observador:
+            self._observador(self, campos)
+
+    def sumar_tiempo(self, etapa, segundos):
+        with self._lock:
+            self.tiempos[etapa] += segundos
+
+    def terminar(self, exito, mensaje):
+        with self._lock:
+            self.estado = 'completado' if exito else 'fallido'
+            self.mensaje = mensaje
+            self.terminado = time.time()
+            if exito:
+                self.progreso = 1.0
+
+    def resumen(self):
+        """Copia consistente del estado, para mostrarla sin sostener el candado."""
+        with self._lock:
+            return {
+                'id': self.id, 'estado': self.estado, 'etapa': self.etapa, 'progreso': self.progreso,
+                'tiempos': dict(self.tiempos), 'registros': self.registros, 'celdas': self.celdas,
+                'mensaje': self.mensaje, 'iniciado': self.iniciado, 'terminado': self.terminado,
+            }
+
+
+def sincronizar_inventario(repositorio, abrir_fuente, trabajo, al_terminar=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Ejecuta la sincronización completa registrando su avance en `trabajo`. No usa `st`:
+    corre en un hilo de fondo o desde la línea de comandos.
+
+    `abrir_fuente` devuelve un context manager con el flujo del export (p. ej.
+    `abrir_export_dropbox`). Si el flujo es un `FlujoMedido`, el tiempo de espera de la
+    red se separa del de parseo y el avance se calcula por bytes leídos. `al_terminar` se
+    llama tras una escritura exitosa (p. ej. para refrescar el snapshot de datos maestros).
+    """
+    etapa = 'descarga'
+    try:
+        inicio = time.perf_counter()
+        with abrir_fuente() as flujo:
+            trabajo.sumar_tiempo('descarga', time.perf_counter() - inicio)
+            agregado = AgregadoInventario()
+            bloques = leer_bloques(flujo, tamano_bloque)
+            while True:
+                etapa = 'parseo'
+                trabajo.actualizar(etapa=etapa)
+                inicio, lectura_previa = time.perf_counter(), getattr(flujo, 'segundos_lectura', 0.0)
+                bloque = next(bloques, None)
+                espera_red = getattr(flujo, 'segundos_lectura', 0.0) - lectura_previa
+                trabajo.sumar_tiempo('descarga', espera_red)
+                trabajo.sumar_tiempo('parseo', time.perf_counter() - inicio - espera_red)
+                if bloque is None:
+                    break
+                etapa = 'agregacion'
+                trabajo.actualizar(etapa=etapa)
+                inicio = time.perf_counter()
+                agregado.agregar(bloque)
+                trabajo.sumar_tiempo('agregacion', time.perf_counter() - inicio)
+                fraccion = flujo.fraccion() if hasattr(flujo, 'fraccion') else None
+                trabajo.actualizar(registros=agregado.registros, progreso=AVANCE_EXPORT * (fraccion or 0.0))
+
+        etapa = 'maestro'
+        trabajo.actualizar(etapa=etapa, progreso=AVANCE_EXPORT)
+        inicio = time.perf_counter()
+        df_productos_maestro = repositorio.leer_productos_texto()
+        df_actualizado = combinar_con_maestro(df_productos_maestro, agregado)
+        trabajo.sumar_tiempo('maestro', time.perf_counter() - inicio)
+
+        etapa = 'escritura'
+        trabajo.actualizar(etapa=etapa, progreso=AVANCE_MAESTRO)
+        inicio = time.perf_counter()
+        # Sólo se escriben las celdas de costo y stock que cambiaron.
+        columnas_sincronizadas = ['Costo'] + [col for col in ALMACEN_NOMBRE_MAPPING.values() if col in df_actualizado.columns]
+        celdas = repositorio.escribir_productos(df_actualizado, df_productos_maestro, columnas_sincronizadas)
+        trabajo.sumar_tiempo('escritura', time.perf_counter() - inicio)
+        trabajo.actualizar(celdas=celdas)
+    except Exception as e:
+        trabajo.terminar(False, f"ERROR en la etapa '{NOMBRES_ETAPAS[etapa]}': {e}")
+        return False
+
+    mensaje = f"¡Éxito! Los precios y stocks han sido actualizados ({celdas} celdas modificadas)."
+    if al_terminar:
+        try:
+            al_terminar()
+        except Exception as e:
+            mensaje += f" No se pudo refrescar la copia local de los datos maestros: {e}"
+    trabajo.terminar(True, mensaje)
+    return True
+
+
+class EjecutorSincronizacion:
+    """
+    Lanza la sincronización en un hilo del servidor, fuera de la ejecución del script:
+    la página no se congela y el trabajo sigue aunque se cierre la pestaña. Sólo hay un
+    trabajo activo a la vez; si dos administradores lo piden juntos, comparten la misma
+    ejecución.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trabajo = None
+        self._contador = 0
+
+    def actual(self):
+        """Último trabajo (activo o terminado), o None si nunca se ejecutó."""
+        return self._trabajo
+
+    def iniciar(self, repositorio, abrir_fuente, al_terminar=None):
+        """Devuelve (trabajo, iniciado): `iniciado` es False si ya había uno en curso."""
+        with self._lock:
+            if self._trabajo is not None and self._trabajo.activo:
+                return self._trabajo, False
+            self._contador += 1
+            trabajo = TrabajoSincronizacion(self._contador)
+            hilo = threading.Thread(
+                target=sincronizar_inventario, args=(repositorio, abrir_fuente, trabajo, al_terminar),
+                name="sincronizacion-inventario", daemon=True
+            )
+            self._trabajo = trabajo
+            hilo.start()
+            return trabajo, True
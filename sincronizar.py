@@ -0,0 +1,121 @@
+# sincronizar.py
+"""
+Sincroniza precios (Costo) y stock por tienda sin Streamlit, con el mismo proceso del
+botón "🔄 Actualizar Precios y Stocks". Pensado para correr programado.
+
+Uso (desde la raíz del repositorio):
+    python sincronizar.py                                  # Dropbox -> almacenamiento de secrets.toml
+    python sincronizar.py --csv export.csv                 # export local en lugar de Dropbox
+    python sincronizar.py --csv export.csv --motor sqlite --ruta-sqlite /tmp/prueba.sqlite
+    python sincronizar.py --formato-log json               # una línea JSON por evento
+
+Ejemplo de cron (cada 15 minutos):
+    */15 * * * * cd /ruta/al/cotizador && python sincronizar.py --formato-log json >> sincronizacion.log 2>&1
+
+Las credenciales se leen de un archivo TOML con la misma forma que `.streamlit/secrets.toml`
+(secciones `dropbox`, `gcp_service_account`, `gsheets` y opcionalmente `almacenamiento`).
+Sale con código 0 si la sincronización terminó bien y 1 si falló.
+"""
+import argparse
+import json
+import logging
+import sys
+import tomllib
+from pathlib import Path
+
+from almacenamiento import crear_repositorio
+from inventario import TAMANO_BLOQUE, abrir_export_dropbox, abrir_export_local
+from sincronizacion import NOMBRES_ETAPAS, TrabajoSincronizacion, sincronizar_inventario
+
+RUTA_SECRETOS = Path(".streamlit") / "secrets.toml"
+logger = logging.getLogger("sincronizacion")
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro, con los campos pasados en `extra={'datos': {...}}`."""
+    def format(self, record):
+        evento = {
+            'momento': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'nivel': record.levelname,
+            'mensaje': record.getMessage(),
+        }
+        evento.update(getattr(record, 'datos', {}))
+        return json.dumps(evento, ensure_ascii=False)
+
+
+def configurar_logging(formato):
+    manejador = logging.StreamHandler(sys.stdout)
+    if formato == 'json':
+        manejador.setFormatter(FormatoJSON())
+    else:
+        manejador.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.addHandler(manejador)
+    logger.setLevel(logging.INFO)
+
+
+def registrar_avance(trabajo, campos):
+    """Observador del trabajo: registra cada cambio de etapa y cada bloque agregado."""
+    resumen = trabajo.resumen()
+    if 'registros' in campos:
+        logger.info(
+            f"{resumen['registros']:,} registros agregados ({resumen['progreso']:.0%})",
+            extra={'datos': {'evento': 'avance', 'registros': resumen['registros'], 'progreso': round(resumen['progreso'], 3)}}
+        )
+    elif 'etapa' in campos and campos['etapa'] in ('maestro', 'escritura'):
+        logger.info(NOMBRES_ETAPAS[campos['etapa']], extra={'datos': {'evento': 'etapa', 'etapa': campos['etapa']}})
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--secretos", type=Path, default=RUTA_SECRETOS, help="Archivo TOML con las credenciales.")
+    parser.add_argument("--csv", type=Path, help="Export del ERP en disco; si se omite se descarga de Dropbox.")
+    parser.add_argument("--motor", choices=["gsheets", "sqlite"], help="Sobrescribe [almacenamiento] motor.")
+    parser.add_argument("--ruta-sqlite", help="Sobrescribe [almacenamiento] ruta.")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE, help="Líneas del export por bloque.")
+    parser.add_argument("--formato-log", choices=["texto", "json"], default="texto")
+    args = parser.parse_args(argumentos)
+    configurar_logging(args.formato_log)
+
+    try:
+        secretos = tomllib.loads(args.secretos.read_text(encoding='utf-8')) if args.secretos.exists() else {}
+        almacenamiento = dict(secretos.get("almacenamiento", {}))
+        if args.motor:
+            almacenamiento["motor"] = args.motor
+        if args.ruta_sqlite:
+            almacenamiento["ruta"] = args.ruta_sqlite
+        secretos["almacenamiento"] = almacenamiento
+        repositorio = crear_repositorio(secretos)
+
+        if args.csv:
+            abrir_fuente = lambda: abrir_export_local(args.csv)
+            origen = str(args.csv)
+        else:
+            dbx_creds = secretos["dropbox"]
+            abrir_fuente = lambda: abrir_export_dropbox(
+                dbx_creds["app_key"], dbx_creds["app_secret"], dbx_creds["refresh_token"], dbx_creds["file_path"]
+            )
+            origen = f"dropbox:{dbx_creds['file_path']}"
+    except KeyError as e:
+        logger.error(f"Falta la clave {e} en {args.secretos}.", extra={'datos': {'evento': 'error', 'clave': str(e)}})
+        return 1
+    except Exception as e:
+        logger.error(f"No se pudo preparar la sincronización: {e}", extra={'datos': {'evento': 'error'}})
+        return 1
+
+    motor = almacenamiento.get("motor", "gsheets")
+    logger.info(f"Sincronizando desde {origen} hacia {motor}", extra={'datos': {'evento': 'inicio', 'origen': origen, 'motor': motor}})
+    trabajo = TrabajoSincronizacion(1, observador=registrar_avance)
+    exito = sincronizar_inventario(repositorio, abrir_fuente, trabajo, tamano_bloque=args.bloque)
+
+    resumen = trabajo.resumen()
+    datos = {
+        'evento': 'fin', 'estado': resumen['estado'], 'registros': resumen['registros'], 'celdas': resumen['celdas'],
+        'segundos': round(resumen['terminado'] - resumen['iniciado'], 3),
+        'tiempos': {etapa: round(segundos, 3) for etapa, segundos in resumen['tiempos'].items()},
+    }
+    (logger.info if exito else logger.error)(resumen['mensaje'], extra={'datos': datos})
+    return 0 if exito else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# snapshot.py
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+SNAPSHOT_PATH = Path(".cache") / "datos_maestros.sqlite"
+TABLA_PRODUCTOS = "productos"
+TABLA_CLIENTES = "clientes"
+
+
+def _identificador(nombre):
+    """Cita un nombre de columna de la hoja (con espacios, tildes, etc.) para SQLite."""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def _escribir_tabla(conexion, tabla, df):
+    # Las columnas se crean sin tipo: SQLite conserva el tipo de cada valor, así que una
+    # columna con números y textos mezclados (habitual en `get_all_records`) vuelve igual.
+    columnas = ", ".join(_identificador(c) for c in df.columns) or '"_vacia"'
+    conexion.execute(f"CREATE TABLE {tabla} ({columnas})")
+    if len(df.columns):
+        marcadores = ", ".join("?" for _ in df.columns)
+        conexion.executemany(
+            f"INSERT INTO {tabla} VALUES ({marcadores})",
+            df.itertuples(index=False, name=None)
+        )
+
+
+class SnapshotMaestros:
+    """
+    Copia local en SQLite de las hojas Productos y Clientes.
+
+    La app arranca leyendo el snapshot del disco y la descarga desde Google Sheets se hace
+    en un hilo de fondo. El archivo nuevo se escribe aparte y se reemplaza con `os.replace`,
+    de modo que los lectores ven siempre un snapshot completo: el anterior o el nuevo.
+    """
+    def __init__(self, ruta=SNAPSHOT_PATH):
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.ultimo_error = None
+        # Generación del monitor de cambios con la que se descargó el snapshot (en memoria).
+        self.origen = None
+        self.version, self.creado, self.marca = self._leer_metadatos()
+
+    def _leer_metadatos(self):
+        if not self.ruta.exists():
+            return 0, None, None
+        try:
+            with closing(sqlite3.connect(self.ruta)) as conexion:
+                version, creado, marca = conexion.execute("SELECT version, creado, marca FROM metadatos").fetchone()
+            return int(version), float(creado), marca
+        except (sqlite3.Error, TypeError):
+            return 0, None, None
+
+    def existe(self):
+        return self.version > 0
+
+    def edad(self):
+        """Segundos desde que se guardó el snapshot vigente (None si no hay)."""
+        return None if self.creado is None else time.time() - self.creado
+
+    def refrescando(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def cargar(self):
+        """Devuelve (df_productos, df_clientes, version) del snapshot vigente."""
+        with self._lock:
+            with closing(sqlite3.connect(self.ruta)) as conexion:
+                df_productos = pd.read_sql_query(f"SELECT * FROM {TABLA_PRODUCTOS}", conexion)
+                df_clientes = pd.read_sql_query(f"SELECT * FROM {TABLA_CLIENTES}", conexion)
+                version, creado, marca = conexion.execute("SELECT version, creado, marca FROM metadatos").fetchone()
+            # Otro proceso pudo haber publicado un snapshot más reciente.
+            if version > self.version:
+                self.version, self.creado, self.marca = int(version), float(creado), marca
+            return df_productos, df_clientes, int(version)
+
+    def guardar(self, df_productos, df_clientes, marca=None, origen=None):
+        """
+        Escribe un snapshot nuevo en un archivo temporal y lo publica atómicamente.
+        `marca` es la señal de cambio del libro al momento de la descarga.
+        """
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta.with_name(f"{self.ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        version = max(self.version, self._leer_metadatos()[0]) + 1
+        creado = time.time()
+        try:
+            with closing(sqlite3.connect(temporal)) as conexion:
+                _escribir_tabla(conexion, TABLA_PRODUCTOS, df_productos)
+                _escribir_tabla(conexion, TABLA_CLIENTES, df_clientes)
+                conexion.execute("CREATE TABLE metadatos (version INTEGER, creado REAL, marca TEXT)")
+                conexion.execute("INSERT INTO metadatos VALUES (?, ?, ?)", (version, creado, marca))
+                conexion.commit()
+            with self._lock:
+                os.replace(temporal, self.ruta)
+                self.version, self.creado, self.marca = version, creado, marca
+                self.origen = origen
+        finally:
+            if temporal.exists():
+                temporal.unlink()
+
+    def refrescar(self, descargar, marca=None, origen=None):
+        """Descarga (con la función `descargar`) y publica un snapshot nuevo de forma síncrona."""
+        df_productos, df_clientes = descargar()
+        self.guardar(df_productos, df_clientes, marca, origen)
+        self.ultimo_error = None
+
+    def refrescar_en_segundo_plano(self, descargar, marca=None, origen=None):
+        """Lanza el refresco en un hilo; si ya hay uno en curso no inicia otro."""
+        with self._lock:
+            if self.refrescando():
+                return False
+
+            def tarea():
+                try:
+                    self.refrescar(descargar, marca, origen)
+                except Exception as e:
+                    self.ultimo_error = str(e)
+
+            self._hilo = threading.Thread(target=tarea, name="refresco-datos-maestros", daemon=True)
+            self._hilo.start()
+            return True
@@ -1,19 +1,49 @@
 # state.py
+import json
+import re
+import uuid
+import zlib
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from types import MappingProxyType
+from lineas_cotizacion import LineasCotizacion
 from utils import (
-    DETALLE_PROPUESTAS_SHEET_NAME, PROPUESTAS_SHEET_NAME, TASA_IVA,
-    cargar_datos_maestros, listar_propuestas_df, CLIENTE_NOMBRE_COL, NOMBRE_PRODUCTO_COL,
+    TASA_IVA, cargar_datos_maestros, conectar_autoguardado, CLIENTE_NOMBRE_COL,
     # --- CAMBIO: Importamos la nueva función ---
     parse_price
 )
 
+# Columnas del editor de items que el usuario puede cambiar.
+COLUMNAS_EDITABLES = ('Producto', 'Cantidad', 'Precio Unitario', 'Descuento (%)')
+
+# Versión del formato de `QuoteState.serializar`. Si cambia, `_MIGRACIONES_ESTADO` lleva
+# la función que convierte un dict de cada versión anterior a la siguiente.
+VERSION_ESTADO = 1
+_MIGRACIONES_ESTADO = {}
+# Parámetro de la URL con el identificador de la sesión en el almacén de sesiones.
+PARAMETRO_SESION = "sesion"
+_ID_SESION = re.compile(r"[0-9a-f]{32}")
+
+
+def _valor_json(valor):
+    """Valores que JSON no serializa (numpy, Timestamp, ...) que pueden venir de los maestros."""
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return str(valor)
+
+
+def _centavos(valor):
+    # `+ 0.0` convierte el -0.0 que deja redondear un residuo negativo en 0.0.
+    return round(valor, 2) + 0.0
+
+
 class QuoteState:
     def __init__(self):
         self.numero_propuesta = f"TEMP-{datetime.now().strftime('%Y%m%d%H%M%S')}"
         self.cliente_actual = {}
-        self.cotizacion_items = []
+        self.lineas = LineasCotizacion()
         self.vendedor = ""
         self.tienda_despacho = ""
         self.observaciones = "Forma de Pago: 50% Anticipo, 50% Contra-entrega.\nTiempos de Entrega: 3-5 días hábiles para productos en stock.\nGarantía: Productos cubiertos por garantía de fábrica. No cubre mal uso."
@@ -25,8 +55,27 @@ class QuoteState:
         self.costo_total = 0.0
         self.margen_absoluto = 0.0
         self.margen_porcentual = 0.0
+        # Columnas de los items (sin el número de propuesta) tal como se subieron en el último
+        # guardado en la nube: de ahí sale qué líneas cambiaron (ver `utils.actualizar_propuesta_en_sheets`).
+        self.detalle_nube = None
         self.recalcular_totales()
 
+    @property
+    def cotizacion_items(self):
+        """
+        Las líneas como tupla de diccionarios de sólo lectura: asignar sobre ellos lanza
+        TypeError en vez de perderse en silencio. Los cambios se hacen con
+        `agregar_producto`, `aplicar_cambios_editor` o sobre `self.lineas`, que mantienen
+        los totales al día. Cada acceso arma la tupla de nuevo: quien la recorre varias
+        veces la guarda en una variable.
+        """
+        return tuple(MappingProxyType(registro) for registro in self.lineas.como_registros())
+
+    @cotizacion_items.setter
+    def cotizacion_items(self, items):
+        self.lineas = LineasCotizacion(items)
+        self._actualizar_totales()
+
     def set_numero_propuesta(self, numero):
         self.numero_propuesta = numero
         self.persist_to_session()
@@ -43,148 +92,248 @@ class QuoteState:
         self.tienda_despacho = nombre_tienda
         self.persist_to_session()
 
-    def agregar_item(self, producto_dict, cantidad, precio_unitario):
-        total_item = cantidad * precio_unitario
-        
-        columna_stock_tienda = f"Stock {self.tienda_despacho}"
-        stock_disponible = producto_dict.get(columna_stock_tienda, 0)
-
-        nuevo_item = {
-            'Referencia': producto_dict.get('Referencia', 'N/A'),
-            'Producto': producto_dict.get(NOMBRE_PRODUCTO_COL, 'N/A'),
+    def agregar_producto(self, producto, cantidad, precio_unitario):
+        """Agrega una línea con un `ProductoCatalogo`: el stock y el costo ya vienen convertidos."""
+        self.lineas.agregar({
+            'Referencia': producto.referencia,
+            'Producto': producto.descripcion,
             'Cantidad': cantidad,
             'Precio Unitario': precio_unitario,
             'Descuento (%)': 0.0,
-            'Total': total_item,
-            'Stock': stock_disponible,
-            'Costo': parse_price(producto_dict.get('Costo', 0.0))
-        }
-        self.cotizacion_items.append(nuevo_item)
-        self.recalcular_totales()
-        self.persist_to_session()
-
-    def actualizar_items_desde_vista(self, df_vista):
-        nuevos_items = []
-        mapa_items_actuales = {str(item['Referencia']): item for item in self.cotizacion_items if 'Referencia' in item and pd.notna(item['Referencia'])}
-
-        for _, row in df_vista.iterrows():
-            referencia_fila = row.get('Referencia')
-            if pd.isna(referencia_fila) or referencia_fila is None or str(referencia_fila).strip() == '':
-                continue 
-
-            referencia_str = str(referencia_fila)
-            item_completo_original = mapa_items_actuales.get(referencia_str, {})
-
-            item_actualizado = {
-                **item_completo_original,
-                'Referencia': referencia_fila,
-                'Producto': row.get('Producto'),
-                'Cantidad': row.get('Cantidad'),
-                'Precio Unitario': row.get('Precio Unitario'),
-                'Descuento (%)': row.get('Descuento (%)'),
-            }
-            nuevos_items.append(item_actualizado)
-
-        self.cotizacion_items = nuevos_items
-        self.recalcular_totales()
+            'Total': cantidad * precio_unitario,
+            'Stock': producto.stock_en(self.tienda_despacho),
+            'Costo': producto.costo
+        })
+        self._actualizar_totales()
         self.persist_to_session()
 
-    def recalcular_totales(self):
-        subtotal_bruto = 0
-        descuento_total_valor = 0
-        costo_total_calculado = 0
-        for item in self.cotizacion_items:
-            try:
-                cantidad = int(item.get('Cantidad', 0))
-                precio = float(item.get('Precio Unitario', 0) or 0)
-                costo = float(item.get('Costo', 0) or 0)
-                descuento_pct = float(item.get('Descuento (%)', 0) or 0)
-                
-                total_bruto_item = cantidad * precio
-                descuento_valor_item = total_bruto_item * (descuento_pct / 100)
-                total_neto_item = total_bruto_item - descuento_valor_item
-                
-                item['Total'] = total_neto_item
-                subtotal_bruto += total_bruto_item
-                descuento_total_valor += descuento_valor_item
-                costo_total_calculado += cantidad * costo
-            except (ValueError, TypeError):
+    def aplicar_cambios_editor(self, cambios):
+        """
+        Aplica los cambios del editor de items tal como `st.data_editor` los deja en
+        `st.session_state[key]`: `edited_rows` ({fila: {columna: valor}}, posiciones de
+        las líneas actuales), `deleted_rows` ([fila, ...]) y `added_rows` ([{columna: valor}]).
+        Sólo se tocan las líneas nombradas, en el orden en que el editor los aplica:
+        ediciones, borrados y altas. Las filas nuevas sin referencia se ignoran.
+        """
+        for fila, valores in cambios.get('edited_rows', {}).items():
+            self.lineas.actualizar(int(fila), {c: v for c, v in valores.items() if c in COLUMNAS_EDITABLES})
+        for fila in sorted((int(fila) for fila in cambios.get('deleted_rows', [])), reverse=True):
+            self.lineas.eliminar(fila)
+        for valores in cambios.get('added_rows', []):
+            referencia = valores.get('Referencia')
+            if referencia is None or pd.isna(referencia) or str(referencia).strip() == '':
                 continue
+            self.lineas.agregar({c: v for c, v in valores.items() if c in COLUMNAS_EDITABLES or c == 'Referencia'})
+        self._actualizar_totales()
+        self.persist_to_session()
 
-        subtotal_neto = subtotal_bruto - descuento_total_valor
-        self.subtotal_bruto = subtotal_bruto
-        self.descuento_total = descuento_total_valor
+    def _actualizar_totales(self):
+        """
+        Deriva IVA, total y margen de los acumulados de `self.lineas`, sin recorrer las líneas.
+        Los acumulados se redondean al centavo: al restar aportes queda un residuo de redondeo
+        (p. ej. 1e-12 en vez de 0) que dispararía el margen porcentual.
+        """
+        self.subtotal_bruto = _centavos(self.lineas.subtotal_bruto)
+        self.descuento_total = _centavos(self.lineas.descuento_total)
+        subtotal_neto = self.subtotal_bruto - self.descuento_total
         self.iva_valor = subtotal_neto * TASA_IVA
         self.total_general = subtotal_neto + self.iva_valor
-        self.costo_total = costo_total_calculado
+        self.costo_total = _centavos(self.lineas.costo_total)
         self.margen_absoluto = subtotal_neto - self.costo_total
         self.margen_porcentual = (self.margen_absoluto / subtotal_neto) * 100 if subtotal_neto != 0 else 0
 
+    def recalcular_totales(self):
+        """Recalcula los acumulados desde cero; las ediciones normales ya los mantienen al día."""
+        self.lineas.resincronizar()
+        self._actualizar_totales()
+
     def reiniciar_cotizacion(self):
         self.__init__()
         self.persist_to_session()
         st.success("Se ha iniciado una nueva cotización.")
 
-    def cargar_desde_gheets(self, numero_propuesta, workbook, silent=False):
+    def cargar_desde_gheets(self, numero_propuesta, repositorio, silent=False, persistir=True):
+        """
+        Carga la propuesta en esta cotización. Con `persistir=False` no toca la sesión: para
+        consultar o exportar una propuesta sin reemplazar el borrador en curso.
+        """
         try:
-            propuestas_df = listar_propuestas_df(workbook)
-            detalle_sheet = workbook.worksheet(DETALLE_PROPUESTAS_SHEET_NAME)
-            all_items_df = pd.DataFrame(detalle_sheet.get_all_records())
-            productos_df, clientes_df = cargar_datos_maestros(workbook)
-            propuesta_data = propuestas_df[propuestas_df['numero_propuesta'] == numero_propuesta]
-
-            if propuesta_data.empty:
+            # Sólo la propuesta pedida y sus items, no las hojas completas.
+            propuesta_row, items_propuesta = repositorio.obtener_propuesta(numero_propuesta)
+            if propuesta_row is None:
                 if not silent: st.error(f"No se encontró la propuesta {numero_propuesta}.")
                 return False
-            
-            propuesta_row = propuesta_data.iloc[0]
-            self.numero_propuesta = propuesta_row['numero_propuesta']
-            cliente_nombre = propuesta_row['cliente_nombre']
-            cliente_info = clientes_df[clientes_df[CLIENTE_NOMBRE_COL] == cliente_nombre]
-            if not cliente_info.empty:
-                self.cliente_actual = cliente_info.iloc[0].to_dict()
-
-            self.vendedor = propuesta_row['vendedor']
-            self.status = propuesta_row['status']
-            self.observaciones = propuesta_row['Observaciones']
-            self.tienda_despacho = propuesta_row.get('tienda_despacho', '')
-            
-            self.cotizacion_items = []
-            items_propuesta = all_items_df[all_items_df['numero_propuesta'] == numero_propuesta]
-
-            for _, item_row in items_propuesta.iterrows():
-                # --- CAMBIO: Usamos parse_price para leer los costos y precios ---
-                costo_unitario_cargado = parse_price(item_row.get('Costo_Unitario', '0'))
-                
-                stock_actual = 0
-                info_producto = productos_df[productos_df['Referencia'] == item_row.get('Referencia')]
-                if not info_producto.empty:
-                    if self.tienda_despacho:
-                        columna_stock_tienda = f"Stock {self.tienda_despacho}"
-                        stock_actual = info_producto.iloc[0].get(columna_stock_tienda, 0)
-                    
-                    if costo_unitario_cargado == 0:
-                        costo_unitario_cargado = parse_price(info_producto.iloc[0].get('Costo', 0))
-
-                item_cargado = {
-                    'Referencia': item_row.get('Referencia'),
-                    'Producto': item_row.get('Producto'),
-                    'Cantidad': int(item_row.get('Cantidad', 0)),
-                    'Precio Unitario': parse_price(item_row.get('Precio_Unitario', '0')),
-                    'Descuento (%)': parse_price(item_row.get('Descuento_Porc', '0')),
-                    'Total': parse_price(item_row.get('Total_Item', '0')),
-                    'Stock': stock_actual,
-                    'Costo': costo_unitario_cargado
-                }
-                self.cotizacion_items.append(item_cargado)
-
-            self.recalcular_totales()
-            self.persist_to_session()
+
+            productos_df, clientes_df = cargar_datos_maestros(repositorio)
+            self._aplicar_propuesta(propuesta_row, items_propuesta, productos_df, clientes_df)
+            if persistir:
+                self.persist_to_session()
             if not silent: st.success(f"Propuesta {numero_propuesta} cargada para edición.")
             return True
         except Exception as e:
             if not silent: st.error(f"Error al cargar la propuesta: {e}")
             return False
 
+    @classmethod
+    def desde_propuesta(cls, propuesta_row, items_propuesta, productos_df, clientes_df):
+        """Cotización armada con una propuesta ya leída, sin tocar `st.session_state` (p. ej. para exportar en lote)."""
+        state = cls()
+        state._aplicar_propuesta(propuesta_row, items_propuesta, productos_df, clientes_df)
+        return state
+
+    def _aplicar_propuesta(self, propuesta_row, items_propuesta, productos_df, clientes_df):
+        self.numero_propuesta = propuesta_row['numero_propuesta']
+        cliente_nombre = propuesta_row['cliente_nombre']
+        cliente_info = clientes_df[clientes_df[CLIENTE_NOMBRE_COL] == cliente_nombre] if not clientes_df.empty else clientes_df
+        if not cliente_info.empty:
+            self.cliente_actual = cliente_info.iloc[0].to_dict()
+
+        self.vendedor = propuesta_row['vendedor']
+        self.status = propuesta_row['status']
+        self.observaciones = propuesta_row['Observaciones']
+        self.tienda_despacho = propuesta_row.get('tienda_despacho', '')
+        self.detalle_nube = None
+        self.cotizacion_items = self._items_desde_detalle(items_propuesta, productos_df)
+        self.recalcular_totales()
+
+    def _items_desde_detalle(self, items_propuesta, productos_df):
+        """
+        Convierte las filas de detalle en items de la cotización. El stock de la tienda y el
+        costo del catálogo se traen con un único `merge` por `Referencia`.
+        """
+        if items_propuesta.empty:
+            return []
+        items = items_propuesta.reset_index(drop=True)
+        claves = pd.DataFrame({'_clave': items['Referencia'].astype(str).str.strip()})
+        columna_stock_tienda = f"Stock {self.tienda_despacho}" if self.tienda_despacho else None
+
+        if 'Referencia' in productos_df.columns:
+            columnas = [c for c in ('Costo', columna_stock_tienda) if c and c in productos_df.columns]
+            catalogo = productos_df[columnas].assign(_clave=productos_df['Referencia'].astype(str).str.strip(), _encontrado=True)
+            # Como el filtro anterior, se usa la primera fila de cada referencia.
+            catalogo = catalogo.drop_duplicates('_clave')
+            unidos = claves.merge(catalogo, on='_clave', how='left')
+        else:
+            unidos = claves.assign(_encontrado=False)
+        encontrado = unidos['_encontrado'].fillna(False).astype(bool)
+
+        # --- CAMBIO: Usamos parse_price para leer los costos y precios ---
+        costo_cargado = items.get('Costo_Unitario', pd.Series('0', index=items.index)).map(parse_price)
+        if 'Costo' in unidos.columns:
+            costo_catalogo = unidos['Costo'].map(parse_price)
+            costo_cargado = costo_cargado.where(~(encontrado & (costo_cargado == 0)), costo_catalogo)
+        if columna_stock_tienda in unidos.columns:
+            stock = unidos[columna_stock_tienda].where(encontrado, 0).fillna(0)
+            if pd.api.types.is_integer_dtype(productos_df[columna_stock_tienda]):
+                stock = stock.astype(int)
+        else:
+            stock = pd.Series(0, index=items.index)
+
+        return [
+            {
+                'Referencia': item_row.get('Referencia'),
+                'Producto': item_row.get('Producto'),
+                'Cantidad': int(item_row.get('Cantidad', 0)),
+                'Precio Unitario': parse_price(item_row.get('Precio_Unitario', '0')),
+                'Descuento (%)': parse_price(item_row.get('Descuento_Porc', '0')),
+                'Total': parse_price(item_row.get('Total_Item', '0')),
+                'Stock': stock_actual,
+                'Costo': costo
+            }
+            for item_row, stock_actual, costo in zip(items.to_dict('records'), stock.tolist(), costo_cargado.tolist())
+        ]
+
+    # --- Serialización ---
+    def a_dict(self):
+        """Lo mínimo para reconstruir la cotización: los totales se recalculan al cargarla."""
+        return {
+            'version': VERSION_ESTADO,
+            'numero_propuesta': self.numero_propuesta,
+            'cliente': self.cliente_actual,
+            'vendedor': self.vendedor,
+            'tienda_despacho': self.tienda_despacho,
+            'observaciones': self.observaciones,
+            'status': self.status,
+            'lineas': self.lineas.a_columnas(),
+            'detalle_nube': self.detalle_nube,
+        }
+
+    def serializar(self):
+        """`a_dict` como JSON compacto comprimido con zlib."""
+        texto = json.dumps(self.a_dict(), ensure_ascii=False, separators=(',', ':'), default=_valor_json)
+        return zlib.compress(texto.encode('utf-8'))
+
+    @classmethod
+    def desde_dict(cls, datos):
+        version = datos.get('version')
+        while version in _MIGRACIONES_ESTADO:
+            datos = _MIGRACIONES_ESTADO[version](datos)
+            version = datos.get('version')
+        if version != VERSION_ESTADO:
+            raise ValueError(f"Versión de estado no soportada: {version!r}")
+        state = cls()
+        state.numero_propuesta = datos['numero_propuesta']
+        state.cliente_actual = datos['cliente']
+        state.vendedor = datos['vendedor']
+        state.tienda_despacho = datos['tienda_despacho']
+        state.observaciones = datos['observaciones']
+        state.status = datos['status']
+        state.lineas = LineasCotizacion.desde_columnas(datos['lineas'])
+        state.detalle_nube = datos.get('detalle_nube')
+        state._actualizar_totales()
+        return state
+
+    @classmethod
+    def deserializar(cls, datos):
+        return cls.desde_dict(json.loads(zlib.decompress(datos)))
+
     def persist_to_session(self):
-        st.session_state.state = self
+        # Una cotización de paso no reemplaza la de trabajo: sólo ocupa el lugar si está libre.
+        if st.session_state.get('state') is None:
+            st.session_state.state = self
+        guardar_estado_sesion(self)
+
+
+# --- ESTADO POR SESIÓN ---
+def estado_de_sesion(almacen=None):
+    """
+    Cotización de la sesión actual. Con un `almacen` de sesiones (ver
+    `utils.conectar_almacen_sesiones`) la sesión se identifica con el parámetro `?sesion=`
+    de la URL: si la sesión de Streamlit es nueva (otro proceso detrás del balanceador o
+    un reinicio del servidor) el borrador se recupera del almacén.
+    """
+    if almacen is not None:
+        id_sesion = st.session_state.get('id_sesion') or st.query_params.get(PARAMETRO_SESION)
+        if not id_sesion or not _ID_SESION.fullmatch(id_sesion):
+            id_sesion = uuid.uuid4().hex
+        st.session_state.id_sesion = id_sesion
+        if st.query_params.get(PARAMETRO_SESION) != id_sesion:
+            st.query_params[PARAMETRO_SESION] = id_sesion
+        if 'state' not in st.session_state:
+            st.session_state.state = _restaurar_estado(almacen, id_sesion) or QuoteState()
+    elif 'state' not in st.session_state:
+        st.session_state.state = QuoteState()
+    return st.session_state.state
+
+
+def _restaurar_estado(almacen, id_sesion):
+    try:
+        datos = almacen.cargar(id_sesion)
+        return QuoteState.deserializar(datos) if datos else None
+    except Exception as e:
+        st.warning(f"No se pudo recuperar el borrador de la sesión: {e}")
+        return None
+
+
+def guardar_estado_sesion(state):
+    """
+    Marca el borrador de la sesión para el autoguardado, si la sesión tiene almacén. Es
+    barato (no serializa ni escribe): la escritura ocurre en segundo plano. Sólo se guarda
+    la cotización de trabajo (`st.session_state.state`); cualquier otro `state` se ignora.
+    """
+    id_sesion = st.session_state.get('id_sesion')
+    if not id_sesion or st.session_state.get('state') is not state:
+        return
+    autoguardado = conectar_autoguardado()
+    if autoguardado is not None:
+        autoguardado.marcar(id_sesion, state)
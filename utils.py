@@ -1,9 +1,6 @@
 # utils.py
 import streamlit as st
-import gspread
 import pandas as pd
-from google.oauth2.service_account import Credentials
-from fpdf import FPDF
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -12,9 +9,24 @@ from pathlib import Path
 from datetime import datetime
 from io import BytesIO
 import re
+import unicodedata
 import urllib.parse
+from bisect import bisect_left
+import numpy as np
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
+from snapshot import SnapshotMaestros
+from cambios import MonitorCambios
+from sincronizacion import EjecutorSincronizacion
+from cache_pdf import CachePDF, huella_contenido
+from plantilla_pdf import DocumentoConPlantilla
+from recursos_imagen import ancho_px_para_mm
+from sesiones import crear_almacen_sesiones
+from autoguardado import INTERVALO_AUTOGUARDADO, AutoguardadoBorradores
+from almacenamiento import (
+    RepositorioGSheets, RepositorioSQLite, RUTA_SQLITE, conectar_workbook,
+    PROPUESTAS_SHEET_NAME, DETALLE_PROPUESTAS_SHEET_NAME, PRODUCTOS_SHEET_NAME, CLIENTES_SHEET_NAME
+)
 
 # --- INICIO DEL CAMBIO ---
 # Se añade una función centralizada y robusta para convertir strings a precios (números flotantes).
@@ -60,15 +72,11 @@ def parse_price(value):
 
 # --- CONSTANTES ---
 LOGO_FILE_PATH = Path("superior.png")
+# Ancho con que se dibuja el logo en el encabezado del PDF (mm).
+ANCHO_LOGO_PDF_MM = 80
 TASA_IVA = 0.19
 COLOR_AZUL = (0, 51, 102)
 
-# --- Nombres de las hojas de Google Sheets ---
-PROPUESTAS_SHEET_NAME = "Cotizaciones"
-DETALLE_PROPUESTAS_SHEET_NAME = "Cotizaciones_Items"
-PRODUCTOS_SHEET_NAME = "Productos"
-CLIENTES_SHEET_NAME = "Clientes"
-
 # --- Nombres de las columnas ---
 CLIENTE_NOMBRE_COL = "Nombre"
 CLIENTE_EMAIL_COL = "E-Mail"
@@ -79,6 +87,8 @@ PRECIOS_COLS = [
     "Lista 100123 Construaliados"
 ]
 PROPUESTA_CLIENTE_COL = "cliente_nombre"
+# Productos y Clientes se descargan y cachean juntos en el snapshot local.
+DATOS_MAESTROS = "datos_maestros"
 ESTADOS_COTIZACION = ["Borrador", "Enviada", "Aceptada", "Rechazada"]
 
 # --- CONEXIÓN A GOOGLE SHEETS ---
@@ -86,74 +96,489 @@ ESTADOS_COTIZACION = ["Borrador", "Enviada", "Aceptada", "Rechazada"]
 def connect_to_gsheets():
     """Establece la conexión con Google Sheets y Google Drive."""
     try:
-        creds = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=[
-                "https://www.googleapis.com/auth/spreadsheets",
-                "https://www.googleapis.com/auth/drive"
-            ],
-        )
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(st.secrets["gsheets"]["spreadsheet_key"])
-        workbook.creds = creds
-        return workbook
+        return conectar_workbook(st.secrets["gcp_service_account"], st.secrets["gsheets"]["spreadsheet_key"])
     except Exception as e:
         st.error(f"Error de conexión con Google Sheets o Drive: {e}")
         return None
 
+# --- MOTOR DE ALMACENAMIENTO ---
+@st.cache_resource
+def conectar_almacenamiento():
+    """
+    Devuelve el repositorio de datos configurado en `secrets.toml`:
+
+        [almacenamiento]
+        motor = "sqlite"            # "gsheets" (por defecto) o "sqlite"
+        ruta = ".cache/cotizador.sqlite"
+
+    El resto de la app sólo usa la interfaz `Repositorio`, así que cambiar de motor no
+    requiere tocar las páginas.
+    """
+    configuracion = st.secrets.get("almacenamiento", {})
+    motor = configuracion.get("motor", "gsheets")
+    if motor == "sqlite":
+        try:
+            return RepositorioSQLite(configuracion.get("ruta", RUTA_SQLITE))
+        except Exception as e:
+            st.error(f"Error al abrir la base de datos local: {e}")
+            return None
+    workbook = connect_to_gsheets()
+    return RepositorioGSheets(workbook) if workbook else None
+
+# --- ALMACÉN DE SESIONES ---
+@st.cache_resource
+def conectar_almacen_sesiones():
+    """
+    Devuelve el almacén de sesiones configurado en `secrets.toml`, o None con
+    `motor = "ninguno"` (el estado de la cotización vive sólo en la memoria de este proceso):
+
+        [sesiones]
+        motor = "sqlite"            # "sqlite" (por defecto), "archivos" o "ninguno"
+        ruta = ".cache/sesiones.sqlite"
+        dias_retencion = 30
+        intervalo_autoguardado = 5  # segundos entre escrituras de los borradores
+    """
+    try:
+        return crear_almacen_sesiones(st.secrets.get("sesiones", {}))
+    except Exception as e:
+        st.error(f"Error al abrir el almacén de sesiones: {e}")
+        return None
+
+@st.cache_resource
+def conectar_autoguardado():
+    """Autoguardado de borradores del proceso sobre el almacén de sesiones; None si no hay almacén."""
+    almacen = conectar_almacen_sesiones()
+    if almacen is None:
+        return None
+    return AutoguardadoBorradores(almacen, st.secrets.get("sesiones", {}).get("intervalo_autoguardado", INTERVALO_AUTOGUARDADO))
+
+def vaciar_borrador_sesion():
+    """Escribe ya el borrador pendiente de la sesión actual, sin esperar al autoguardado."""
+    id_sesion = st.session_state.get('id_sesion')
+    autoguardado = conectar_autoguardado() if id_sesion else None
+    if autoguardado is not None:
+        autoguardado.vaciar(id_sesion)
+
+# --- DETECCIÓN DE CAMBIOS EN LOS DATOS ---
+@st.cache_resource
+def obtener_monitor_cambios(_repositorio):
+    """Monitor compartido por el proceso; sondea la marca de cambios del repositorio."""
+    return MonitorCambios(_repositorio.marca_cambios)
+
+def clave_datos(repositorio, dataset):
+    """Clave de caché de un dataset: cambia sólo cuando la hoja pudo haber cambiado."""
+    return obtener_monitor_cambios(repositorio).clave(dataset)
+
+def registrar_escritura(repositorio, *datasets):
+    """Invalida sólo los datasets escritos por la app, en lugar de `st.cache_data.clear()`."""
+    obtener_monitor_cambios(repositorio).registrar_escritura(*datasets)
+
 # --- CARGA DE DATOS (CON OPTIMIZACIÓN PARA BÚSQUEDA) ---
-@st.cache_data(ttl=600)
-def cargar_datos_maestros(_workbook):
-    """Carga los dataframes de productos y clientes y crea un índice de búsqueda."""
-    if not _workbook:
+@st.cache_resource
+def obtener_snapshot_maestros():
+    """Snapshot local de productos y clientes, compartido por todas las sesiones del proceso."""
+    return SnapshotMaestros()
+
+def _preparar_productos(df_productos, version):
+    """Crea la columna de búsqueda y anota la versión del snapshot de la que sale el DataFrame."""
+    # --- OPTIMIZACIÓN CLAVE: Crear un índice de búsqueda ---
+    df_productos['search_index'] = construir_texto_busqueda(
+        df_productos[NOMBRE_PRODUCTO_COL].astype(str) + ' ' +
+        df_productos['Referencia'].astype(str) + ' ' +
+        df_productos.get('Categoria', pd.Series(index=df_productos.index, dtype=str)).fillna('')
+    )
+    # En `attrs` sólo va la versión: `st.cache_data` deserializa el DataFrame, attrs
+    # incluidos, en cada ejecución. El índice, las particiones y el catálogo por referencia
+    # viven en `st.cache_resource` (`recursos_catalogo`).
+    df_productos.attrs[VERSION_CATALOGO_ATTR] = version
+    return df_productos
+
+@st.cache_data(max_entries=2)
+def _cargar_snapshot_maestros(version):
+    """Lee y prepara el snapshot; `version` es la clave del caché."""
+    df_productos, df_clientes, _ = obtener_snapshot_maestros().cargar()
+    return _preparar_productos(df_productos, version), df_clientes
+
+class RecursosCatalogo:
+    """
+    Estructuras derivadas del catálogo de productos, construidas una vez por versión del
+    snapshot: el índice invertido de búsqueda, las particiones por categoría y el catálogo
+    por referencia. Se comparten con `st.cache_resource`, sin copiarse ni deserializarse en cada ejecución
+    de la página.
+    """
+    def __init__(self, df_productos):
+        self.total_filas = len(df_productos)
+        self.indice = IndiceBusqueda(df_productos['search_index'])
+        self.particiones = ParticionesCategoria(df_productos.get('Categoria'), len(df_productos))
+        self.catalogo = CatalogoProductos(df_productos)
+
+@st.cache_resource(max_entries=2)
+def _recursos_catalogo(version, _df_productos):
+    """`version` es la clave del caché; `_df_productos` (sin hashear) sólo se usa al construir."""
+    return RecursosCatalogo(_df_productos)
+
+def recursos_catalogo(df_productos):
+    """
+    Recursos de la versión del snapshot de la que sale `df_productos` (la anotada en su
+    `attrs`), o None si el DataFrame no sale de un snapshot o es un subconjunto de filas.
+    """
+    version = df_productos.attrs.get(VERSION_CATALOGO_ATTR)
+    if version is None:
+        return None
+    recursos = _recursos_catalogo(version, df_productos)
+    return recursos if recursos.total_filas == len(df_productos) else None
+
+def cargar_datos_maestros(_repositorio):
+    """
+    Carga los dataframes de productos y clientes y crea un índice de búsqueda.
+
+    Los datos salen del snapshot local, así que la página no espera a Google Sheets:
+    sólo la primera carga (sin snapshot) es bloqueante. Cuando el monitor de cambios
+    indica que el libro cambió, el snapshot se refresca en segundo plano y la versión
+    nueva se usa en cuanto termina de publicarse.
+    """
+    if not _repositorio:
         return pd.DataFrame(), pd.DataFrame()
     try:
-        productos_sheet = _workbook.worksheet(PRODUCTOS_SHEET_NAME)
-        df_productos = pd.DataFrame(productos_sheet.get_all_records())
-
-        # --- OPTIMIZACIÓN CLAVE: Crear un índice de búsqueda ---
-        df_productos['search_index'] = (
-            df_productos[NOMBRE_PRODUCTO_COL].astype(str) + ' ' +
-            df_productos['Referencia'].astype(str) + ' ' +
-            df_productos.get('Categoria', pd.Series(index=df_productos.index, dtype=str)).fillna('')
-        ).str.lower()
-        
-        clientes_sheet = _workbook.worksheet(CLIENTES_SHEET_NAME)
-        df_clientes = pd.DataFrame(clientes_sheet.get_all_records())
+        snapshot = obtener_snapshot_maestros()
+        monitor = obtener_monitor_cambios(_repositorio)
+        if snapshot.existe() and snapshot.origen is None:
+            snapshot.origen = monitor.sembrar(DATOS_MAESTROS, snapshot.marca)
+        generacion = monitor.clave(DATOS_MAESTROS)
+        descargar = _repositorio.leer_maestros
+        if not snapshot.existe():
+            snapshot.refrescar(descargar, monitor.marca_actual(), generacion)
+        elif snapshot.origen != generacion:
+            snapshot.refrescar_en_segundo_plano(descargar, monitor.marca_actual(), generacion)
+        df_productos, df_clientes = _cargar_snapshot_maestros(snapshot.version)
+        # Se construyen aquí, con el catálogo completo, la primera vez que aparece la versión.
+        recursos_catalogo(df_productos)
         return df_productos, df_clientes
     except Exception as e:
         st.error(f"Ocurrió un error al cargar los datos maestros: {e}")
         return pd.DataFrame(), pd.DataFrame()
 
+def refrescar_datos_maestros(repositorio):
+    """
+    Descarga productos y clientes de inmediato tras una escritura propia (crear un
+    cliente o sincronizar stock). Si falla, se conserva el snapshot anterior y el error
+    queda en `ultimo_error`.
+    """
+    return refresco_maestros_diferido(repositorio)()
+
+def refresco_maestros_diferido(repositorio):
+    """
+    Devuelve una función sin argumentos que hace `refrescar_datos_maestros`. Los recursos
+    cacheados se resuelven aquí, así que la función puede llamarse desde un hilo de fondo.
+    """
+    snapshot = obtener_snapshot_maestros()
+    monitor = obtener_monitor_cambios(repositorio)
+    return lambda: _refrescar_maestros(repositorio, snapshot, monitor)
+
+def _refrescar_maestros(repositorio, snapshot, monitor):
+    try:
+        monitor.registrar_escritura(DATOS_MAESTROS)
+        generacion = monitor.clave(DATOS_MAESTROS)
+        snapshot.refrescar(repositorio.leer_maestros, monitor.marca_actual(), generacion)
+        return True
+    except Exception as e:
+        snapshot.ultimo_error = str(e)
+        return False
+
+# --- SINCRONIZACIÓN DE PRECIOS Y STOCK ---
+@st.cache_resource
+def obtener_ejecutor_sincronizacion():
+    """Ejecutor de la sincronización, compartido por todas las sesiones del proceso."""
+    return EjecutorSincronizacion()
+
+# --- NORMALIZACIÓN E ÍNDICE INVERTIDO PARA LA BÚSQUEDA ---
+VERSION_CATALOGO_ATTR = "version_catalogo"
+UMBRAL_SIMILITUD_TRIGRAMAS = 0.5
+LONGITUD_MINIMA_DIFUSA = 4
+
+def normalizar_texto(texto):
+    """Minúsculas y sin tildes: 'Galón Acrílico' -> 'galon acrilico'."""
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+_PATRON_NO_ALFANUMERICO = re.compile(r'[\W_]+')
+_PATRON_ALFANUMERICO_MIXTO = re.compile(r'[a-z]\S*\d|\d\S*[a-z]')
+_PATRON_PARTES_REFERENCIA = re.compile(r'[a-z]+|\d+')
+
+def _expandir_referencias(texto):
+    """
+    Añade variantes de los tokens alfanuméricos para que las referencias se encuentren
+    escritas de cualquier forma: 'vt-1501a' agrega 'vt1501a', 'vt', '1501' y 'a'.
+    """
+    extras = []
+    for token in texto.split():
+        if not _PATRON_ALFANUMERICO_MIXTO.search(token):
+            continue
+        compacto = _PATRON_NO_ALFANUMERICO.sub('', token)
+        if compacto != token:
+            extras.append(compacto)
+        extras.extend(_PATRON_PARTES_REFERENCIA.findall(compacto))
+    return f"{texto} {' '.join(extras)}" if extras else texto
+
+def construir_texto_busqueda(textos):
+    """Normaliza una serie de textos para la columna `search_index`."""
+    normalizados = (
+        textos.astype(str).str.lower().str.normalize('NFKD')
+        .str.replace('[\u0300-\u036f]', '', regex=True)
+    )
+    con_referencias = normalizados.str.contains(_PATRON_ALFANUMERICO_MIXTO.pattern, na=False)
+    normalizados[con_referencias] = normalizados[con_referencias].map(_expandir_referencias)
+    return normalizados
+
+def _trigramas(token):
+    relleno = f"  {token} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+class ParticionesCategoria:
+    """Posiciones (iloc) de las filas de cada categoría, precalculadas al cargar el catálogo."""
+    def __init__(self, categorias, total_filas):
+        self.total_filas = total_filas
+        self._posiciones = {}
+        if categorias is not None:
+            codigos, valores = pd.factorize(categorias)
+            orden = np.argsort(codigos, kind='stable')
+            limites = np.searchsorted(codigos[orden], np.arange(len(valores) + 1))
+            self._posiciones = {
+                valor: orden[limites[i]:limites[i + 1]] for i, valor in enumerate(valores)
+            }
+
+    def posiciones(self, categoria):
+        return self._posiciones.get(categoria, np.empty(0, dtype=np.int64))
+
+class IndiceBusqueda:
+    """
+    Índice invertido sobre la columna `search_index`: cada token apunta a la lista
+    ordenada de posiciones (iloc) de las filas que lo contienen.
+
+    Para soportar búsquedas por prefijo y subcadena se guardan todos los sufijos del
+    vocabulario ordenados: los tokens que contienen una palabra son un rango contiguo
+    encontrado con `bisect`, así que una consulta cuesta en proporción a las coincidencias
+    y no al tamaño del catálogo.
+
+    Si una palabra no aparece en ningún token (p. ej. 'blnco'), se recurre a un índice de
+    trigramas de caracteres del vocabulario y se puntúan los tokens parecidos según su
+    coeficiente de Dice.
+    """
+    def __init__(self, textos):
+        tokens = pd.Series(textos.to_numpy()).fillna('').astype(str).str.split().explode().dropna()
+        pares = pd.DataFrame({'token': tokens.to_numpy(), 'fila': tokens.index.to_numpy()}).drop_duplicates()
+        codigos, vocabulario = pd.factorize(pares['token'], sort=True)
+        filas = pares['fila'].to_numpy(dtype=np.int64)
+        orden = np.lexsort((filas, codigos))
+
+        self.total_filas = len(textos)
+        self.vocabulario = list(vocabulario)
+        self._filas = filas[orden].astype(np.int32)
+        self._inicios = np.searchsorted(codigos[orden], np.arange(len(self.vocabulario) + 1))
+
+        sufijos = sorted((token[i:], t) for t, token in enumerate(self.vocabulario) for i in range(len(token)))
+        self._sufijos = [sufijo for sufijo, _ in sufijos]
+        self._sufijo_token = np.fromiter((t for _, t in sufijos), dtype=np.int32, count=len(sufijos))
+
+        trigramas_por_token = [_trigramas(token) for token in self.vocabulario]
+        self._total_trigramas = np.array([len(trigramas) for trigramas in trigramas_por_token], dtype=np.int32)
+        tokens_por_trigrama = {}
+        for t, trigramas in enumerate(trigramas_por_token):
+            for trigrama in trigramas:
+                tokens_por_trigrama.setdefault(trigrama, []).append(t)
+        self._trigramas = {trigrama: np.array(tokens, dtype=np.int32) for trigrama, tokens in tokens_por_trigrama.items()}
+
+    def tokens_que_contienen(self, palabra):
+        """Ids de los tokens del vocabulario que contienen `palabra` como subcadena."""
+        inicio = bisect_left(self._sufijos, palabra)
+        fin = bisect_left(self._sufijos, palabra + '\U0010ffff', lo=inicio)
+        return np.unique(self._sufijo_token[inicio:fin])
+
+    def tokens_similares(self, palabra):
+        """Ids y similitud (Dice sobre trigramas) de los tokens parecidos a `palabra`."""
+        trigramas = _trigramas(palabra)
+        listas = [self._trigramas[trigrama] for trigrama in trigramas if trigrama in self._trigramas]
+        if not listas:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        tokens, comunes = np.unique(np.concatenate(listas), return_counts=True)
+        similitud = 2 * comunes / (len(trigramas) + self._total_trigramas[tokens])
+        mascara = similitud >= UMBRAL_SIMILITUD_TRIGRAMAS
+        return tokens[mascara], similitud[mascara]
+
+    def _filas_de(self, tokens):
+        return [self._filas[self._inicios[t]:self._inicios[t + 1]] for t in tokens]
+
+    def filas_con(self, palabra):
+        """
+        Devuelve (filas, score) para una palabra: 1.0 en las filas que la contienen y,
+        si no hay ninguna, la mejor similitud de los tokens parecidos de cada fila.
+        """
+        listas = self._filas_de(self.tokens_que_contienen(palabra))
+        if listas:
+            filas = np.unique(np.concatenate(listas))
+            return filas, np.ones(len(filas))
+
+        if len(palabra) < LONGITUD_MINIMA_DIFUSA:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        tokens, similitud = self.tokens_similares(palabra)
+        listas = self._filas_de(tokens)
+        if not listas:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        filas = np.concatenate(listas)
+        puntajes = np.repeat(similitud, [len(lista) for lista in listas])
+        orden = np.lexsort((-puntajes, filas))
+        filas, primeras = np.unique(filas[orden], return_index=True)
+        return filas, puntajes[orden][primeras]
+
+    def puntuar(self, palabras):
+        """
+        Devuelve (filas, score) para las filas con al menos una coincidencia. El score
+        suma 1 por cada palabra de la consulta contenida en la fila, o su similitud si
+        la coincidencia es aproximada.
+        """
+        resultados = [self.filas_con(palabra) for palabra in palabras]
+        if not resultados:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        filas, inversa = np.unique(np.concatenate([filas for filas, _ in resultados]), return_inverse=True)
+        scores = np.bincount(inversa, weights=np.concatenate([scores for _, scores in resultados]), minlength=len(filas))
+        return filas, scores
+
+# --- CATÁLOGO POR REFERENCIA ---
+def _columna_stock(tienda):
+    """'CEDI' o 'Stock CEDI' -> 'Stock CEDI'."""
+    return tienda if tienda.startswith('Stock ') else f"Stock {tienda}"
+
+class ProductoCatalogo:
+    """Registro compacto de un producto: precios y costo ya convertidos a número, stock por tienda."""
+    __slots__ = ('referencia', 'descripcion', 'precios', 'costo', '_stock', '_tiendas')
+
+    def __init__(self, referencia, descripcion, precios, costo, stock, tiendas):
+        self.referencia = referencia
+        self.descripcion = descripcion
+        self.precios = precios
+        self.costo = costo
+        self._stock = stock
+        self._tiendas = tiendas
+
+    def opciones_precio(self):
+        """{lista de `PRECIOS_COLS`: precio} con sólo los precios definidos (mayores que 0)."""
+        return {columna: precio for columna, precio in zip(PRECIOS_COLS, self.precios.tolist()) if precio > 0}
+
+    def stock_en(self, tienda):
+        """Stock de la tienda (con o sin el prefijo 'Stock '); 0 si la tienda no existe."""
+        posicion = self._tiendas.get(_columna_stock(tienda)) if tienda else None
+        return 0 if posicion is None else self._stock[posicion].item()
+
+class CatalogoProductos:
+    """
+    Índice hash de `Referencia` a la posición (iloc) del producto, con los precios de
+    `PRECIOS_COLS` y el costo convertidos con `parse_price` una sola vez y el stock de cada
+    tienda en una matriz. Se construye al cargar el catálogo, así que ubicar un producto,
+    leer sus precios o el stock de una tienda no vuelve a filtrar ni a convertir nada.
+    Con referencias repetidas vale la primera fila, como el filtro que reemplaza.
+    """
+    def __init__(self, df_productos):
+        filas = len(df_productos)
+        self.total_filas = filas
+        self._indice = df_productos.index
+        self._referencias = df_productos['Referencia'].tolist() if 'Referencia' in df_productos.columns else [None] * filas
+        self._descripciones = (df_productos[NOMBRE_PRODUCTO_COL].tolist() if NOMBRE_PRODUCTO_COL in df_productos.columns
+                               else [None] * filas)
+        self._posiciones = {}
+        for posicion, referencia in enumerate(self._referencias):
+            self._posiciones.setdefault(referencia, posicion)
+
+        def convertir(columna):
+            if columna not in df_productos.columns:
+                return np.zeros(filas)
+            serie = df_productos[columna]
+            codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+            # Cada valor distinto se convierte una sola vez.
+            return np.array([parse_price(valor) for valor in valores], dtype=np.float64)[codigos]
+
+        self.precios = np.column_stack([convertir(columna) for columna in PRECIOS_COLS])
+        self.costos = convertir('Costo')
+        columnas_stock = [columna for columna in df_productos.columns if columna.lower().startswith('stock ')]
+        self._tiendas = {columna: i for i, columna in enumerate(columnas_stock)}
+        stock = df_productos[columnas_stock].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        # Enteros si todo el stock es entero, para mostrarlo como '5' y no '5.0'.
+        self.stock = stock.astype(np.int64) if np.array_equal(stock, np.round(stock)) else stock
+
+    def __len__(self):
+        return self.total_filas
+
+    def posicion(self, referencia):
+        return self._posiciones.get(referencia)
+
+    def producto(self, referencia):
+        """Registro del producto de `referencia`, o None si no está en el catálogo."""
+        posicion = self._posiciones.get(referencia)
+        if posicion is None:
+            return None
+        return ProductoCatalogo(
+            self._referencias[posicion], self._descripciones[posicion], self.precios[posicion],
+            float(self.costos[posicion]), self.stock[posicion], self._tiendas
+        )
+
+    def stock_de_filas(self, etiquetas, tienda):
+        """Stock de la tienda para las filas con esas etiquetas de índice (p. ej. `resultados.index`)."""
+        columna = self._tiendas.get(_columna_stock(tienda)) if tienda else None
+        if columna is None:
+            return [0] * len(etiquetas)
+        return self.stock[self._indice.get_indexer(etiquetas), columna].tolist()
+
+def catalogo_productos(df_productos):
+    """El catálogo precalculado de la versión del snapshot, o uno nuevo si el DataFrame no sale de uno."""
+    recursos = recursos_catalogo(df_productos)
+    return recursos.catalogo if recursos is not None else CatalogoProductos(df_productos)
+
 # --- NUEVO MOTOR DE BÚSQUEDA INTELIGENTE ---
 def buscar_productos_inteligentemente(query, df_productos, categoria="Todas"):
     """
     Busca productos basado en un sistema de puntuación de múltiples palabras clave.
+    La consulta se normaliza (sin tildes ni mayúsculas) y, con el índice invertido creado
+    en `cargar_datos_maestros`, tolera errores de digitación mediante trigramas.
     """
     if not query and categoria == "Todas":
         return pd.DataFrame()
 
-    resultados = df_productos.copy()
+    recursos = recursos_catalogo(df_productos)
+    if not query or recursos is None:
+        return _buscar_productos_vectorizado(query, df_productos, categoria)
+
+    query_words = set(normalizar_texto(query).split())
+    filas, scores = recursos.indice.puntuar(query_words)
     if categoria != "Todas":
-        resultados = resultados[resultados['Categoria'] == categoria]
+        mascara = df_productos['Categoria'].to_numpy()[filas] == categoria
+        filas, scores = filas[mascara], scores[mascara]
 
-    if not query:
-        return resultados
+    resultados = df_productos.iloc[filas].assign(score=scores)
+    return resultados.sort_values(by='score', ascending=False)
+
+def _buscar_productos_vectorizado(query, df_productos, categoria="Todas"):
+    """
+    Motor de respaldo cuando no hay índice invertido para el DataFrame: una pasada
+    vectorizada de `str.contains` por palabra sobre la columna completa y suma de los
+    resultados. El filtro de categoría usa las particiones precalculadas si existen.
+    """
+    recursos = recursos_catalogo(df_productos)
+    if categoria == "Todas":
+        resultados = df_productos
+    elif recursos is not None:
+        resultados = df_productos.iloc[recursos.particiones.posiciones(categoria)]
+    else:
+        resultados = df_productos[df_productos['Categoria'] == categoria]
 
-    query_words = set(query.lower().split())
+    if not query:
+        return resultados.copy()
 
-    def calcular_score(row):
-        score = 0
-        search_text = row['search_index']
-        for word in query_words:
-            if word in search_text:
-                score += 1
-        return score
+    textos = resultados['search_index']
+    score = np.zeros(len(resultados), dtype=np.int64)
+    for word in set(normalizar_texto(query).split()):
+        score += textos.str.contains(word, regex=False, na=False).to_numpy(dtype=bool)
 
-    resultados['score'] = resultados.apply(calcular_score, axis=1)
-    resultados_filtrados = resultados[resultados['score'] > 0]
-    resultados_ordenados = resultados_filtrados.sort_values(by='score', ascending=False)
-    return resultados_ordenados
+    mascara = score > 0
+    return resultados[mascara].assign(score=score[mascara]).sort_values(by='score', ascending=False)
 
 def get_tiendas_from_df(df_productos):
     if df_productos.empty:
@@ -162,115 +587,110 @@ def get_tiendas_from_df(df_productos):
     tiendas = [col.split(' ', 1)[1] for col in stock_cols]
     return sorted(tiendas)
 
-@st.cache_data(ttl=60)
-def listar_propuestas_df(_workbook):
-    if not _workbook:
+@st.cache_data(max_entries=4)
+def _leer_hoja_df(_repositorio, nombre_hoja, clave):
+    """Lee una tabla completa; `clave` (de `clave_datos`) decide cuándo se repite."""
+    if nombre_hoja == PROPUESTAS_SHEET_NAME:
+        return _repositorio.listar_propuestas()
+    return _repositorio.listar_detalle()
+
+def listar_propuestas_df(_repositorio):
+    if not _repositorio:
         return pd.DataFrame()
     try:
-        sheet = _workbook.worksheet(PROPUESTAS_SHEET_NAME)
-        return pd.DataFrame(sheet.get_all_records())
+        return _leer_hoja_df(_repositorio, PROPUESTAS_SHEET_NAME, clave_datos(_repositorio, PROPUESTAS_SHEET_NAME))
     except Exception:
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
-def listar_detalle_propuestas_df(_workbook):
-    if not _workbook:
+def listar_detalle_propuestas_df(_repositorio):
+    if not _repositorio:
         return pd.DataFrame()
     try:
-        sheet = _workbook.worksheet(DETALLE_PROPUESTAS_SHEET_NAME)
-        return pd.DataFrame(sheet.get_all_records())
+        return _leer_hoja_df(_repositorio, DETALLE_PROPUESTAS_SHEET_NAME, clave_datos(_repositorio, DETALLE_PROPUESTAS_SHEET_NAME))
     except Exception:
         return pd.DataFrame()
 
-def handle_save(workbook, state):
+def handle_save(repositorio, state):
     if not state.cliente_actual:
         st.warning("Por favor, seleccione un cliente antes de guardar.")
         return
     if not state.tienda_despacho:
         st.warning("Por favor, seleccione una Tienda de Despacho antes de guardar.")
         return
-    if not state.cotizacion_items:
+    if not state.lineas:
         st.warning("No hay productos en la cotización para guardar.")
         return
+    # El borrador local queda al día aunque la nube falle.
+    vaciar_borrador_sesion()
     with st.spinner("Guardando propuesta..."):
         if state.numero_propuesta and "TEMP" not in state.numero_propuesta:
-            exito, mensaje = actualizar_propuesta_en_sheets(workbook, state)
+            exito, mensaje = actualizar_propuesta_en_sheets(repositorio, state)
         else:
-            exito, mensaje = guardar_nueva_propuesta_en_sheets(workbook, state)
+            exito, mensaje = guardar_nueva_propuesta_en_sheets(repositorio, state)
         if exito:
             st.success(mensaje)
             st.balloons()
-            st.cache_data.clear()
+            registrar_escritura(repositorio, PROPUESTAS_SHEET_NAME, DETALLE_PROPUESTAS_SHEET_NAME)
+            state.persist_to_session()
         else:
             st.error(mensaje)
 
-def guardar_nueva_propuesta_en_sheets(workbook, state):
+def _fila_propuesta(state):
+    return [
+        state.numero_propuesta, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), state.vendedor,
+        state.cliente_actual.get(CLIENTE_NOMBRE_COL, ""), state.cliente_actual.get("NIF", ""),
+        state.status, float(state.subtotal_bruto), float(state.descuento_total),
+        float(state.total_general), float(state.costo_total), float(state.margen_absoluto),
+        float(state.margen_porcentual), state.observaciones, state.tienda_despacho
+    ]
+
+def _filas_detalle(state):
+    detalle_rows = []
+    for item in state.cotizacion_items:
+        descuento_valor = (item.get('Cantidad', 0) * item.get('Precio Unitario', 0)) * (item.get('Descuento (%)', 0) / 100)
+        detalle_rows.append([
+            state.numero_propuesta, item.get('Referencia', ''), item.get('Producto', ''),
+            int(item.get('Cantidad', 0)), float(item.get('Precio Unitario', 0)),
+            float(item.get('Costo', 0)), float(item.get('Descuento (%)', 0)),
+            float(item.get('Total', 0)), int(item.get('Stock', 0)), float(descuento_valor)
+        ])
+    return detalle_rows
+
+def _columnas_items(filas_detalle):
+    """Filas de detalle sin el número de propuesta: lo que decide si una línea cambió."""
+    return [list(fila[1:]) for fila in filas_detalle]
+
+def guardar_nueva_propuesta_en_sheets(repositorio, state):
     try:
-        propuestas_sheet = workbook.worksheet(PROPUESTAS_SHEET_NAME)
-        detalle_sheet = workbook.worksheet(DETALLE_PROPUESTAS_SHEET_NAME)
-        last_id = len(propuestas_sheet.get_all_records())
-        nuevo_numero = f"PROP-{datetime.now().year}-{last_id + 1:04d}"
+        consecutivo = repositorio.siguiente_consecutivo()
+        nuevo_numero = f"PROP-{datetime.now().year}-{consecutivo:04d}"
         state.set_numero_propuesta(nuevo_numero)
-        propuesta_row = [
-            state.numero_propuesta, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), state.vendedor,
-            state.cliente_actual.get(CLIENTE_NOMBRE_COL, ""), state.cliente_actual.get("NIF", ""),
-            state.status, float(state.subtotal_bruto), float(state.descuento_total),
-            float(state.total_general), float(state.costo_total), float(state.margen_absoluto),
-            float(state.margen_porcentual), state.observaciones, state.tienda_despacho
-        ]
-        propuestas_sheet.append_row(propuesta_row, value_input_option='USER_ENTERED')
-        detalle_rows = []
-        for item in state.cotizacion_items:
-            descuento_valor = (item.get('Cantidad', 0) * item.get('Precio Unitario', 0)) * (item.get('Descuento (%)', 0) / 100)
-            detalle_rows.append([
-                state.numero_propuesta, item.get('Referencia', ''), item.get('Producto', ''),
-                int(item.get('Cantidad', 0)), float(item.get('Precio Unitario', 0)),
-                float(item.get('Costo', 0)), float(item.get('Descuento (%)', 0)),
-                float(item.get('Total', 0)), int(item.get('Stock', 0)), float(descuento_valor)
-            ])
-        if detalle_rows:
-            detalle_sheet.append_rows(detalle_rows, value_input_option='USER_ENTERED')
+        filas_detalle = _filas_detalle(state)
+        repositorio.guardar_nueva_propuesta(_fila_propuesta(state), filas_detalle)
+        state.detalle_nube = _columnas_items(filas_detalle)
         return True, f"Propuesta {state.numero_propuesta} guardada con éxito."
     except Exception as e:
         return False, f"Error al guardar la nueva propuesta: {e}"
 
-def actualizar_propuesta_en_sheets(workbook, state):
+def actualizar_propuesta_en_sheets(repositorio, state):
     try:
-        propuestas_sheet = workbook.worksheet(PROPUESTAS_SHEET_NAME)
-        detalle_sheet = workbook.worksheet(DETALLE_PROPUESTAS_SHEET_NAME)
-        cell = propuestas_sheet.find(state.numero_propuesta)
-        if not cell:
+        # Sólo viajan las líneas que cambiaron desde el último guardado; si ninguna cambió,
+        # sólo la fila de la propuesta.
+        filas_detalle = _filas_detalle(state)
+        items = _columnas_items(filas_detalle)
+        detalle_anterior = None
+        if state.detalle_nube is not None:
+            detalle_anterior = [[state.numero_propuesta, *fila] for fila in state.detalle_nube]
+        cambios_detalle = None if items == state.detalle_nube else filas_detalle
+        if not repositorio.actualizar_propuesta(state.numero_propuesta, _fila_propuesta(state), cambios_detalle, detalle_anterior):
             return False, f"Error: No se encontró la propuesta {state.numero_propuesta} para actualizar."
-        propuesta_row_updated = [
-            state.numero_propuesta, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), state.vendedor,
-            state.cliente_actual.get(CLIENTE_NOMBRE_COL, ""), state.cliente_actual.get("NIF", ""),
-            state.status, float(state.subtotal_bruto), float(state.descuento_total),
-            float(state.total_general), float(state.costo_total), float(state.margen_absoluto),
-            float(state.margen_porcentual), state.observaciones, state.tienda_despacho
-        ]
-        propuestas_sheet.update(f'A{cell.row}:{chr(65 + len(propuesta_row_updated) - 1)}{cell.row}', [propuesta_row_updated], value_input_option='USER_ENTERED')
-        registros_detalle = detalle_sheet.get_all_records()
-        filas_a_borrar = [i + 2 for i, record in enumerate(registros_detalle) if record.get('numero_propuesta') == state.numero_propuesta]
-        if filas_a_borrar:
-            for row_num in sorted(filas_a_borrar, reverse=True):
-                detalle_sheet.delete_rows(row_num)
-        detalle_rows_nuevos = []
-        for item in state.cotizacion_items:
-            descuento_valor = (item.get('Cantidad', 0) * item.get('Precio Unitario', 0)) * (item.get('Descuento (%)', 0) / 100)
-            detalle_rows_nuevos.append([
-                state.numero_propuesta, item.get('Referencia', ''), item.get('Producto', ''),
-                int(item.get('Cantidad', 0)), float(item.get('Precio Unitario', 0)),
-                float(item.get('Costo', 0)), float(item.get('Descuento (%)', 0)),
-                float(item.get('Total', 0)), int(item.get('Stock', 0)), float(descuento_valor)
-            ])
-        if detalle_rows_nuevos:
-            detalle_sheet.append_rows(detalle_rows_nuevos, value_input_option='USER_ENTERED')
+        state.detalle_nube = items
         return True, f"Propuesta {state.numero_propuesta} actualizada con éxito."
     except Exception as e:
         return False, f"Error al actualizar la propuesta: {e}"
 
 # --- INICIO DE LA MODIFICACIÓN PARA CLIENTES NUEVOS ---
-def crear_nuevo_cliente(workbook, nombre, nif, email, telefono, direccion):
+def crear_nuevo_cliente(repositorio, nombre, nif, email, telefono, direccion):
     """
     Añade un nuevo cliente a la hoja "Clientes" y devuelve su información.
     
@@ -284,8 +704,6 @@ def crear_nuevo_cliente(workbook, nombre, nif, email, telefono, direccion):
         return False, "El Nombre y el NIF/C.C. son obligatorios.", None
 
     try:
-        clientes_sheet = workbook.worksheet(CLIENTES_SHEET_NAME)
-        
         # Estructura del nuevo cliente como un diccionario.
         # ¡Asegúrate de que los nombres de las claves coincidan con las cabeceras de tu G-Sheet!
         nuevo_cliente_dict = {
@@ -296,15 +714,10 @@ def crear_nuevo_cliente(workbook, nombre, nif, email, telefono, direccion):
             "Dirección": direccion
         }
         
-        # Obtiene las cabeceras de la hoja para asegurar el orden correcto al insertar.
-        headers = clientes_sheet.row_values(1)
-        # Crea la lista de valores en el orden correcto. Si una columna no existe, la omite.
-        nueva_fila_cliente = [nuevo_cliente_dict.get(h, "") for h in headers]
-        
-        clientes_sheet.append_row(nueva_fila_cliente, value_input_option='USER_ENTERED')
+        repositorio.crear_cliente(nuevo_cliente_dict)
         
-        # IMPORTANTE: Limpiar el caché de datos para que la app recargue la lista de clientes.
-        st.cache_data.clear()
+        # IMPORTANTE: Refrescar el snapshot para que la app recargue la lista de clientes.
+        refrescar_datos_maestros(repositorio)
         
         mensaje_exito = f"✅ ¡Éxito! Cliente '{nombre}' creado. Ya puedes seleccionarlo para cotizar."
         
@@ -317,26 +730,53 @@ def crear_nuevo_cliente(workbook, nombre, nif, email, telefono, direccion):
 # --- FIN DE LA MODIFICACIÓN ---
 
 
-class PDF(FPDF):
+# Fuentes TrueType del PDF (Unicode completo, sin transcodificar a latin-1). El
+# repositorio no trae variantes negrita ni cursiva: la negrita usa Anton y los textos
+# que iban en cursiva usan la regular. No hay cursiva registrada (fpdf2 incrusta todas
+# las fuentes registradas, se usen o no), así que los datos que se intercalan en textos
+# con `markdown=True` pasan por `_literal_markdown`. Se registran en este orden, que fija
+# su número dentro del documento.
+FUENTE_PDF = "Ferreinox"
+FUENTE_REGULAR_PATH = Path("DejaVuSans.ttf")
+FUENTE_TITULOS_PATH = Path("Anton-Regular.ttf")
+FUENTES_PDF = [
+    (FUENTE_PDF, '', FUENTE_REGULAR_PATH),
+    (FUENTE_PDF, 'B', FUENTE_TITULOS_PATH),
+]
+
+_MARCAS_MARKDOWN = re.compile(r'\*\*|__|~~|--')
+
+def _literal_markdown(valor):
+    """
+    `valor` escapado para intercalarlo en un texto con `markdown=True`: sus `**`, `__`,
+    `~~` y `--` se imprimen tal cual en vez de cambiar el estilo. Sin escapar, un cliente
+    llamado 'Ferretería __Los Pinos__' pediría la cursiva, que no está registrada.
+    """
+    texto = str(valor).replace('\\', '\\\\')
+    return _MARCAS_MARKDOWN.sub(lambda marca: '\\' + marca.group(), texto)
+
+class PDF(DocumentoConPlantilla):
     def __init__(self, document_title="PROPUESTA COMERCIAL", **kwargs):
-        super().__init__(**kwargs)
+        super().__init__(fuentes=FUENTES_PDF, **kwargs)
         self.set_margins(left=10, top=10, right=10)
         self.set_auto_page_break(True, margin=45)
         self.document_title = document_title
+        if LOGO_FILE_PATH.exists():
+            self.sembrar_imagen(LOGO_FILE_PATH, ancho_px_para_mm(ANCHO_LOGO_PDF_MM))
 
     def header(self):
         if LOGO_FILE_PATH.exists():
-            self.image(str(LOGO_FILE_PATH), x=10, y=8, w=80)
+            self.image(str(LOGO_FILE_PATH), x=10, y=8, w=ANCHO_LOGO_PDF_MM)
         self.set_y(18)
         self.set_x(-95)
-        self.set_font('Arial', 'B', 18)
+        self.set_font(FUENTE_PDF, 'B', 18)
         self.set_text_color(*COLOR_AZUL)
         self.cell(90, 10, self.document_title, 0, 1, 'R')
         self.set_y(42)
         self.line(10, self.get_y(), 200, self.get_y())
 
     def chapter_title(self, title):
-        self.set_font('Arial', 'B', 12)
+        self.set_font(FUENTE_PDF, 'B', 12)
         self.set_fill_color(*COLOR_AZUL)
         self.set_text_color(255)
         self.cell(0, 8, f" {title}", 0, 1, 'L', 1)
@@ -344,12 +784,19 @@ class PDF(FPDF):
         self.ln(4)
 
     def footer(self):
+        # Las direcciones de las tiendas se dibujan una vez y se reutilizan en cada página.
+        self.dibujar_fijo('pie', self._pie_tiendas)
+        self.set_y(-10)
+        self.set_font(FUENTE_PDF, '', 8)
+        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
+
+    def _pie_tiendas(self):
         self.set_y(-40)
-        self.set_font('Arial', 'B', 7)
+        self.set_font(FUENTE_PDF, 'B', 7)
         self.set_fill_color(240, 240, 240)
         self.cell(0, 5, '', 'T', 1, 'C')
         y_inicial_footer = self.get_y()
-        self.set_font('Arial', 'B', 8)
+        self.set_font(FUENTE_PDF, 'B', 8)
         self.cell(47, 5, 'PEREIRA', 0, 0, 'C', True)
         self.cell(1, 5, '', 0, 0, 'C')
         self.cell(47, 5, 'DOSQUEBRADAS', 0, 0, 'C', True)
@@ -358,7 +805,7 @@ class PDF(FPDF):
         self.cell(1, 5, '', 0, 0, 'C')
         self.cell(46, 5, 'MANIZALES', 0, 1, 'C', True)
         self.set_y(y_inicial_footer + 5)
-        self.set_font('Arial', '', 7)
+        self.set_font(FUENTE_PDF, '', 7)
         self.multi_cell(47, 3.5, 'CR 13 19-26 Parque Olaya\nP.B.X. (606) 333 0101 opcion 1\n310 830 5302', 0, 'C')
         self.set_y(y_inicial_footer + 5)
         self.set_x(58)
@@ -370,7 +817,7 @@ class PDF(FPDF):
         self.set_x(154)
         self.multi_cell(46, 3.5, 'CL 16 21-32 San Antonio\nPBX. (606) 333 0101 opcion 4\n313 608 6232', 0, 'C')
         self.set_y(y_inicial_footer + 17)
-        self.set_font('Arial', 'I', 6)
+        self.set_font(FUENTE_PDF, '', 6)
         self.cell(47, 5, 'tiendopintucopereira@ferreinox.co', 0, 0, 'C')
         self.cell(1, 5, '', 0, 0, 'C')
         self.cell(47, 5, 'tiendapintucodosquebradas@ferreinox.co', 0, 0, 'C')
@@ -378,11 +825,8 @@ class PDF(FPDF):
         self.cell(47, 5, 'tiendapintucoarmenio@ferreinox.co', 0, 0, 'C')
         self.cell(1, 5, '', 0, 0, 'C')
         self.cell(46, 5, 'tiendapintucomanizales@ferreinox.co', 0, 1, 'C')
-        self.set_y(-10)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
 
-def generar_pdf_profesional(state, workbook):
+def generar_pdf_profesional(state, repositorio):
     if state.status == 'Aceptada':
         documento_titulo = 'PEDIDO DE VENTA'
         numero_documento_label = "Pedido #:"
@@ -394,34 +838,28 @@ def generar_pdf_profesional(state, workbook):
     pdf.add_page()
     start_y_info = 47
     pdf.set_y(start_y_info)
-    pdf.set_font('Arial', 'B', 10)
+    pdf.set_font(FUENTE_PDF, 'B', 10)
     pdf.set_fill_color(240, 240, 240)
     pdf.set_text_color(0)
     pdf.cell(95, 7, f"DATOS DEL {documento_titulo.split(' ')[0]}", border=1, ln=0, align='C', fill=True)
     pdf.set_x(105)
     pdf.cell(95, 7, "CLIENTE", border=1, ln=1, align='C', fill=True)
     y_after_headers = pdf.get_y()
-    pdf.set_font('Arial', '', 9)
-    prop_content = (f"**{numero_documento_label}** {state.numero_propuesta}\n"
+    pdf.set_font(FUENTE_PDF, '', 9)
+    prop_content = (f"**{numero_documento_label}** {_literal_markdown(state.numero_propuesta)}\n"
                     f"**Fecha de Emisión:** {datetime.now().strftime('%d/%m/%Y')}\n"
                     f"**Validez de la Oferta:** 15 días\n"
-                    f"**Asesor Comercial:** {state.vendedor}")
+                    f"**Asesor Comercial:** {_literal_markdown(state.vendedor)}")
     pdf.multi_cell(95, 5, prop_content, border='LR', markdown=True)
     y_prop = pdf.get_y()
     pdf.set_y(y_after_headers)
     pdf.set_x(105)
     
-    # --- INICIO: CORRECCIÓN DEL ERROR DE CODIFICACIÓN ---
-    nombre_saneado = str(state.cliente_actual.get(CLIENTE_NOMBRE_COL, 'N/A')).encode('latin-1', 'replace').decode('latin-1')
-    nif_saneado = str(state.cliente_actual.get('NIF', 'N/A')).encode('latin-1', 'replace').decode('latin-1')
-    direccion_saneada = str(state.cliente_actual.get('Dirección', 'N/A')).encode('latin-1', 'replace').decode('latin-1')
-    telefono_saneado = str(state.cliente_actual.get('Teléfono', 'N/A')).encode('latin-1', 'replace').decode('latin-1')
-
-    client_content = (f"**Nombre:** {nombre_saneado}\n"
-                      f"**NIF/C.C.:** {nif_saneado}\n"
-                      f"**Dirección:** {direccion_saneada}\n"
-                      f"**Teléfono:** {telefono_saneado}")
-    # --- FIN: CORRECCIÓN DEL ERROR DE CODIFICACIÓN ---
+    # Las fuentes TrueType escriben UTF-8 directamente: sólo se escapan las marcas de markdown.
+    client_content = (f"**Nombre:** {_literal_markdown(state.cliente_actual.get(CLIENTE_NOMBRE_COL, 'N/A'))}\n"
+                      f"**NIF/C.C.:** {_literal_markdown(state.cliente_actual.get('NIF', 'N/A'))}\n"
+                      f"**Dirección:** {_literal_markdown(state.cliente_actual.get('Dirección', 'N/A'))}\n"
+                      f"**Teléfono:** {_literal_markdown(state.cliente_actual.get('Teléfono', 'N/A'))}")
 
     pdf.multi_cell(95, 5, client_content, border='LR', markdown=True)
     y_cli = pdf.get_y()
@@ -431,11 +869,11 @@ def generar_pdf_profesional(state, workbook):
     pdf.line(10, max_y, 105, max_y)
     pdf.line(105, max_y, 200, max_y)
     pdf.set_y(max_y + 5)
-    pdf.set_font('Arial', '', 10)
+    pdf.set_font(FUENTE_PDF, '', 10)
     
-    nombre_cliente = str(state.cliente_actual.get(CLIENTE_NOMBRE_COL, 'Cliente')).encode('latin-1', 'replace').decode('latin-1')
+    nombre_cliente = state.cliente_actual.get(CLIENTE_NOMBRE_COL, 'Cliente')
     
-    mensaje_motivacional = (f"**Apreciado/a {nombre_cliente},**\n"
+    mensaje_motivacional = (f"**Apreciado/a {_literal_markdown(nombre_cliente)},**\n"
                             "Nos complace presentarle esta propuesta comercial diseñada a su medida. En Ferreinox, nuestro compromiso es su satisfacción, "
                             "ofreciendo soluciones de la más alta calidad y servicio.")
     pdf.multi_cell(0, 5, mensaje_motivacional, 0, 'J', markdown=True)
@@ -443,26 +881,23 @@ def generar_pdf_profesional(state, workbook):
     pdf.chapter_title('Detalle de la Cotización')
     pdf.set_fill_color(*COLOR_AZUL)
     pdf.set_text_color(255)
-    pdf.set_font('Arial', 'B', 10)
+    pdf.set_font(FUENTE_PDF, 'B', 10)
     column_widths = [20, 85, 15, 25, 20, 25]
     columns = ['Ref.', 'Producto', 'Cant.', 'Precio U.', 'Desc. (%)', 'Total']
     for i, col in enumerate(columns):
         pdf.cell(column_widths[i], 8, col, 1, 0, 'C', 1)
     pdf.ln()
     pdf.set_text_color(0)
-    pdf.set_font('Arial', '', 9)
-    for item in state.cotizacion_items:
+    pdf.set_font(FUENTE_PDF, '', 9)
+    items = state.cotizacion_items
+    for item in items:
         # --- INICIO DEL CAMBIO: Lógica de resaltado mejorada ---
         # Se resalta en rojo si la cantidad solicitada es MAYOR que el stock disponible.
         if item.get('Cantidad', 0) > item.get('Stock', 0):
             pdf.set_text_color(255, 0, 0)
         # --- FIN DEL CAMBIO ---
-        try:
-            ref = str(item.get('Referencia', '')).encode('latin-1', 'replace').decode('latin-1')
-            prod = str(item.get('Producto', '')).encode('latin-1', 'replace').decode('latin-1')
-        except:
-            ref = str(item.get('Referencia', ''))
-            prod = str(item.get('Producto', ''))
+        ref = str(item.get('Referencia', ''))
+        prod = str(item.get('Producto', ''))
         pdf.cell(column_widths[0], 7, ref, 1, 0, 'L')
         pdf.cell(column_widths[1], 7, prod, 1, 0, 'L')
         pdf.cell(column_widths[2], 7, str(item.get('Cantidad', 0)), 1, 0, 'C')
@@ -481,7 +916,7 @@ def generar_pdf_profesional(state, workbook):
         y_final_tabla += 5
     pdf.set_y(y_final_tabla)
     pdf.set_x(120)
-    pdf.set_font('Arial', 'B', 10)
+    pdf.set_font(FUENTE_PDF, 'B', 10)
     base_gravable = state.subtotal_bruto - state.descuento_total
     pdf.cell(40, 7, 'Subtotal:', 0, 0, 'R')
     pdf.cell(40, 7, f'${state.subtotal_bruto:,.2f}', 0, 1, 'R')
@@ -498,7 +933,7 @@ def generar_pdf_profesional(state, workbook):
     pdf.line(120, pdf.get_y(), 200, pdf.get_y())
     pdf.ln(1)
     pdf.set_x(120)
-    pdf.set_font('Arial', 'B', 12)
+    pdf.set_font(FUENTE_PDF, 'B', 12)
     pdf.cell(40, 8, 'TOTAL:', 0, 0, 'R')
     pdf.cell(40, 8, f'${state.total_general:,.2f}', 0, 1, 'R')
     y_despues_totales = pdf.get_y()
@@ -506,23 +941,21 @@ def generar_pdf_profesional(state, workbook):
 
     # --- INICIO DEL CAMBIO: Lógica de advertencia de inventario mejorada y detallada ---
     items_con_faltante = []
-    for item in state.cotizacion_items:
+    for item in items:
         cantidad_solicitada = item.get('Cantidad', 0)
         stock_disponible = item.get('Stock', 0)
         if cantidad_solicitada > stock_disponible:
             faltante = cantidad_solicitada - stock_disponible
-            # Aseguramos la codificación correcta del nombre del producto
-            nombre_producto_saneado = str(item.get('Producto', 'N/A')).encode('latin-1', 'replace').decode('latin-1')
-            items_con_faltante.append({'nombre': nombre_producto_saneado, 'faltante': faltante})
+            items_con_faltante.append({'nombre': item.get('Producto', 'N/A'), 'faltante': faltante})
 
     if items_con_faltante:
         pdf.set_y(y_final_tabla)
         pdf.set_x(10)
-        pdf.set_font('Arial', 'B', 10)
+        pdf.set_font(FUENTE_PDF, 'B', 10)
         pdf.set_text_color(*COLOR_AZUL)
         pdf.cell(100, 7, "ADVERTENCIA DE INVENTARIO", 0, 1, 'L')
         pdf.set_text_color(0)
-        pdf.set_font('Arial', 'I', 8)
+        pdf.set_font(FUENTE_PDF, '', 8)
         pdf.set_text_color(194, 8, 8)
         
         # Mensaje general
@@ -533,7 +966,7 @@ def generar_pdf_profesional(state, workbook):
         detalle_faltantes = "**Detalle de Faltantes:**\n"
         for item_faltante in items_con_faltante:
             # Usamos un guión para simular una lista, ya que el markdown de FPDF es limitado
-            detalle_faltantes += f"- Para **{item_faltante['nombre']}**, es necesario solicitar **{item_faltante['faltante']}** unidad(es) adicional(es).\n"
+            detalle_faltantes += f"- Para **{_literal_markdown(item_faltante['nombre'])}**, es necesario solicitar **{item_faltante['faltante']}** unidad(es) adicional(es).\n"
         
         mensaje_completo = mensaje_general + detalle_faltantes
         
@@ -545,10 +978,10 @@ def generar_pdf_profesional(state, workbook):
     pdf.set_y(max(y_despues_totales, y_advertencia) + 10)
     if state.observaciones:
         pdf.chapter_title('Observaciones Adicionales')
-        pdf.set_font('Arial', '', 9)
-        pdf.multi_cell(0, 5, state.observaciones, border=1)
+        pdf.set_font(FUENTE_PDF, '', 9)
+        pdf.multi_cell(0, 5, str(state.observaciones), border=1)
         pdf.ln(5)
-    pdf.set_font('Arial', '', 9)
+    pdf.set_font(FUENTE_PDF, '', 9)
     pdf.multi_cell(0, 5, '**Garantía:** Productos cubiertos por garantía de fábrica. No cubre mal uso.', border=1, markdown=True)
     try:
         buffer = BytesIO()
@@ -558,6 +991,65 @@ def generar_pdf_profesional(state, workbook):
         st.error(f"Error crítico al generar el PDF: {e}")
         return None
 
+def nombre_archivo_pdf(state):
+    """Nombre del PDF de la cotización: `Pedido_` si está aceptada, `Propuesta_` si no."""
+    prefijo = "Pedido" if state.status == "Aceptada" else "Propuesta"
+    return f"{prefijo}_{state.numero_propuesta.replace('TEMP-', 'BORRADOR-')}.pdf"
+
+# --- CACHÉ DE PDF POR CONTENIDO ---
+@st.cache_resource
+def obtener_cache_pdf():
+    """PDFs generados, compartidos por todas las sesiones e indexados por `huella_pdf`."""
+    return CachePDF()
+
+def huella_pdf(state):
+    """
+    Huella de todo lo que imprime `generar_pdf_profesional`: encabezado, cliente, ítems,
+    totales, estado y observaciones. Incluye la fecha de emisión, que cambia cada día.
+    """
+    return huella_contenido({
+        'numero_propuesta': state.numero_propuesta,
+        'fecha': datetime.now().strftime('%d/%m/%Y'),
+        'vendedor': state.vendedor,
+        'status': state.status,
+        'cliente': {col: state.cliente_actual.get(col) for col in (CLIENTE_NOMBRE_COL, 'NIF', 'Dirección', 'Teléfono')},
+        'items': [
+            [item.get(col) for col in ('Referencia', 'Producto', 'Cantidad', 'Precio Unitario', 'Descuento (%)', 'Total', 'Stock')]
+            for item in state.cotizacion_items
+        ],
+        'totales': [state.subtotal_bruto, state.descuento_total, state.iva_valor, state.total_general],
+        'observaciones': state.observaciones,
+    })
+
+def pdf_bajo_demanda(state, repositorio):
+    """
+    Devuelve una función sin argumentos que entrega el PDF de la cotización tal como
+    está ahora: lo toma de la caché o lo genera la primera vez que se pide. Así el
+    documento sólo se construye cuando una acción (descarga, correo, WhatsApp) lo usa.
+    La huella y la caché se resuelven aquí, así que la función puede llamarse desde el
+    hilo en que `st.download_button` evalúa sus datos.
+    """
+    cache = obtener_cache_pdf()
+    huella = huella_pdf(state)
+    return lambda: cache.obtener_o_generar(huella, lambda: generar_pdf_profesional(state, repositorio))
+
+def pdf_fallido(state):
+    """True si el PDF de la cotización, tal como está ahora, ya se intentó generar y falló."""
+    return obtener_cache_pdf().generacion_fallida(huella_pdf(state))
+
+def datos_descarga_pdf(obtener_pdf):
+    """
+    `data` diferido para `st.download_button`. Si el PDF no se puede generar lanza un
+    error, y Streamlit avisa que no se pudo generar el archivo en lugar de descargar un
+    PDF vacío; en la siguiente ejecución la página lo ve con `pdf_fallido`.
+    """
+    def datos():
+        documento = obtener_pdf()
+        if documento is None:
+            raise RuntimeError("No se pudo generar el PDF.")
+        return documento
+    return datos
+
 def enviar_email_seguro(destinatario, state, pdf_bytes, nombre_archivo, is_copy=False):
     try:
         email_emisor = st.secrets["email_credentials"]["smtp_user"]
@@ -588,10 +1080,12 @@ def enviar_email_seguro(destinatario, state, pdf_bytes, nombre_archivo, is_copy=
     except Exception as e:
         return False, f"Error al enviar el correo: {e}"
 
-def guardar_pdf_en_drive(workbook, pdf_bytes, nombre_archivo):
+def guardar_pdf_en_drive(repositorio, pdf_bytes, nombre_archivo):
     try:
         shared_drive_id = st.secrets["gsheets"]["drive_folder_id"] 
-        creds = workbook.creds
+        creds = getattr(repositorio, 'creds', None)
+        if creds is None:
+            return False, "El almacenamiento configurado no tiene acceso a Google Drive."
         service = build('drive', 'v3', credentials=creds)
         query = f"name='{nombre_archivo}' and '{shared_drive_id}' in parents and trashed=false"
         response = service.files().list(